@@ -20,6 +20,7 @@ from   gcc_test_base import GCCTestBase
 from   gpp_test_base import GPPTestBase
 import os
 import re
+from   source_analysis import analyze_source
 
 ########################################################################
 # Classes
@@ -28,19 +29,14 @@ import re
 class CompatTest(DejaGNUTest):
     """A 'CompatTest' emulates the 'compat.exp' test driver."""
 
-    __options_regexp \
-          = re.compile(r"{[ \t]*dg-options[ \t]+(.*)[ \t]+}")
-    """A regular expression that matches an options directive in the test.
-
-    If this regular expression matches the main test-case file, then
-    the first match group gives special options that should be used to
-    run the test-case."""
-    
     dejagnu_file_prefix = None
     """The prefix a real DejaGNU test uses for its filenames."""
 
     def Run(self, context, result):
 
+        if self._IsUnchanged(context, result):
+            return
+
         self._SetUp(context)
 
         # Figure out whether or not there is an alternate compiler.
@@ -50,9 +46,9 @@ class CompatTest(DejaGNUTest):
         
         # Get the dg-options string out of the test.
         src1 = self._GetSourcePath()
-        match = self.__options_regexp.search(open(src1).read())
-        if match:
-            extra_options = self._ParseTclWords(match.group(1))[0].split()
+        dg_options = analyze_source(src1).GetArguments("options")
+        if dg_options is not None:
+            extra_options = self._ParseTclWords(dg_options)[0].split()
         else:
             extra_options = []
 
@@ -110,12 +106,14 @@ class CompatTest(DejaGNUTest):
                 self.__GenerateObject(result, context, src3, obj3_alt,
                                       alt_options, optstr, alt = 1)
 
-            self.__GenerateObject(result, context, src1, obj1,
-                                  tst_options, optstr)
-            self.__GenerateObject(result, context, src2, obj2_tst,
-                                  tst_options, optstr)
-            self.__GenerateObject(result, context, src3, obj3_tst,
-                                  tst_options, optstr)
+            # The objects are independent of one another, so they may
+            # be compiled concurrently.
+            objects = [(src1, obj1, tst_options, optstr),
+                       (src2, obj2_tst, tst_options, optstr),
+                       (src3, obj3_tst, tst_options, optstr)]
+            self._RunVariants(context, result,
+                              CompatTest.__GenerateObjectVariant,
+                              objects, isolate = 0)
 
             self.__Run(result, context, obj2_tst + "-" + obj3_tst,
                        [obj1, obj2_tst, obj3_tst],
@@ -139,6 +137,9 @@ class CompatTest(DejaGNUTest):
                 except:
                     pass
 
+        self._RecordStatistics(result)
+        self._RecordFingerprint(context, result)
+
 
     def __GenerateObject(self, result, context, source, dest,
                          options, optstr, alt = 0):
@@ -166,6 +167,21 @@ class CompatTest(DejaGNUTest):
                                          dest, "object", options))
 
 
+    def __GenerateObjectVariant(self, context, result, variant):
+        """Generate one object file, as a variant of the test.
+
+        'context' -- The QMTest 'context'.
+
+        'result' -- The QMTest 'Result'.
+
+        'variant' -- A tuple '(source, dest, options, optstr)' giving
+        the arguments to '__GenerateObject'."""
+
+        source, dest, options, optstr = variant
+        self.__GenerateObject(result, context, source, dest,
+                              options, optstr)
+
+
     def __Run(self, result, context, testname, objlist, dest, options,
               optstr):
         """Emulate 'compat-run'.
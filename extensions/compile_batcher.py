@@ -0,0 +1,532 @@
+########################################################################
+#
+# File:   compile_batcher.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   CompileBatcher
+#   get_batcher
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+########################################################################
+# Variables
+########################################################################
+
+_batchers = {}
+"""A map from batch sizes to 'CompileBatcher' instances."""
+
+_batchers_lock = threading.Lock()
+"""The lock protecting '_batchers'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class _Batch(object):
+    """A '_Batch' is a group of compilations run by one command."""
+
+    def __init__(self):
+        """Construct a new '_Batch'."""
+
+        # The requests in the batch.  Each request is a pair
+        # '(source, output_file)'.
+        self.requests = []
+        # The names of the output files produced by the compiler, used
+        # to make sure that no two requests produce the same file.
+        self.names = {}
+        # The results of the requests, once the batch has been run.
+        # Each result is a pair '(status, output)', or 'None' if the
+        # request must be run by itself.
+        self.results = None
+
+
+
+class CompileBatcher(object):
+    """A 'CompileBatcher' compiles several source files at once.
+
+    Many tests do no more than compile a single source file, and
+    starting the compiler driver accounts for much of the time taken.
+    When several tests running at once compile different files with
+    exactly the same command, a 'CompileBatcher' instead runs a single
+    command, such as 'gcc -S a.c b.c c.c', that compiles all of the
+    files.  The output of the compiler is split back into the output
+    for each file using the 'file:' prefix on each diagnostic.
+
+    A batch is used only if the outcome for each file is certain to be
+    the same as if the file had been compiled by itself: the command
+    must succeed, every line of output must be attributable to one of
+    the files, and the compiler must produce exactly the expected
+    output files.  Otherwise, each file is compiled again by itself.
+
+    The first request with a particular command waits briefly for
+    other requests with the same command.  Therefore, batching helps
+    only when many tests are run at once, in separate threads.  The
+    request stops waiting as soon as no other request is being
+    compiled, so that a run with a single thread is not delayed."""
+
+    _delay = 0.05
+    """The maximum number of seconds to wait for requests to join a
+    batch."""
+
+    def __init__(self, size):
+        """Construct a new 'CompileBatcher'.
+
+        'size' -- The maximum number of files compiled by one
+        command."""
+
+        self.__size = size
+        # A map from keys, as computed by '__GetKey', to the '_Batch'
+        # that requests with that key may join.
+        self.__pending = {}
+        # The number of calls to 'Execute' in progress.
+        self.__active = 0
+        # The number of those calls waiting for other requests, either
+        # to join a batch or to finish running a batch.
+        self.__idle = 0
+        self.__condition = threading.Condition()
+
+
+    def Execute(self, directory, command, source, output_file, suffix,
+                run):
+        """Run 'command', possibly as part of a batch.
+
+        'directory' -- The directory in which to run the command.
+
+        'command' -- The command, as a list of strings.  It compiles
+        the single 'source' to the 'output_file'.  The command must
+        not depend on 'directory' except through the 'output_file'.
+
+        'source' -- The absolute path to the source file compiled.
+
+        'output_file' -- The output file, given to the compiler with
+        '-o'.  If it is a relative path, it is relative to
+        'directory'.
+
+        'suffix' -- The suffix that the compiler uses for the output
+        file when no '-o' option is given, such as '.s' or '.o'.
+
+        'run' -- A callable taking a directory and a command, and
+        returning a pair '(status, output)', as for
+        'CompileServer.Execute'.
+
+        returns -- A pair '(status, output)' giving the same values as
+        'run(directory, command)'."""
+
+        self.__condition.acquire()
+        try:
+            self.__active += 1
+        finally:
+            self.__condition.release()
+        try:
+            return self.__Execute(directory, command, source, output_file,
+                                  suffix, run)
+        finally:
+            self.__condition.acquire()
+            try:
+                self.__active -= 1
+                self.__NotifyIfIdle()
+            finally:
+                self.__condition.release()
+
+
+    def __Execute(self, directory, command, source, output_file, suffix,
+                  run):
+        """Run 'command', possibly as part of a batch.
+
+        The parameters and return value are as for 'Execute'."""
+
+        key = self.__GetKey(command, source, output_file)
+        if key is None or not os.path.isabs(source):
+            return run(directory, command)
+        name = os.path.splitext(os.path.basename(source))[0] + suffix
+        # The batch may be run in the directory of another request, so
+        # the output file must not depend on 'directory'.
+        output_file = os.path.join(directory, output_file)
+
+        self.__condition.acquire()
+        try:
+            batch = self.__pending.get(key)
+            if batch is not None and batch.names.has_key(name):
+                # The files would overwrite each other.
+                batch = None
+                index = -1
+            elif batch is not None:
+                # Join the pending batch, and wait for its results.
+                index = len(batch.requests)
+                batch.requests.append((source, output_file))
+                batch.names[name] = None
+                if len(batch.requests) >= self.__size:
+                    del self.__pending[key]
+                    self.__condition.notifyAll()
+                while batch.results is None:
+                    self.__Wait()
+            else:
+                # Start a new batch, and wait for others to join it.
+                index = 0
+                batch = _Batch()
+                batch.requests.append((source, output_file))
+                batch.names[name] = None
+                self.__pending[key] = batch
+                deadline = time.time() + self._delay
+                while self.__pending.get(key) is batch:
+                    remaining = deadline - time.time()
+                    if (remaining <= 0
+                        or self.__active == self.__idle + 1):
+                        # Stop waiting if the time is up, or if no
+                        # other request is being compiled.
+                        del self.__pending[key]
+                        break
+                    self.__Wait(remaining)
+        finally:
+            self.__condition.release()
+
+        if index == 0:
+            # This request started the batch, so it runs the batch.
+            results = [None] * len(batch.requests)
+            try:
+                if len(batch.requests) > 1:
+                    results = self.__RunBatch(directory, key,
+                                              batch.requests, suffix, run)
+            finally:
+                self.__condition.acquire()
+                try:
+                    batch.results = results
+                    self.__condition.notifyAll()
+                finally:
+                    self.__condition.release()
+
+        if index >= 0 and batch.results[index] is not None:
+            return batch.results[index]
+        return run(directory, command)
+
+
+    def __Wait(self, timeout = None):
+        """Wait for another request.
+
+        'timeout' -- The maximum number of seconds to wait, or 'None'
+        to wait until notified.
+
+        The caller must hold the condition."""
+
+        self.__idle += 1
+        try:
+            self.__NotifyIfIdle()
+            self.__condition.wait(timeout)
+        finally:
+            self.__idle -= 1
+
+
+    def __NotifyIfIdle(self):
+        """Wake the waiting requests if none are being compiled.
+
+        When every call to 'Execute' in progress is waiting, a request
+        that started a batch must stop waiting for others to join it.
+        The caller must hold the condition."""
+
+        if self.__active and self.__active == self.__idle:
+            self.__condition.notifyAll()
+
+
+    def __GetKey(self, command, source, output_file):
+        """Return the key identifying 'command'.
+
+        'command' -- The command, as a list of strings.
+
+        'source' -- The source file compiled by 'command'.
+
+        'output_file' -- The output file given with '-o'.
+
+        returns -- A pair '(base, position)', where 'base' is a tuple
+        giving the 'command' without the 'source' and the '-o' option,
+        and 'position' is the index in 'base' at which the source
+        files should be inserted.  Requests with the same key can be
+        run as a batch.  Returns 'None' if the 'command' does not have
+        the expected form."""
+
+        if command.count(source) != 1:
+            return None
+        base = list(command)
+        position = base.index(source)
+        del base[position]
+        for i in xrange(len(base) - 1):
+            if base[i] == "-o" and base[i + 1] == output_file:
+                del base[i:i + 2]
+                if i < position:
+                    position -= 2
+                return (tuple(base), position)
+        return None
+
+
+    def __RunBatch(self, directory, key, requests, suffix, run):
+        """Compile the files in a batch.
+
+        'directory' -- A directory in which a temporary directory may
+        be created.
+
+        'key' -- The key shared by the 'requests'.
+
+        'requests' -- A list of pairs '(source, output_file)'.  Each
+        'output_file' is an absolute path.
+
+        'suffix' -- The suffix of the output files.
+
+        'run' -- A callable that runs a command, as for 'Execute'.
+
+        returns -- A list containing a result for each request.  Each
+        result is a pair '(status, output)', or 'None' if the request
+        must be run by itself."""
+
+        base, position = key
+        sources = [source for source, output_file in requests]
+        names = [os.path.splitext(os.path.basename(source))[0] + suffix
+                 for source in sources]
+        failure = [None] * len(requests)
+
+        scratch = tempfile.mkdtemp(dir = directory)
+        try:
+            command = list(base[:position]) + sources + list(base[position:])
+            status, output = run(scratch, command)
+            if status != 0:
+                return failure
+            outputs = self.__SplitOutput(output, sources)
+            if outputs is None:
+                return failure
+            # If the compiler wrote any other files, such as dumps,
+            # they would be lost, so the batch cannot be used.
+            created = os.listdir(scratch)
+            created.sort()
+            expected = names[:]
+            expected.sort()
+            if created != expected:
+                return failure
+            for (source, output_file), name in zip(requests, names):
+                shutil.move(os.path.join(scratch, name), output_file)
+            return [(status, o) for o in outputs]
+        finally:
+            shutil.rmtree(scratch, 1)
+
+
+    def __SplitOutput(self, output, sources):
+        """Divide the compiler 'output' among the 'sources'.
+
+        'output' -- The output from compiling all of the 'sources'.
+
+        'sources' -- The paths to the source files, as given to the
+        compiler.
+
+        returns -- A list of strings giving the output for each of the
+        'sources', or 'None' if some line of output does not begin with
+        the name of one of the 'sources'."""
+
+        outputs = [[] for source in sources]
+        prefixes = [source + ":" for source in sources]
+        for line in output.splitlines(1):
+            for i in xrange(len(prefixes)):
+                if line.startswith(prefixes[i]):
+                    outputs[i].append(line)
+                    break
+            else:
+                return None
+        return ["".join(o) for o in outputs]
+
+########################################################################
+# Functions
+########################################################################
+
+def get_batcher(size):
+    """Return a 'CompileBatcher' with the indicated batch 'size'.
+
+    'size' -- The maximum number of files compiled by one command.
+
+    returns -- A 'CompileBatcher'.  The batcher is created the first
+    time this function is called with a particular 'size', and shared
+    by all later callers."""
+
+    _batchers_lock.acquire()
+    try:
+        batcher = _batchers.get(size)
+        if batcher is None:
+            batcher = CompileBatcher(size)
+            _batchers[size] = batcher
+        return batcher
+    finally:
+        _batchers_lock.release()
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import unittest
+
+class _CompileBatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def runCompiler(self, directory, command):
+        """Pretend to compile the '.c' files in 'command'."""
+
+        self.lock.acquire()
+        try:
+            self.calls.append((directory, command))
+        finally:
+            self.lock.release()
+        sources = [c for c in command if c.endswith(".c")]
+        if "-o" in command:
+            outputs = [command[command.index("-o") + 1]]
+        else:
+            outputs = [os.path.splitext(os.path.basename(c))[0] + ".s"
+                       for c in sources]
+        output = ""
+        for source, o in zip(sources, outputs):
+            open(os.path.join(directory, o), "w").write(source)
+            if source.find("warn") != -1:
+                output += "%s:1: warning: %s\n" % (source, source)
+            if source.find("junk") != -1:
+                output += "junk\n"
+        return 0, output
+
+    def makeTest(self, name):
+        """Return the directory, command, and source for test 'name'."""
+
+        directory = os.path.join(self.directory, name)
+        os.mkdir(directory)
+        source = os.path.join(self.directory, name + ".c")
+        open(source, "w").close()
+        return directory, ["gcc", "-S", source, "-o", name + ".s"], source
+
+    def execute(self, batcher, name, results):
+        directory, command, source = self.makeTest(name)
+        results[name] = batcher.Execute(directory, command, source,
+                                        name + ".s", ".s", self.runCompiler)
+
+    def startBusy(self, batcher):
+        """Start a request that is compiled until 'self.done' is set.
+
+        returns -- The thread running the request."""
+
+        started = threading.Event()
+        self.done = threading.Event()
+        def run(directory, command):
+            started.set()
+            self.done.wait()
+            return 0, ""
+        # The command cannot be batched.
+        thread = threading.Thread(target = batcher.Execute,
+                                  args = (self.directory, ["gcc", "-v"],
+                                          "x.c", "x.s", ".s", run))
+        thread.start()
+        started.wait()
+        return thread
+
+    def executeAll(self, batcher, names):
+        results = {}
+        threads = [threading.Thread(target = self.execute,
+                                    args = (batcher, n, results))
+                   for n in names]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def executeBusy(self, batcher, names):
+        """Execute 'names' while another request is being compiled."""
+
+        thread = self.startBusy(batcher)
+        try:
+            return self.executeAll(batcher, names)
+        finally:
+            self.done.set()
+            thread.join()
+
+    def testJoin(self):
+        batcher = CompileBatcher(2)
+        batcher._delay = 10
+        results = self.executeBusy(batcher, ["a", "warn"])
+        self.failUnlessEqual(len(self.calls), 1)
+        self.failUnlessEqual(results["a"], (0, ""))
+        warn = os.path.join(self.directory, "warn.c")
+        self.failUnlessEqual(results["warn"],
+                             (0, "%s:1: warning: %s\n" % (warn, warn)))
+        # Each output file is placed in the directory of its own
+        # request, not in that of the request that ran the batch.
+        for name in ("a", "warn"):
+            f = open(os.path.join(self.directory, name, name + ".s"))
+            self.failUnlessEqual(f.read(),
+                                 os.path.join(self.directory, name + ".c"))
+            f.close()
+
+    def testTimeout(self):
+        batcher = CompileBatcher(2)
+        batcher._delay = 0.01
+        results = self.executeBusy(batcher, ["a"])
+        self.failUnlessEqual(results["a"], (0, ""))
+        directory, command = self.calls[0]
+        self.failUnlessEqual(self.calls, [(directory, command)])
+        self.failUnlessEqual(directory, os.path.join(self.directory, "a"))
+        self.failUnless("-o" in command)
+
+    def testAlone(self):
+        batcher = CompileBatcher(2)
+        batcher._delay = 10
+        start = time.time()
+        results = {}
+        self.execute(batcher, "a", results)
+        # No other request is being compiled, so there is no wait.
+        self.failUnless(time.time() - start < 5)
+        self.failUnlessEqual(results["a"], (0, ""))
+        self.failUnlessEqual(len(self.calls), 1)
+
+    def testFinished(self):
+        batcher = CompileBatcher(2)
+        batcher._delay = 10
+        thread = self.startBusy(batcher)
+        start = time.time()
+        results = {}
+        a = threading.Thread(target = self.execute,
+                             args = (batcher, "a", results))
+        a.start()
+        # The request stops waiting once the other request finishes.
+        self.done.set()
+        thread.join()
+        a.join()
+        self.failUnless(time.time() - start < 5)
+        self.failUnlessEqual(results["a"], (0, ""))
+
+    def testFallback(self):
+        batcher = CompileBatcher(2)
+        batcher._delay = 10
+        results = self.executeBusy(batcher, ["a", "junk"])
+        # The batch produced output that cannot be attributed, so each
+        # file is compiled again by itself.
+        self.failUnlessEqual(len(self.calls), 3)
+        self.failUnlessEqual(results["a"], (0, ""))
+        self.failUnlessEqual(results["junk"], (0, "junk\n"))
+        for name in ("a", "junk"):
+            self.failUnless(os.path.exists(os.path.join(self.directory,
+                                                        name, name + ".s")))
+
+unittest.makeSuite(_CompileBatcherTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
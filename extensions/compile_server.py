@@ -0,0 +1,455 @@
+########################################################################
+#
+# File:   compile_server.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   CompileServer
+#   get_server
+#   close_descriptors
+#   spawn
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import atexit
+import cPickle
+import os
+import signal
+import struct
+import sys
+import threading
+
+########################################################################
+# Variables
+########################################################################
+
+_servers = {}
+"""A map from numbers of workers to 'CompileServer' instances."""
+
+_servers_lock = threading.Lock()
+"""The lock protecting '_servers'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class CompileServer(object):
+    """A 'CompileServer' runs commands using a pool of worker processes.
+
+    Starting a compiler from the QMTest process is expensive: the
+    process is large, and has many threads and open files, so 'fork'
+    must copy a great deal of state, and the environment must be
+    copied for every command.  A 'CompileServer' instead starts a few
+    small Python processes at the outset.  Each worker waits for a
+    command on a pipe, runs it with its standard output and standard
+    error redirected to a pipe, and sends the exit status and output
+    back.
+
+    A 'CompileServer' may be used from several threads at once; each
+    command is sent to an idle worker, waiting for one if necessary.
+    A worker that fails is replaced, unless the server has been
+    closed."""
+
+    def __init__(self, workers):
+        """Construct a new 'CompileServer'.
+
+        'workers' -- The number of worker processes to start."""
+
+        self.__idle = []
+        self.__workers = []
+        # True once 'Close' has been called.
+        self.__closed = 0
+        self.__condition = threading.Condition()
+        for i in xrange(workers):
+            worker = self.__StartWorker()
+            self.__workers.append(worker)
+            self.__idle.append(worker)
+
+
+    def Execute(self, directory, command):
+        """Run 'command' in 'directory'.
+
+        'directory' -- The directory in which to run the command.
+
+        'command' -- The command, as a list of strings.  The first
+        element is the program to run; the 'PATH' is searched for it.
+
+        returns -- A pair '(status, output)'.  The 'status' is the exit
+        status of the command, as returned by 'os.waitpid'.  The
+        'output' is the standard output and standard error of the
+        command, combined.  These are the same values that
+        'Compiler.ExecuteCommand' returns.  Raises 'OSError' if the
+        command could not be run, or if the server has been closed."""
+
+        self.__condition.acquire()
+        try:
+            while not self.__idle and not self.__closed:
+                self.__condition.wait()
+            if self.__closed:
+                raise OSError, "compile server closed"
+            worker = self.__idle.pop()
+        finally:
+            self.__condition.release()
+
+        try:
+            try:
+                _send(worker[1], (directory, command))
+                response = _receive(worker[2])
+                if response is None:
+                    raise OSError, "compile server worker exited"
+            except OSError:
+                # The worker is no longer usable; replace it.
+                worker = self.__ReplaceWorker(worker)
+                raise
+        finally:
+            self.__condition.acquire()
+            try:
+                # If the server was closed while the command was
+                # running, 'Close' has already stopped the worker.
+                if worker is not None and not self.__closed:
+                    self.__idle.append(worker)
+                    self.__condition.notify()
+            finally:
+                self.__condition.release()
+
+        status, output, error = response
+        if error is not None:
+            raise OSError, error
+        return status, output
+
+
+    def Close(self):
+        """Stop all of the worker processes."""
+
+        self.__condition.acquire()
+        try:
+            self.__closed = 1
+            for worker in self.__workers:
+                self.__StopWorker(worker)
+            self.__workers = []
+            self.__idle = []
+            # Wake the threads waiting for a worker, so that they can
+            # report that the server is closed.
+            self.__condition.notifyAll()
+        finally:
+            self.__condition.release()
+
+
+    def __ReplaceWorker(self, worker):
+        """Replace 'worker', which has failed, with a new worker.
+
+        'worker' -- A tuple as returned by '__StartWorker'.  The worker
+        must not be idle.
+
+        returns -- The new worker, or 'None' if the server has been
+        closed, in which case no new worker is started."""
+
+        self.__condition.acquire()
+        try:
+            if self.__closed:
+                # 'Close' has already stopped the worker.
+                return None
+            self.__workers.remove(worker)
+            self.__StopWorker(worker)
+            worker = self.__StartWorker()
+            self.__workers.append(worker)
+            return worker
+        finally:
+            self.__condition.release()
+
+
+    def __StartWorker(self):
+        """Start a new worker process.
+
+        returns -- A tuple '(pid, request_fd, response_fd)'.  Requests
+        are written to 'request_fd'; responses are read from
+        'response_fd'."""
+
+        request_read, request_write = os.pipe()
+        response_read, response_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.dup2(request_read, 0)
+                os.dup2(response_write, 1)
+                close_descriptors()
+                os.execv(sys.executable,
+                         [sys.executable, "-S", "-E",
+                          os.path.abspath(__file__.replace(".pyc", ".py")),
+                          "--serve"])
+            finally:
+                os._exit(127)
+        os.close(request_read)
+        os.close(response_write)
+        return pid, request_write, response_read
+
+
+    def __StopWorker(self, worker):
+        """Stop 'worker'.
+
+        'worker' -- A tuple as returned by '__StartWorker'."""
+
+        pid, request_fd, response_fd = worker
+        # Closing the request pipe tells the worker to exit.
+        for fd in (request_fd, response_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+########################################################################
+# Functions
+########################################################################
+
+def get_server(workers):
+    """Return a 'CompileServer' with the indicated number of 'workers'.
+
+    'workers' -- The number of worker processes.
+
+    returns -- A 'CompileServer'.  The server is created the first time
+    this function is called with a particular number of 'workers', and
+    shared by all later callers.  The worker processes are stopped when
+    the Python interpreter exits."""
+
+    _servers_lock.acquire()
+    try:
+        server = _servers.get(workers)
+        if server is None:
+            server = CompileServer(workers)
+            _servers[workers] = server
+            atexit.register(server.Close)
+        return server
+    finally:
+        _servers_lock.release()
+
+
+def close_descriptors():
+    """Close all file descriptors other than the standard ones."""
+
+    try:
+        # On systems with '/proc', only the open descriptors need be
+        # examined; the limit on descriptors may be very large.
+        fds = [int(fd) for fd in os.listdir("/proc/self/fd")]
+    except OSError:
+        try:
+            limit = os.sysconf("SC_OPEN_MAX")
+        except (AttributeError, ValueError):
+            limit = 256
+        fds = xrange(3, limit)
+    for fd in fds:
+        if fd > 2:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def _send(fd, value):
+    """Write 'value' to 'fd'.
+
+    'fd' -- A file descriptor.
+
+    'value' -- A picklable object."""
+
+    data = cPickle.dumps(value, 2)
+    data = struct.pack("!I", len(data)) + data
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def _receive(fd):
+    """Read a value written by '_send' from 'fd'.
+
+    'fd' -- A file descriptor.
+
+    returns -- The value, or 'None' if the other end of the pipe has
+    been closed."""
+
+    header = _read(fd, 4)
+    if header is None:
+        return None
+    data = _read(fd, struct.unpack("!I", header)[0])
+    if data is None:
+        return None
+    return cPickle.loads(data)
+
+
+def _read(fd, size):
+    """Read exactly 'size' bytes from 'fd'.
+
+    'fd' -- A file descriptor.
+
+    'size' -- The number of bytes to read.
+
+    returns -- A string of length 'size', or 'None' if the end of the
+    file was reached first."""
+
+    chunks = []
+    while size:
+        data = os.read(fd, size)
+        if not data:
+            return None
+        chunks.append(data)
+        size -= len(data)
+    return "".join(chunks)
+
+
+def spawn(directory, command):
+    """Run 'command' in 'directory'.
+
+    'directory' -- The directory in which to run the command.
+
+    'command' -- The command, as a list of strings.
+
+    returns -- A pair '(status, output)', as for
+    'CompileServer.Execute'."""
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.chdir(directory)
+            null_fd = os.open("/dev/null", os.O_RDONLY)
+            os.dup2(null_fd, 0)
+            os.dup2(write_fd, 1)
+            os.dup2(write_fd, 2)
+            close_descriptors()
+            # Python ignores SIGPIPE; the compiler should not.
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            os.execvp(command[0], command)
+        finally:
+            os._exit(127)
+    os.close(write_fd)
+    chunks = []
+    while 1:
+        data = os.read(read_fd, 65536)
+        if not data:
+            break
+        chunks.append(data)
+    os.close(read_fd)
+    status = os.waitpid(pid, 0)[1]
+    return status, "".join(chunks)
+
+
+def _serve():
+    """Run commands sent by a 'CompileServer'.
+
+    Requests are read from the standard input, and responses written
+    to the standard output.  Each request is a pair '(directory,
+    command)'; each response is a triple '(status, output, error)'
+    where 'error' is 'None' if the command was run, and otherwise a
+    description of the problem."""
+
+    while 1:
+        request = _receive(0)
+        if request is None:
+            return
+        directory, command = request
+        try:
+            status, output = spawn(directory, command)
+            response = (status, output, None)
+        except OSError, e:
+            response = (None, None, str(e))
+        _send(1, response)
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import time
+import unittest
+
+class _CompileServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CompileServer(2)
+
+    def tearDown(self):
+        self.server.Close()
+
+    def testExecute(self):
+        status, output = self.server.Execute(
+            "/", ["sh", "-c", "pwd; echo error >&2; exit 3"])
+        self.failUnless(os.WIFEXITED(status))
+        self.failUnlessEqual(os.WEXITSTATUS(status), 3)
+        self.failUnlessEqual(output, "/\nerror\n")
+
+    def testMissingProgram(self):
+        status, output = self.server.Execute("/", ["no-such-program-x"])
+        self.failUnlessEqual(os.WEXITSTATUS(status), 127)
+
+    def testMissingDirectory(self):
+        status, output = self.server.Execute("/no/such/directory",
+                                             ["true"])
+        self.failIfEqual(status, 0)
+
+    def testSpawn(self):
+        self.failUnlessEqual(spawn("/", ["sh", "-c", "echo $0"]),
+                             (0, "sh\n"))
+
+    def testConcurrent(self):
+        results = {}
+        def run(i):
+            results[i] = self.server.Execute("/", ["echo", str(i)])
+        threads = [threading.Thread(target = run, args = (i,))
+                   for i in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i in xrange(8):
+            self.failUnlessEqual(results[i], (0, "%d\n" % i))
+
+    def testFailedWorker(self):
+        # The command kills the worker that runs it.
+        self.assertRaises(OSError, self.server.Execute,
+                          "/", ["sh", "-c", "kill -9 $PPID"])
+        for i in xrange(4):
+            self.failUnlessEqual(self.server.Execute("/", ["echo", "x"]),
+                                 (0, "x\n"))
+
+    def testClose(self):
+        self.server.Close()
+        self.assertRaises(OSError, self.server.Execute, "/", ["true"])
+
+    def testCloseWhileWaiting(self):
+        server = CompileServer(1)
+        errors = []
+        def run():
+            try:
+                server.Execute("/", ["sleep", "1"])
+            except OSError:
+                errors.append(1)
+        threads = [threading.Thread(target = run) for i in xrange(2)]
+        for t in threads:
+            t.start()
+        time.sleep(0.2)
+        server.Close()
+        for t in threads:
+            t.join()
+        # Closing the server stops the busy worker, and wakes the
+        # thread waiting for it.
+        self.failUnlessEqual(errors, [1, 1])
+
+unittest.makeSuite(_CompileServerTest, "test")
+
+########################################################################
+# Script
+########################################################################
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        _serve()
+    else:
+        unittest.main()
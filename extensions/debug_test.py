@@ -17,12 +17,16 @@
 
 from   compiler import Compiler
 from   dejagnu_base import DejaGNUBase
+from   fingerprint import hash_file
 from   gcc_dg_test import GCCDGTest
 from   gpp_dg_test import GPPDGTest
 from   gcc_test_base import GCCTestBase
 from   gpp_test_base import GPPTestBase
 from   qm.test.resource import Resource
 import os
+import re
+import shutil
+import threading
 
 ########################################################################
 # Classes
@@ -58,13 +62,15 @@ class DebugInit(Resource, DejaGNUBase, GCCTestBase):
         trivial_source_file = os.path.join(self.GetDatabase().GetRoot(),
                                            os.path.dirname(self.GetId()),
                                            self._trivial_source_file)
+        probes = []
         for o in self.__debug_options:
-            output = self._Compile(context, result,
-                                   [trivial_source_file], "trivial.S",
-                                   self.KIND_COMPILE,
-                                   [o])
-            if output.find(": unknown or unsupported -g option") != -1:
+            probes.append((["debug", hash_file(trivial_source_file), o],
+                           self.__MakeProbe(trivial_source_file, o)))
+        answers = self._RunProbes(context, result, probes)
+        for i in xrange(len(self.__debug_options)):
+            if not answers[i]:
                 continue
+            o = self.__debug_options[i]
             for l in ("1", "", "3"):
                 options.append([o + l])
                 for opt in ("-O2", "-O3"):
@@ -73,6 +79,26 @@ class DebugInit(Resource, DejaGNUBase, GCCTestBase):
         context[self.OPTIONS_TAG] = options
 
 
+    def __MakeProbe(self, trivial_source_file, option):
+        """Return a function that checks a debugging option.
+
+        'trivial_source_file' -- The path to the source file to compile.
+
+        'option' -- The debugging option to check.
+
+        returns -- A function suitable for use with '_RunProbes'.  Its
+        answer is true iff the compiler accepts 'option'."""
+
+        def probe(resource, context, result):
+            output = resource._Compile(context, result,
+                                       [trivial_source_file], "trivial.S",
+                                       resource.KIND_COMPILE,
+                                       [option])
+            return output.find(": unknown or unsupported -g option") == -1
+
+        return probe
+
+
 
 class GCCDebugInit(DebugInit, GCCTestBase):
     """A 'GPPDebugInit' stores information for debugging tests.
@@ -96,11 +122,188 @@ class GPPDebugInit(DebugInit, GPPTestBase):
 
 
 
-class GCCDGDebugTest(GCCDGTest):
+class PreprocessedSources(object):
+    """A 'PreprocessedSources' holds the preprocessed forms of a source file.
+
+    A debugging test is compiled with many combinations of options.
+    Most of these options do not affect the preprocessor, so the
+    source file need only be preprocessed once for each group of
+    combinations that do.  A 'PreprocessedSources' records the
+    preprocessed file for each group.  It may be shared by several
+    variants of a test running at once."""
+
+    def __init__(self, directory):
+        """Construct a new 'PreprocessedSources'.
+
+        'directory' -- The directory in which the preprocessed files
+        are placed."""
+
+        self.__directory = directory
+        self.__files = {}
+        self.__lock = threading.Lock()
+
+
+    def Get(self, key, preprocess):
+        """Return the preprocessed file for 'key'.
+
+        'key' -- A hashable value identifying a group of options.
+
+        'preprocess' -- A callable taking the name of an empty directory
+        as its only argument.  It preprocesses the source file, placing
+        the output in the directory, and returns the path to the
+        output, or 'None' if the source could not be preprocessed
+        cleanly.  It is called only the first time that 'key' is
+        requested.
+
+        returns -- The path to the preprocessed file, or 'None'."""
+
+        self.__lock.acquire()
+        try:
+            if not self.__files.has_key(key):
+                directory = os.path.join(self.__directory,
+                                         "preprocessed%d" % len(self.__files))
+                os.mkdir(directory)
+                self.__files[key] = preprocess(directory)
+            return self.__files[key]
+        finally:
+            self.__lock.release()
+
+
+    def Remove(self):
+        """Remove all of the preprocessed files."""
+
+        for i in xrange(len(self.__files)):
+            shutil.rmtree(os.path.join(self.__directory,
+                                       "preprocessed%d" % i), 1)
+        self.__files = {}
+
+
+
+class DGDebugTest:
+    """A 'DGDebugTest' is a test using the 'debug.exp' driver.
+
+    This class is a mixin; it must be combined with a class derived
+    from 'GCCTestBase'."""
+
+    _preprocess_context_property = "GCCTest.preprocess_debug_tests"
+    """A context property that enables the reuse of preprocessed source.
+
+    If this context property is present, the source file for each test
+    is preprocessed once for each group of option combinations that
+    may affect the preprocessor, and the combinations in the group
+    compile the preprocessed output, rather than the original source.
+    The choice of debugging format, as with '-gdwarf-2' or '-gstabs',
+    is assumed not to affect the preprocessor, although the debugging
+    level may, and '-O1', '-O2', and '-O3' are assumed to define the
+    same macros.  The debugging information generated from
+    preprocessed source may differ in minor ways, such as column
+    numbers, from that generated from the original source, so this
+    mode is not used by default."""
+
+    _preprocessed_suffix = None
+    """The suffix used for preprocessed source files."""
+
+    __debug_format_regexp \
+        = re.compile(r"^-g(dwarf(-[0-9]+)?|stabs\+?|coff|xcoff\+?|vms)?"
+                     r"([0-9]*)$")
+    """A regular expression matching a debugging format or level option.
+
+    The third match group gives the debugging level, if any."""
+
+    __preprocessed = None
+    """The 'PreprocessedSources' for the test, or 'None'."""
+
+    def _RunDebugVariants(self, context, result, function, variants):
+        """Run the test with each of the debugging 'variants'.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'function' -- A callable taking four arguments, as for
+        '_RunVariants'.
+
+        'variants' -- A sequence of lists of options, one for each
+        variant."""
+
+        if context.has_key(self._preprocess_context_property):
+            self.__preprocessed \
+                = PreprocessedSources(context.GetTemporaryDirectory())
+        try:
+            self._RunVariants(context, result, function, variants)
+        finally:
+            if self.__preprocessed is not None:
+                self.__preprocessed.Remove()
+                self.__preprocessed = None
+
+
+    def _Compile(self, context, result, source_files, output_file, mode,
+                 options = [], post_options = []):
+
+        source = self._GetSourcePath()
+        if (self.__preprocessed is not None
+            and mode != GCCTestBase.KIND_PREPROCESS
+            and source_files and source_files[0] == source):
+
+            def preprocess(directory):
+                path = os.path.splitext(os.path.basename(source))[0]
+                path = os.path.join(directory,
+                                    path + self._preprocessed_suffix)
+                output = GCCTestBase._Compile(self, context, result,
+                                              [source], path,
+                                              GCCTestBase.KIND_PREPROCESS,
+                                              options, post_options)
+                # If the preprocessor issued diagnostics, the test
+                # must see them, so the original source is used.
+                if output or not os.path.exists(path):
+                    return None
+                return path
+
+            key = self.__GetPreprocessorOptions(options)
+            path = self.__preprocessed.Get(key, preprocess)
+            if path is not None:
+                source_files = [path] + source_files[1:]
+
+        return GCCTestBase._Compile(self, context, result, source_files,
+                                    output_file, mode, options,
+                                    post_options)
+
+
+    def __GetPreprocessorOptions(self, options):
+        """Return the 'options' that may affect the preprocessor.
+
+        'options' -- A list of command-line options.
+
+        returns -- A tuple of options.  Two lists of options with the
+        same tuple are assumed to produce the same preprocessed
+        output."""
+
+        key = []
+        for o in options:
+            match = self.__debug_format_regexp.match(o)
+            if match:
+                # The debugging level determines, for example, whether
+                # macro definitions are retained; the format does not
+                # matter.
+                o = "-g" + (match.group(3) or "2")
+            elif o == "-O" or (o[:2] == "-O" and o[2:].isdigit()
+                               and o != "-O0"):
+                o = "-O"
+            key.append(o)
+        return tuple(key)
+
+
+
+class GCCDGDebugTest(DGDebugTest, GCCDGTest):
     """A 'GCCDGDebugTest' is a GCC test using the 'debug.exp' driver."""
 
+    _preprocessed_suffix = ".i"
+
     def Run(self, context, result):
 
+        if self._IsUnchanged(context, result):
+            return
+
         basename = os.path.basename(self._GetSourcePath())
             
         def isanywhere(string, list):
@@ -109,25 +312,70 @@ class GCCDGDebugTest(GCCDGTest):
                     return True
             return False
 
-        self._SetUp(context)
-        for opts in context[GCCDebugInit.OPTIONS_TAG]:
-            if (basename in ["debug-1.c", "debug-2.c", "debug-6.c"]
-                and opts[0].endswith("1")):
-                continue
-            elif (basename in ["debug-1.c", "debug-2.c"]
-                  and isanywhere("03", opts) != -1
-                  and (isanywhere("coff", opts) != -1
-                       or isanywhere("stabs", opts) != -1)):
-                continue
-            self._RunDGTest(opts, [], context, result)
+        try:
+            self._SetUp(context)
+            options = []
+            for opts in context[GCCDebugInit.OPTIONS_TAG]:
+                if (basename in ["debug-1.c", "debug-2.c", "debug-6.c"]
+                    and opts[0].endswith("1")):
+                    continue
+                elif (basename in ["debug-1.c", "debug-2.c"]
+                      and isanywhere("03", opts) != -1
+                      and (isanywhere("coff", opts) != -1
+                           or isanywhere("stabs", opts) != -1)):
+                    continue
+                options.append(opts)
+            self._RunDebugVariants(context, result,
+                                   GCCDGDebugTest.__RunOptions, options)
 
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
 
 
-class GPPDGDebugTest(GPPDGTest):
+    def __RunOptions(self, context, result, opts):
+        """Run the test with one combination of options.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'opts' -- The list of options to use."""
+
+        self._RunDGTest(opts, [], context, result)
+
+
+
+class GPPDGDebugTest(DGDebugTest, GPPDGTest):
     """A 'GPPDGDebugTest' is a G++ test using the 'debug.exp' driver."""
 
+    _preprocessed_suffix = ".ii"
+
     def Run(self, context, result):
 
-        self._SetUp(context)
-        for opts in context[GPPDebugInit.OPTIONS_TAG]:
-            self._RunDGTest(" ".join(opts), "", context, result)
+        if self._IsUnchanged(context, result):
+            return
+
+        try:
+            self._SetUp(context)
+            self._RunDebugVariants(context, result,
+                                   GPPDGDebugTest.__RunOptions,
+                                   context[GPPDebugInit.OPTIONS_TAG])
+
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
+
+
+    def __RunOptions(self, context, result, opts):
+        """Run the test with one combination of options.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'opts' -- The list of options to use."""
+
+        self._RunDGTest(" ".join(opts), "", context, result)
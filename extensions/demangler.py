@@ -0,0 +1,256 @@
+########################################################################
+#
+# File:   demangler.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   Demangler
+#   get_demangler
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import atexit
+from   compile_server import close_descriptors
+import os
+from   qm.executable import Filter
+import signal
+import threading
+
+########################################################################
+# Variables
+########################################################################
+
+_demangler = None
+"""The 'Demangler' shared by all tests in this process."""
+
+_demangler_lock = threading.Lock()
+"""The lock protecting '_demangler'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class Demangler(object):
+    """A 'Demangler' demangles C++ symbol names using 'c++filt'.
+
+    Starting a new 'c++filt' process for each file to be demangled is
+    expensive relative to the demangling itself.  A 'Demangler'
+    instead keeps a single 'c++filt' process running, and sends it
+    each text in turn, followed by a marker line.  'c++filt' writes
+    each line as soon as it has been demangled, so the end of the
+    demangled text is found by reading up to the marker.
+
+    A 'Demangler' may be used from several threads at once; the texts
+    are demangled one at a time.  If the 'c++filt' process cannot be
+    started, or fails, that text and all later texts are demangled by
+    separate 'c++filt' processes instead."""
+
+    _marker = "@@ end of demangler input @@"
+    """The line that marks the end of each text.
+
+    The marker is not a mangled name, so 'c++filt' copies it
+    unchanged."""
+
+    def __init__(self, program = "c++filt"):
+        """Construct a new 'Demangler'.
+
+        'program' -- The demangler to run."""
+
+        self.__program = program
+        self.__process = None
+        self.__failed = 0
+        self.__lock = threading.Lock()
+
+
+    def Demangle(self, text):
+        """Return the demangled form of 'text'.
+
+        'text' -- A string, such as the contents of an assembly file.
+
+        returns -- The 'text', with each mangled name replaced by its
+        demangled form."""
+
+        self.__lock.acquire()
+        try:
+            if not self.__failed:
+                try:
+                    if self.__process is None:
+                        self.__process = self.__Start()
+                    return self.__Exchange(text)
+                except (EnvironmentError, EOFError):
+                    self.__Stop()
+                    self.__failed = 1
+        finally:
+            self.__lock.release()
+
+        executable = Filter(text)
+        executable.Run([self.__program])
+        return executable.stdout
+
+
+    def Close(self):
+        """Stop the 'c++filt' process."""
+
+        self.__lock.acquire()
+        try:
+            self.__Stop()
+        finally:
+            self.__lock.release()
+
+
+    def __Exchange(self, text):
+        """Send 'text' to the 'c++filt' process, and read the result.
+
+        'text' -- The text to demangle.
+
+        returns -- The demangled text.  Raises 'EOFError' if the
+        process exits before demangling the text, or 'EnvironmentError'
+        if it cannot be written to."""
+
+        pid, input, output = self.__process
+        # The marker must appear on a line of its own.
+        terminated = not text or text.endswith("\n")
+        if terminated:
+            request = text
+        else:
+            request = text + "\n"
+        request += self._marker + "\n"
+
+        # Write the text in a separate thread, so that the process is
+        # never blocked writing output that is not being read.
+        errors = []
+        def write():
+            try:
+                input.write(request)
+                input.flush()
+            except EnvironmentError, e:
+                errors.append(e)
+        writer = threading.Thread(target = write)
+        writer.start()
+        try:
+            lines = []
+            while 1:
+                line = output.readline()
+                if not line:
+                    raise EOFError, "c++filt exited"
+                if line == self._marker + "\n":
+                    break
+                lines.append(line)
+        finally:
+            writer.join()
+        if errors:
+            raise errors[0]
+
+        result = "".join(lines)
+        if not terminated and result.endswith("\n"):
+            # Remove the newline added above.
+            result = result[:-1]
+        return result
+
+
+    def __Start(self):
+        """Start the 'c++filt' process.
+
+        returns -- A tuple '(pid, input, output)', where 'input' and
+        'output' are file objects connected to the standard input and
+        standard output of the process."""
+
+        input_read, input_write = os.pipe()
+        output_read, output_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.dup2(input_read, 0)
+                os.dup2(output_write, 1)
+                close_descriptors()
+                signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+                os.execvp(self.__program, [self.__program])
+            finally:
+                os._exit(127)
+        os.close(input_read)
+        os.close(output_write)
+        return (pid, os.fdopen(input_write, "w"),
+                os.fdopen(output_read, "r"))
+
+
+    def __Stop(self):
+        """Stop the 'c++filt' process, if it is running."""
+
+        if self.__process is None:
+            return
+        pid, input, output = self.__process
+        self.__process = None
+        for f in (input, output):
+            try:
+                f.close()
+            except EnvironmentError:
+                pass
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+########################################################################
+# Functions
+########################################################################
+
+def get_demangler():
+    """Return the 'Demangler' shared by all tests in this process.
+
+    returns -- A 'Demangler'.  It is created the first time this
+    function is called, and its 'c++filt' process is stopped when the
+    Python interpreter exits."""
+
+    global _demangler
+
+    _demangler_lock.acquire()
+    try:
+        if _demangler is None:
+            _demangler = Demangler()
+            atexit.register(_demangler.Close)
+        return _demangler
+    finally:
+        _demangler_lock.release()
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import unittest
+
+class _DemanglerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.demangler = Demangler()
+
+    def tearDown(self):
+        self.demangler.Close()
+
+    def testDemangle(self):
+        self.failUnlessEqual(self.demangler.Demangle("\tcall _Z3foov\n"),
+                             "\tcall foo()\n")
+        # The same process is used for later texts.
+        self.failUnlessEqual(self.demangler.Demangle("_Z3bari\n_Z3bazv\n"),
+                             "bar(int)\nbaz()\n")
+
+    def testUnterminated(self):
+        self.failUnlessEqual(self.demangler.Demangle("_Z3foov"), "foo()")
+        self.failUnlessEqual(self.demangler.Demangle(""), "")
+        self.failUnlessEqual(self.demangler.Demangle("\n\n"), "\n\n")
+
+    def testClose(self):
+        self.demangler.Demangle("_Z3foov")
+        self.demangler.Close()
+        self.failUnlessEqual(self.demangler.Demangle("_Z3foov"), "foo()")
+
+unittest.makeSuite(_DemanglerTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,7 +15,7 @@
 # Imports
 ########################################################################
 
-import filecmp
+from   fingerprint import hash_contents
 from   gcc_dg_test import GCCDGTortureTest
 from   gpp_dg_test import GPPDGTest
 import os
@@ -40,62 +40,83 @@ class DGPCHTest:
     
     def Run(self, context, result):
 
-        # This function emulates dg-pch.exp.
+        if self._IsUnchanged(context, result):
+            return
+
+        try:
+            # This function emulates dg-pch.exp.
+            # Initialize.
+            self._SetUp(context)
+            # Each set of options is tested independently, so the sets
+            # may be run concurrently.
+            self._RunVariants(context, result, DGPCHTest.__RunOptions,
+                              self._pch_options)
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
+
+
+    def __RunOptions(self, context, result, o):
+        """Run the test with one set of options.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'o' -- The options to use."""
+
         suffix = self._suffix
-        # Initialize.
-        self._SetUp(context)
-        # Remove stuff left from the last time the test was run.
+        ostr = " ".join(o)
         source = self._GetSourcePath()
+        header = os.path.splitext(source)[0] + suffix + "s"
         basename = os.path.splitext(os.path.basename(source))[0]
-        basename = os.path.join(context.GetTemporaryDirectory(),
-                                basename)
-        for f in (basename + suffix + ".gch",
-                  basename + ".s",
-                  basename + ".s-gch"):
+        # The header and the precompiled header must be in the same
+        # directory as the output files.
+        directory = self._GetScratchDirectory(context)
+        basename = os.path.join(directory, basename)
+        # Remove stuff left from the last time the test was run.
+        for f in (basename + suffix,
+                  basename + suffix + ".gch",
+                  basename + ".s"):
             try:
                 os.remove(f)
             except:
                 pass
 
-        for o in self._pch_options:
-            # Create the precompiled header file.
-            try:
-                os.remove(basename + suffix)
-            except:
-                pass
-            shutil.copyfile(os.path.splitext(source)[0] + suffix + "s",
-                            basename + suffix)
-            self._RunDGTest(o, [], context, result,
-                            basename + suffix,
-                            self.KIND_PRECOMPILE,
-                            keep_output = 1)
-
-            assembly_outcome = self.UNTESTED
-            if os.path.exists(basename + suffix + ".gch"):
+        # Create the precompiled header file.
+        shutil.copyfile(header, basename + suffix)
+        self._RunDGTest(o, [], context, result,
+                        basename + suffix,
+                        self.KIND_PRECOMPILE,
+                        keep_output = 1)
+
+        assembly_outcome = self.UNTESTED
+        if os.path.exists(basename + suffix + ".gch"):
+            os.remove(basename + suffix)
+            options = o + ["-I" + directory]
+            self._RunDGTest(options, [], context, result, keep_output = 1)
+            os.remove(basename + suffix + ".gch")
+            if os.path.exists(basename + ".s"):
+                # Remember the assembly produced using the precompiled
+                # header, rather than keeping the file for comparison.
+                pch_assembly = hash_contents(basename + ".s")
+                os.remove(basename + ".s")
+                shutil.copyfile(header, basename + suffix)
+                self._RunDGTest(options, [], context, result,
+                                keep_output = 1)
+                if hash_contents(basename + ".s") == pch_assembly:
+                    assembly_outcome = self.PASS
+                else:
+                    assembly_outcome = self.FAIL
                 os.remove(basename + suffix)
-                options = o + ["-I" + context.GetTemporaryDirectory()]
-                self._RunDGTest(options, [], context, result, keep_output = 1)
-                os.remove(basename + suffix + ".gch")
-                if os.path.exists(basename + ".s"):
-                    os.rename(basename + ".s", basename + ".s-gch")
-                    shutil.copyfile((os.path.splitext(source)[0]
-                                     + suffix + "s"),
-                                    basename + suffix)
-                    self._RunDGTest(options, [], context, result,
-                                    keep_output = 1)
-                    if filecmp.cmp(basename + ".s", basename + ".s-gch"):
-                        assembly_outcome = self.PASS
-                    else:
-                        assembly_outcome = self.FAIL
-                    os.remove(basename + suffix)
-                    os.remove(basename + ".s")
-                    os.remove(basename + ".s-gch")
-            else:
-                self._RecordDejaGNUOutcome(result,
-                                           self.UNTESTED,
-                                           self._name + " " + o)
-            message = self._name + " " + o + " assembly comparison"
-            self._RecordDejaGNUOutcome(result, assembly_outcome, message)
+                os.remove(basename + ".s")
+        else:
+            self._RecordDejaGNUOutcome(result,
+                                       self.UNTESTED,
+                                       self._name + " " + ostr)
+        message = self._name + " " + ostr + " assembly comparison"
+        self._RecordDejaGNUOutcome(result, assembly_outcome, message)
 
 
 
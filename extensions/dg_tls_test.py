@@ -17,6 +17,7 @@
 
 from   compiler import Compiler
 from   dejagnu_base import DejaGNUBase
+from   fingerprint import hash_file
 from   gcc_test_base import GCCTestBase
 from   gcc_dg_test import GCCDGTest
 from   gpp_dg_test import GPPDGTest
@@ -49,13 +50,19 @@ class TLSInitBase(Resource, DejaGNUBase):
         trivial_source_file = os.path.join(self.GetDatabase().GetRoot(),
                                            os.path.dirname(self.GetId()),
                                            "trivial.C")
-        output = self._Compile(context, result,
-                               [trivial_source_file], "trivial.S",
-                               self.KIND_COMPILE)
-        if output.find("not supported") != -1:
-            context[self.SUPPORTED_TAG] = 0
-        else:
-            context[self.SUPPORTED_TAG] = 1
+        def probe(resource, context, result):
+            output = resource._Compile(context, result,
+                                       [trivial_source_file], "trivial.S",
+                                       resource.KIND_COMPILE)
+            if output.find("not supported") != -1:
+                return 0
+            else:
+                return 1
+
+        context[self.SUPPORTED_TAG] \
+            = self._RunProbes(context, result,
+                              [(["tls", hash_file(trivial_source_file)],
+                                probe)])[0]
 
 
 
@@ -0,0 +1,582 @@
+########################################################################
+#
+# File:   fingerprint.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   FingerprintStore
+#   hash_file
+#   hash_contents
+#   hash_strings
+#   toolchain_identity
+#   find_program
+#   source_fingerprint
+#   tree_fingerprint
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+from   compile_server import spawn
+import os
+from   source_analysis import analyze_source
+import threading
+try:
+    from hashlib import md5 as _md5
+except ImportError:
+    from md5 import new as _md5
+
+########################################################################
+# Variables
+########################################################################
+
+_file_hashes = {}
+"""A map from paths to records of the form '(mtime, size, digest)'.
+
+Hashing a large file, such as the compiler, is expensive.  The digest
+is therefore recomputed only if the modification time or size of the
+file has changed since it was last hashed."""
+
+_toolchain_queries = ["-print-prog-name=cc1",
+                      "-print-prog-name=cc1plus",
+                      "-print-prog-name=as",
+                      "-print-prog-name=collect2",
+                      "-print-prog-name=ld",
+                      "-print-libgcc-file-name"]
+"""The options used to find the components of a toolchain.
+
+Each option makes the compiler driver print the location of one of
+the programs or libraries that it uses."""
+
+_toolchain_environment = ["GCC_EXEC_PREFIX", "COMPILER_PATH",
+                          "LIBRARY_PATH"]
+"""The environment variables that affect the components used."""
+
+_toolchains = {}
+"""A map from compiler drivers to lists of their components.
+
+The keys are tuples giving the location, modification time, and size
+of the driver, the '-B' options, and the values of the variables in
+'_toolchain_environment'.  The values are lists of paths, as returned
+by '_get_toolchain_components', or 'None' if the components could not
+be determined."""
+
+_toolchains_lock = threading.Lock()
+"""The lock protecting '_toolchains'."""
+
+_trees = {}
+"""A map from tuples of paths to the digests of those paths.
+
+The files in a build tree do not change while the tests are being
+run, so each 'tree_fingerprint' is computed only once per process."""
+
+_trees_lock = threading.Lock()
+"""The lock protecting '_trees'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class FingerprintStore(object):
+    """A 'FingerprintStore' records the fingerprints of passing tests.
+
+    The store is a directory containing one file for each test.  The
+    file records the fingerprint the test had the last time it passed.
+    Because each test has its own file, several processes may use the
+    same store at once."""
+
+    def __init__(self, directory):
+        """Construct a new 'FingerprintStore'.
+
+        'directory' -- The path to the directory containing the store.
+        The directory is created if it does not already exist."""
+
+        self.__directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created the directory.
+                if not os.path.isdir(directory):
+                    raise
+
+
+    def IsUnchanged(self, test_id, fingerprint):
+        """Return true if 'test_id' passed with the same 'fingerprint'.
+
+        'test_id' -- The name of a test.
+
+        'fingerprint' -- The current fingerprint of the test.
+
+        returns -- True iff the fingerprint recorded for 'test_id'
+        matches 'fingerprint'."""
+
+        try:
+            f = open(self.__GetPath(test_id))
+            try:
+                return f.read() == fingerprint
+            finally:
+                f.close()
+        except IOError:
+            return 0
+
+
+    def Record(self, test_id, fingerprint):
+        """Record that 'test_id' passed with the indicated 'fingerprint'.
+
+        'test_id' -- The name of a test.
+
+        'fingerprint' -- The fingerprint of the test.
+
+        Errors writing the store are silently ignored; the store is only
+        an optimization."""
+
+        path = self.__GetPath(test_id)
+        # Write the fingerprint to a temporary file first, and then
+        # rename it, so that other processes never see a partial file.
+        temporary = "%s.%d" % (path, os.getpid())
+        try:
+            f = open(temporary, "w")
+            try:
+                f.write(fingerprint)
+            finally:
+                f.close()
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+
+    def Forget(self, test_id):
+        """Remove the fingerprint recorded for 'test_id', if any.
+
+        'test_id' -- The name of a test."""
+
+        try:
+            os.remove(self.__GetPath(test_id))
+        except OSError:
+            pass
+
+
+    def __GetPath(self, test_id):
+        """Return the path to the file for 'test_id'.
+
+        'test_id' -- The name of a test.
+
+        returns -- The path to the file in which the fingerprint for
+        'test_id' is stored."""
+
+        return os.path.join(self.__directory, hash_strings([test_id]))
+
+########################################################################
+# Functions
+########################################################################
+
+def hash_file(path):
+    """Return a digest of the contents of the file at 'path'.
+
+    'path' -- The path to a file.
+
+    returns -- A string giving a hexadecimal digest of the contents of
+    'path'.  Raises 'OSError' or 'IOError' if 'path' cannot be read."""
+
+    st = os.stat(path)
+    record = _file_hashes.get(path)
+    if (record is not None
+        and record[0] == st.st_mtime and record[1] == st.st_size):
+        return record[2]
+
+    digest = hash_contents(path)
+    _file_hashes[path] = (st.st_mtime, st.st_size, digest)
+    return digest
+
+
+def hash_contents(path):
+    """Return a digest of the contents of the file at 'path'.
+
+    'path' -- The path to a file.
+
+    returns -- A string giving a hexadecimal digest of the contents of
+    'path'.  Unlike 'hash_file', this function always reads the file;
+    it should be used for files that may be rewritten more than once
+    within the resolution of the file system's modification times."""
+
+    digest = _md5()
+    f = open(path, "rb")
+    try:
+        while 1:
+            block = f.read(65536)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def hash_strings(strings):
+    """Return a digest of a sequence of strings.
+
+    'strings' -- A sequence of strings.
+
+    returns -- A string giving a hexadecimal digest of the 'strings'.
+    Different sequences give different digests, even if the
+    concatenations of the strings are the same."""
+
+    digest = _md5()
+    for s in strings:
+        digest.update("%d:%s;" % (len(s), s))
+    return digest.hexdigest()
+
+
+def toolchain_identity(path, options = ()):
+    """Return a string identifying the toolchain used by 'path'.
+
+    'path' -- The path to the compiler driver.  If 'path' does not
+    contain a directory separator, the directories in 'PATH' are
+    searched for it, as the shell would.
+
+    'options' -- The options given to the compiler.  Only '-B' options
+    are considered, as they determine where the driver looks for the
+    other programs.
+
+    returns -- A digest of the driver, and of the compiler proper,
+    assembler, linker, and 'libgcc' that it uses, or 'None' if these
+    programs cannot be determined.  A new build of any of them changes
+    the identity, even if the driver itself was not rebuilt."""
+
+    program = find_program(path)
+    if program is None:
+        return None
+    prefixes = _get_prefix_options(options)
+    try:
+        st = os.stat(program)
+        key = ((os.path.abspath(program), st.st_mtime, st.st_size),
+               tuple(prefixes),
+               tuple([os.environ.get(v) for v in _toolchain_environment]))
+        _toolchains_lock.acquire()
+        try:
+            components = _toolchains.get(key, ())
+        finally:
+            _toolchains_lock.release()
+        if components == ():
+            components = _get_toolchain_components(program, prefixes)
+            _toolchains_lock.acquire()
+            try:
+                _toolchains[key] = components
+            finally:
+                _toolchains_lock.release()
+        if components is None:
+            return None
+
+        strings = [hash_file(program)] + prefixes
+        for c in components:
+            strings.append(c)
+            if os.path.isfile(c):
+                strings.append(hash_file(c))
+        return hash_strings(strings)
+    except (IOError, OSError):
+        return None
+
+
+def find_program(path):
+    """Return the location of the program at 'path'.
+
+    'path' -- The path to a program.  If 'path' does not contain a
+    directory separator, the directories in 'PATH' are searched for
+    it, as the shell would.
+
+    returns -- The path to the program, or 'None' if it cannot be
+    found."""
+
+    candidates = [path]
+    if os.sep not in path:
+        candidates = [os.path.join(d, path)
+                      for d in os.environ.get("PATH", "").split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def source_fingerprint(path, companions = ()):
+    """Return a fingerprint of the source files for a test.
+
+    'path' -- The path to the main source file for the test.
+
+    'companions' -- A sequence of paths to other files used by the
+    test.  Companions that do not exist are ignored.
+
+    returns -- A string giving a digest of the contents of 'path', of
+    any files named in 'dg-additional-sources' directives in 'path',
+    of the 'companions', and of the headers that any of these files
+    include with '#include "..."' from their own directories.
+    Headers found only through '-I' options are not considered."""
+
+    analysis = analyze_source(path)
+    strings = [analysis.GetDigest()]
+    seen = { path : None }
+    _add_includes(analysis, strings, seen)
+    files = analysis.GetAdditionalSources() + list(companions)
+    for f in files:
+        if os.path.exists(f) and not seen.has_key(f):
+            seen[f] = None
+            strings += [os.path.basename(f), hash_file(f)]
+            _add_includes(analyze_source(f), strings, seen)
+    return hash_strings(strings)
+
+
+def tree_fingerprint(paths):
+    """Return a fingerprint of the files in 'paths'.
+
+    'paths' -- A sequence of paths to files and directories.  The
+    files in the directories, and in their subdirectories, are
+    included.  Paths that do not exist are ignored.
+
+    returns -- A string giving a digest of the names and contents of
+    the files.  The digest is computed only once in each process, so
+    the files must not change while tests are being run."""
+
+    key = tuple(paths)
+    _trees_lock.acquire()
+    try:
+        digest = _trees.get(key)
+    finally:
+        _trees_lock.release()
+    if digest is not None:
+        return digest
+
+    strings = []
+    for path in paths:
+        if os.path.isfile(path):
+            strings += [path, hash_file(path)]
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            filenames.sort()
+            for f in filenames:
+                f = os.path.join(dirpath, f)
+                if os.path.isfile(f):
+                    strings += [f, hash_file(f)]
+    digest = hash_strings(strings)
+    _trees_lock.acquire()
+    try:
+        _trees[key] = digest
+    finally:
+        _trees_lock.release()
+    return digest
+
+
+def _add_includes(analysis, strings, seen):
+    """Add the digests of the headers included by a source file.
+
+    'analysis' -- The 'SourceAnalysis' for the source file.
+
+    'strings' -- The list of strings to which the digests are
+    appended.
+
+    'seen' -- A dictionary whose keys are the files that have already
+    been considered.  The headers are added to it."""
+
+    for header in analysis.GetIncludes():
+        if seen.has_key(header):
+            continue
+        seen[header] = None
+        if os.path.isfile(header):
+            header_analysis = analyze_source(header)
+            strings += [os.path.basename(header),
+                        header_analysis.GetDigest()]
+            _add_includes(header_analysis, strings, seen)
+
+
+def _get_prefix_options(options):
+    """Return the '-B' options in 'options'.
+
+    'options' -- A sequence of compiler options.
+
+    returns -- A list of the '-B' options, each in the form '-Bdir',
+    in the order in which they appear."""
+
+    prefixes = []
+    for i in xrange(len(options)):
+        o = options[i]
+        if o == "-B" and i + 1 < len(options):
+            prefixes.append("-B" + options[i + 1])
+        elif o.startswith("-B") and len(o) > 2:
+            prefixes.append(o)
+    return prefixes
+
+
+def _get_toolchain_components(program, prefixes):
+    """Return the programs and libraries used by a compiler driver.
+
+    'program' -- The path to the driver.
+
+    'prefixes' -- The '-B' options given to the driver.
+
+    returns -- A list of the paths to the components named by
+    '_toolchain_queries', or 'None' if the driver could not answer
+    one of the queries.  A component that the driver expects to find
+    in 'PATH' is looked up there; if it cannot be found, its name is
+    given instead."""
+
+    components = []
+    for query in _toolchain_queries:
+        try:
+            status, output = spawn(os.getcwd(), [program] + prefixes
+                                   + [query])
+        except OSError:
+            return None
+        output = output.strip()
+        if status != 0 or not output or "\n" in output:
+            return None
+        if os.sep not in output:
+            output = find_program(output) or output
+        components.append(output)
+    return components
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import shutil
+import tempfile
+import time
+import unittest
+
+def _make_driver(directory):
+    """Create a program that answers the toolchain queries.
+
+    'directory' -- The directory in which to create the program.  The
+    components that the program names are created there as well.
+
+    returns -- The path to the program."""
+
+    for name in ("cc1", "cc1plus", "as", "collect2", "ld", "libgcc.a"):
+        _write(os.path.join(directory, name), name)
+    driver = os.path.join(directory, "driver")
+    _write(driver,
+           '#! /bin/sh\n'
+           'for a in "$@"; do query="$a"; done\n'
+           'case "$query" in\n'
+           '  -print-prog-name=*) echo "%s/${query#*=}" ;;\n'
+           '  -print-libgcc-file-name) echo "%s/libgcc.a" ;;\n'
+           '  *) exit 1 ;;\n'
+           'esac\n' % (directory, directory))
+    os.chmod(driver, 0755)
+    return driver
+
+
+def _write(path, contents):
+    """Write 'contents' to the file at 'path'."""
+
+    f = open(path, "w")
+    try:
+        f.write(contents)
+    finally:
+        f.close()
+
+
+class _FingerprintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def testHashStrings(self):
+        self.failIfEqual(hash_strings(["ab", "c"]), hash_strings(["a", "bc"]))
+        self.failUnlessEqual(hash_strings(["a"]), hash_strings(["a"]))
+
+    def testHashFile(self):
+        _write(self.path("f"), "one")
+        digest = hash_file(self.path("f"))
+        self.failUnlessEqual(digest, hash_contents(self.path("f")))
+        _write(self.path("f"), "three")
+        self.failIfEqual(hash_file(self.path("f")), digest)
+
+    def testStore(self):
+        store = FingerprintStore(self.path("store"))
+        self.failIf(store.IsUnchanged("a/b.c", "x"))
+        store.Record("a/b.c", "x")
+        self.failUnless(store.IsUnchanged("a/b.c", "x"))
+        self.failIf(store.IsUnchanged("a/b.c", "y"))
+        store.Forget("a/b.c")
+        self.failIf(store.IsUnchanged("a/b.c", "x"))
+
+    def testSourceFingerprint(self):
+        os.mkdir(self.path("sub"))
+        _write(self.path("t.c"),
+               '#include "h.h"\n'
+               '/* { dg-additional-sources "extra.c" } */\n')
+        _write(self.path("h.h"), '#include "sub/g.h"\n')
+        _write(self.path("sub/g.h"), "int g;\n")
+        _write(self.path("extra.c"), "int e;\n")
+        _write(self.path("unrelated.h"), "int u;\n")
+        fingerprints = [source_fingerprint(self.path("t.c"))]
+        _write(self.path("unrelated.h"), "int unrelated;\n")
+        self.failUnlessEqual(source_fingerprint(self.path("t.c")),
+                             fingerprints[0])
+        # Each file used by the test changes the fingerprint.
+        for name in ("sub/g.h", "h.h", "extra.c", "t.c"):
+            time.sleep(0.01)
+            f = open(self.path(name), "a")
+            f.write("/* changed */\n")
+            f.close()
+            fingerprint = source_fingerprint(self.path("t.c"))
+            self.failIf(fingerprint in fingerprints, name)
+            fingerprints.append(fingerprint)
+
+    def testTreeFingerprint(self):
+        os.mkdir(self.path("tree"))
+        _write(self.path("tree/a"), "a")
+        digest = tree_fingerprint([self.path("tree"), self.path("none")])
+        self.failUnlessEqual(tree_fingerprint([self.path("tree"),
+                                               self.path("none")]),
+                             digest)
+        # The digest is computed only once, so a changed tree must be
+        # named differently to be measured again.
+        _write(self.path("tree/b"), "b")
+        self.failIfEqual(tree_fingerprint([self.path("tree")]), digest)
+        self.failUnlessEqual(tree_fingerprint([self.path("tree/a"),
+                                               self.path("tree/b")]),
+                             tree_fingerprint([self.path("tree")]))
+
+    def testPrefixOptions(self):
+        self.failUnlessEqual(_get_prefix_options(["-B", "x", "-O2", "-By"]),
+                             ["-Bx", "-By"])
+
+    def testToolchainIdentity(self):
+        driver = _make_driver(self.directory)
+        identity = toolchain_identity(driver)
+        self.failIf(identity is None)
+        self.failUnlessEqual(toolchain_identity(driver, ["-O2"]), identity)
+        self.failIfEqual(toolchain_identity(driver, ["-B/x/"]), identity)
+        # Rebuilding a component changes the identity, even though the
+        # driver is unchanged.
+        for name in ("cc1", "as", "libgcc.a"):
+            _write(self.path(name), "rebuilt " + name)
+            self.failIfEqual(toolchain_identity(driver), identity)
+            identity = toolchain_identity(driver)
+
+    def testUnknownToolchain(self):
+        self.failUnless(toolchain_identity(self.path("missing")) is None)
+        _write(self.path("failing"), "#! /bin/sh\nexit 1\n")
+        os.chmod(self.path("failing"), 0755)
+        self.failUnless(toolchain_identity(self.path("failing")) is None)
+
+unittest.makeSuite(_FingerprintTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
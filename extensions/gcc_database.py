@@ -15,6 +15,7 @@
 # Imports
 ########################################################################
 
+import atexit
 import fnmatch
 import os
 import qm
@@ -24,8 +25,26 @@ from   qm.test.database import ResourceDescriptor, TestDescriptor
 from   qm.test.file_database import FileDatabase
 from   qm.test.directory_suite import DirectorySuite
 from   qm.test.runnable import Runnable
+import re
 
+from   fingerprint import hash_strings, source_fingerprint
 import maximal_prefix
+from   source_analysis import SourceIndex
+from   test_index import TestIndex
+import weakref
+
+########################################################################
+# Variables
+########################################################################
+
+_directive_indices = weakref.WeakKeyDictionary()
+"""The directive indices in use, as a dictionary whose keys are the
+'SourceIndex' objects.
+
+The indices are written back by '_save_directive_indices' when the
+Python interpreter exits.  The references are weak, so that the index
+of a database that is no longer in use is not kept alive; an index
+discarded with unsaved changes is merely rebuilt later."""
 
 ########################################################################
 # Classes
@@ -42,6 +61,35 @@ class GCCDatabase(FileDatabase):
 
             This directory is the one that contains 'g++.dg' and
             'g++.old-deja'."""),
+        qm.fields.TextField(
+            name = "index_file",
+            title = "Index File",
+            description ="""The file in which the test index is stored.
+
+            The database records the tests in the source directory in
+            this file, so that the source directory need not be
+            searched from scratch on every run.  If this field is
+            empty, the index is stored in the 'QMTest' subdirectory
+            of the database."""),
+        qm.fields.TextField(
+            name = "directive_index_file",
+            title = "Directive Index File",
+            description ="""The file in which the directive index is stored.
+
+            The database records the 'dg-' directives in each test in
+            this file, so that test sources need not be read again
+            unless they change.  If this field is empty, the index is
+            stored in the 'QMTest' subdirectory of the database."""),
+        qm.fields.IntegerField(
+            name = "scan_threads",
+            title = "Scan Threads",
+            description ="""The number of threads used to scan directories.
+
+            When the tests in several directories are requested at
+            once, the directories are scanned concurrently using up to
+            this many threads.  Using several threads is most helpful
+            when the source directory is on a networked file system.""",
+            default_value = 1),
         # The G++ database uses filenames as labels.
         qm.fields.TextField(
             name = "label_class",
@@ -87,7 +135,34 @@ class GCCDatabase(FileDatabase):
 
     The databases determines which test class to use for a particular
     test by finding the longest entry in this table which is a prefix of
-    the test's filename."""
+    the directory containing the test."""
+
+    __test_file_map = {
+        # In the gcc.dg/compat subdirectory, only tests that end with
+        # _main.c are tests.
+        _j("gcc.dg", "compat", ""): "*_main.c",
+        # If the gcc.dg/special subdirectory, only some source files
+        # are tests.
+        _j("gcc.dg", "special", ""): "*[1-9].c",
+        "gcc": "*.c",
+        # In the g++.dg/compat subdirectory, only tests that end with
+        # _main.C are tests.
+        _j("g++.dg", "compat", ""): "*_main.C",
+        "g++": "*.C"
+        }
+    """A map from directory prefixes to patterns matching test files.
+
+    The database determines whether a file is a test by finding the
+    longest entry in this table which is a prefix of the directory
+    containing the file, followed by a directory separator.  The file
+    is a test if its name matches the corresponding pattern."""
+
+    __index_version = 2
+    """The version of the classification rules used by this database.
+
+    This number must be incremented whenever the classification of tests
+    changes in a way not reflected in '__test_class_map', so that
+    existing test indices are discarded."""
 
     def __init__(self, path, arguments):
 
@@ -97,7 +172,33 @@ class GCCDatabase(FileDatabase):
         self.__store = FileAttachmentStore()
         # Create the prefix matcher.
         self.__matcher = maximal_prefix.MaximalPrefixMatcher()
-        self.__matcher.add(self.__test_class_map)
+        self.__matcher.add([p + os.sep for p in self.__test_class_map])
+        self.__file_matcher \
+            = maximal_prefix.MaximalPrefixMatcher(self.__test_file_map)
+        # A map from directories to the test class, resources, and
+        # test file predicate used for files in that directory.
+        self.__directory_table = {}
+        # A map from test names to test descriptors.
+        self.__descriptors = {}
+        # Create the test index.
+        index_file = self.index_file
+        if not index_file:
+            index_file = os.path.join(path, "QMTest", "gcc_index")
+        # The tag must change whenever the way in which tests are
+        # classified changes.
+        tag = self.__test_class_map.items() + self.__test_file_map.items()
+        tag.sort()
+        tag = (self.__index_version, tag)
+        self.__index = TestIndex(self.GetRoot(), index_file,
+                                 self._IsTestFile, self.__DescribeTest,
+                                 repr(tag), self.scan_threads)
+        # The directive index is read when it is first needed, as most
+        # runs do not use it.
+        self.__directive_index_file = self.directive_index_file
+        if not self.__directive_index_file:
+            self.__directive_index_file = os.path.join(path, "QMTest",
+                                                       "gcc_directives")
+        self.__directive_index = None
 
         
     def GetResource(self, resource_id):
@@ -162,20 +263,159 @@ class GCCDatabase(FileDatabase):
                    
         if suite_id == "g++":
             arguments["suite_ids"] = ["g++.dg", "g++.old-deja"]
-            return suite_class(arguments, **extras)
         elif suite_id == "gcc":
             arguments["suite_ids"] = ["gcc.dg"]
-            return suite_class(arguments, **extras)
+        else:
+            return super(GCCDatabase, self).GetSuite(suite_id)
+
+        # QMTest expands a suite into all of its tests, using
+        # 'GetAllTestAndSuiteIds', before it runs any of them, so
+        # nothing is gained by expanding these suites lazily.  The
+        # tests will be requested shortly; scan the suites now,
+        # concurrently.
+        self.__index.Prefetch(arguments["suite_ids"])
+        self.__index.Save()
+        return suite_class(arguments, **extras)
+
+
+    def GetTestIds(self, directory="", scan_subdirs=1):
+
+        test_ids = self.__index.GetTestIds(directory, scan_subdirs)
+        self.__index.Save()
+        return test_ids
+
+
+    def GetSuiteIds(self, directory="", scan_subdirs=1):
+
+        suite_ids = self.__index.GetSuiteIds(directory, scan_subdirs)
+        self.__index.Save()
+        return suite_ids
+
+
+    def GetTest(self, test_id):
+
+        # Test descriptors are immutable, so the descriptor created
+        # the first time a test is requested can be reused.
+        try:
+            return self.__descriptors[test_id]
+        except KeyError:
+            descriptor = super(GCCDatabase, self).GetTest(test_id)
+            self.__descriptors[test_id] = descriptor
+            return descriptor
+
+
+    def GetTestFingerprint(self, test_id):
+        """Return a fingerprint of the files used by 'test_id'.
+
+        'test_id' -- The name of a test.
+
+        returns -- A string that changes whenever any of the files used
+        by the test changes.  The fingerprint covers the test source,
+        the headers that it includes from its own directory, any files
+        named in 'dg-additional-sources' directives, the header used
+        by precompiled-header tests, and the '_x' and '_y' files used
+        by 'compat' tests.  It also reflects the test class used to run
+        the test."""
+
+        test_class = self.GetTest(test_id).GetClassName()
+        path = os.path.join(self.GetRoot(), test_id)
+        if test_class.startswith("dg_pch_test."):
+            base = os.path.splitext(path)[0]
+            companions = [base + ".hs", base + ".Hs"]
+        elif test_class.startswith("compat_test."):
+            companions = [path.replace("_main", "_x"),
+                          path.replace("_main", "_y")]
+        else:
+            companions = []
+        return hash_strings([test_class,
+                             source_fingerprint(path, companions)])
+
+
+    def IndexDirectives(self, directory="", scan_subdirs=1):
+        """Bring the directive index up to date.
+
+        'directory' -- A label naming a directory.
+
+        'scan_subdirs' -- If true, tests in subdirectories are
+        indexed.
+
+        returns -- A list of pairs '(test_id, analysis)', one for each
+        test in 'directory', where 'analysis' is the 'SourceAnalysis'
+        for the test source.  Only tests that have changed since they
+        were last indexed are read."""
+
+        test_ids = self.GetTestIds(directory, scan_subdirs)
+        root = self.GetRoot()
+        analyses = self.__GetDirectiveIndex().Update(
+            [os.path.join(root, test_id) for test_id in test_ids],
+            self.scan_threads)
+        return zip(test_ids, analyses)
+
+
+    def GetTestsWithDirective(self, command, argument=None,
+                              directory="", scan_subdirs=1):
+        """Return the tests that contain a particular directive.
+
+        'command' -- The name of a directive, without the 'dg-' prefix.
+
+        'argument' -- If not 'None', only directives whose first
+        argument is 'argument' are considered.  For example, the tests
+        with 'scan-assembler' directives are those with a "final"
+        directive whose first argument is "scan-assembler", and the
+        tests that are run are those with a "do" directive whose first
+        argument is "run".
+
+        'directory' -- A label naming a directory.
+
+        'scan_subdirs' -- If true, tests in subdirectories are
+        included.
+
+        returns -- A list of the matching test ids."""
+
+        return [test_id
+                for test_id, analysis
+                in self.IndexDirectives(directory, scan_subdirs)
+                if analysis.HasDirective(command, argument)]
+
+
+    def GetTestKind(self, test_id):
+        """Return the kind of 'test_id'.
+
+        'test_id' -- The name of a test.
+
+        returns -- The first argument to the 'dg-do' directive in the
+        test, such as "compile" or "run", or 'None' if the test has no
+        'dg-do' directive.  The answer is taken from the directive
+        index, so that a scheduler can use it without reading the
+        test."""
+
+        path = os.path.join(self.GetRoot(), test_id)
+        return self.__GetDirectiveIndex().Get(path).GetKind()
+
+
+    def __GetDirectiveIndex(self):
+        """Return the directive index for this database.
+
+        returns -- The 'SourceIndex' recording the directives in the
+        tests.  The index is read from disk the first time this method
+        is called.  It is written back when the Python interpreter
+        exits, if it has changed and is still in use."""
+
+        if self.__directive_index is None:
+            index = SourceIndex(self.__directive_index_file,
+                                self.GetRoot())
+            _directive_indices[index] = None
+            self.__directive_index = index
+        return self.__directive_index
+
 
-        return super(GCCDatabase, self).GetSuite(suite_id)
-                     
-        
     def _GetTestFromPath(self, test_id, path):
 
-        # Figure out which test class to use.
-        p = path[len(self.GetRoot()) + 1:]
-        prefix = self.__matcher[p]
-        test_class = self.__test_class_map[prefix]
+        # Look up the test class and resources in the index.
+        description = self.__index.GetTest(test_id)
+        if description is None:
+            description = self.__DescribeTest(test_id, path)
+        test_class, resources = description
 
         # Construct the attachment representing the primary source
         # file.
@@ -184,22 +424,6 @@ class GCCDatabase(FileDatabase):
                                 basename, path,
                                 self.GetAttachmentStore())
 
-        resources = []
-        
-        # All G++ tests depend on gpp_init.
-        if test_id.startswith("g++."):
-            resources.append("gpp_init")
-        elif test_id.startswith("gcc."):
-            resources.append("gcc_init")
-        # The TLS tests depend on tls_init.
-        if test_id.startswith(os.path.join("gcc.dg", "tls")):
-            resources.append(os.path.join("gcc.dg", "tls", "init"))
-        elif test_id.startswith(os.path.join("g++.dg", "tls")):
-            resources.append(os.path.join("g++.dg", "tls", "init"))
-        elif test_id.startswith(os.path.join("g++.dg", "debug")):
-            resources.append(os.path.join("g++.dg", "debug", "init"))
-        elif test_id.startswith(os.path.join("gcc.dg", "debug")):
-            resources.append(os.path.join("gcc.dg", "debug", "init"))
         # Create the test descriptor.
         descriptor = TestDescriptor(self, test_id, test_class,
                                     { 'source_file' : attachment,
@@ -207,8 +431,86 @@ class GCCDatabase(FileDatabase):
                                         resources })
 
         return descriptor
-        
-                
+
+
+    def __DescribeTest(self, test_id, path):
+        """Return the test class and resources for a test.
+
+        'test_id' -- The name of the test.
+
+        'path' -- The path to the primary source file for the test.
+
+        returns -- A pair '(test_class, resources)'.  The 'test_class'
+        is the name of the test class; the 'resources' are a list of
+        resource names."""
+
+        return self.__GetDirectoryInfo(os.path.dirname(test_id))[:2]
+
+
+    def __GetDirectoryInfo(self, directory):
+        """Return information about the tests in 'directory'.
+
+        'directory' -- The path to a directory, relative to the root of
+        the database.
+
+        returns -- A triple '(test_class, resources, is_test)'.  The
+        'test_class' is the name of the test class to use for tests in
+        'directory', or 'None' if the directory does not contain
+        tests.  The 'resources' are a list of resource names.  The
+        'is_test' is a callable that takes the name of a file in
+        'directory' and returns true iff that file is a test.
+
+        The test class and resources depend only on the directory
+        containing the test, so this information is computed once per
+        directory."""
+
+        try:
+            return self.__directory_table[directory]
+        except KeyError:
+            pass
+
+        # The prefixes in the matchers end with a directory separator
+        # so that, for example, "gcc.dg/cpp" does not match
+        # "gcc.dg/cppfoo".
+        key = directory + os.sep
+
+        # Figure out which test class to use.
+        try:
+            test_class = self.__test_class_map[self.__matcher[key][:-1]]
+        except KeyError:
+            test_class = None
+
+        resources = []
+
+        # All G++ tests depend on gpp_init.
+        if directory.startswith("g++."):
+            resources.append("gpp_init")
+        elif directory.startswith("gcc."):
+            resources.append("gcc_init")
+        # The TLS and debugging tests depend on resources that check
+        # what the compiler supports.
+        for d in (os.path.join("gcc.dg", "tls"),
+                  os.path.join("g++.dg", "tls"),
+                  os.path.join("g++.dg", "debug"),
+                  os.path.join("gcc.dg", "debug")):
+            if key.startswith(d + os.sep):
+                resources.append(os.path.join(d, "init"))
+                break
+
+        # Figure out which files are tests.
+        is_test = lambda name: 0
+        if test_class is not None:
+            try:
+                pattern = self.__test_file_map[self.__file_matcher[key]]
+                is_test = re.compile(fnmatch.translate(pattern)).match
+            except KeyError:
+                pass
+
+        info = (test_class, resources, is_test)
+        self.__directory_table[directory] = info
+        return info
+
+
 
     def _IsResourceFile(self, path):
 
@@ -218,35 +520,26 @@ class GCCDatabase(FileDatabase):
         
     def _IsSuiteFile(self, path):
 
-        # All directories are suites.
-        return os.path.isdir(path)
+        # All directories are suites.  The index knows which entries
+        # are directories, so there is no need to examine 'path'.
+        return self.__index.IsDirectory(path[len(self.GetRoot()) + 1:])
 
         
     def _IsTestFile(self, path):
 
-        rel_path = path[len(self.GetRoot()):]
+        rel_path = path[len(self.GetRoot()) + 1:]
+        directory, name = os.path.split(rel_path)
+        return self.__GetDirectoryInfo(directory)[2](name)
 
-        # In the gcc.dg/compat subdirectory, only tests that end with
-        # _main.c are tests.
-        if rel_path.startswith(os.sep + os.path.join("gcc.dg", "compat")):
-            return rel_path.endswith("_main.c")
+########################################################################
+# Functions
+########################################################################
 
-        # If the gcc.dg/special subdirectory, only some source files
-        # are tests.
-        if rel_path.startswith(os.sep + os.path.join("gcc.dg", "special")):
-            return fnmatch.fnmatch(rel_path, "*[1-9].c")
-                
-        if rel_path.startswith(os.path.join(os.sep, "gcc")):
-            return os.path.splitext(path)[1] == ".c"
+def _save_directive_indices():
+    """Write back the directive indices that have changed."""
 
-        # In the g++.dg/compat subdirectory, only tests that end with
-        # _main.C are tests.
-        if rel_path.startswith(os.sep + os.path.join("g++.dg", "compat")):
-            return rel_path.endswith("_main.C")
-                            
-        if rel_path.startswith(os.path.join(os.sep, "g++")):
-            return os.path.splitext(path)[1] == ".C"
+    for index in _directive_indices.keys():
+        index.Save()
 
-        return 0
-    
-            
+
+atexit.register(_save_directive_indices)
@@ -15,10 +15,10 @@
 # Imports
 ########################################################################
 
-import fnmatch
 from   gcc_dg_test_base import GCCDGTestBase
 from   gcc_init import GCCInit
 from   gpp_test_base import GCCTestBase
+from   source_analysis import analyze_source
 
 ########################################################################
 # Classes
@@ -152,35 +152,47 @@ class GCCDGTortureTest(GCCDGTest):
     
     def Run(self, context, result):
 
-        # This method emulates gcc-dg-runtest.
-        self._SetUp(context)
-        # Assume there are no loops in the input source.
-        options = self._torture_without_loops
-        # But if there are use the "with loops" options.
-        source = open(self._GetSourcePath())
-        for l in source.xreadlines():
-            if (fnmatch.fnmatch(l, "*for*(*")
-                or fnmatch.fnmatch(l, "*while*(*")):
+        if self._IsUnchanged(context, result):
+            return
+
+        try:
+            # This method emulates gcc-dg-runtest.
+            self._SetUp(context)
+            # Assume there are no loops in the input source.
+            options = self._torture_without_loops
+            # But if there are use the "with loops" options.
+            if analyze_source(self._GetSourcePath()).HasLoops():
                 options = self._torture_with_loops
-                break
-        for o in options:
-            # See if there is any reason to expect this test to fail.
-            # See check_conditional_xfail in DejaGNU for the code
-            # being emulated here.
-            target = self._GetTarget(context)
-            for tgts, r_opt, f_opt in self._xfail_if:
-                # Check the target.
-                tgt_match = 0
-                for t in tgts:
-                    if fnmatch.fnmatch(target, t):
-                        tgt_match = 1
-                        break
-                if not tgt_match:
-                    continue
-
-                raise NotImplementedError
-            # Run the test.
-            self._RunDGTest(o, self._default_options, context, result)
+            # The option sets are independent of one another, so they
+            # may be run concurrently.
+            self._RunVariants(context, result,
+                              GCCDGTortureTest.__RunOptions, options)
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
+
+
+    def __RunOptions(self, context, result, o):
+        """Run the test with one set of options.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'o' -- The list of options to use."""
+
+        # See if there is any reason to expect this test to fail.
+        # See check_conditional_xfail in DejaGNU for the code
+        # being emulated here.
+        for tgts, r_opt, f_opt in self._xfail_if:
+            # Check the target.
+            if not self._MatchTarget(tgts, context):
+                continue
+
+            raise NotImplementedError
+        # Run the test.
+        self._RunDGTest(o, self._default_options, context, result)
 
 
     def _DGxfail_if(self, line_num, args, context):
@@ -13,10 +13,12 @@
 
 from   compiler import Compiler
 from   dg_test import DGTest
+import fnmatch
 from   gcc_test_base import GCCTestBase
 import os
-from   qm.executable import Filter
 import re
+from   scan_engine import ScanEngine
+import threading
 
 ########################################################################
 # Classes
@@ -59,11 +61,47 @@ class GCCDGTestBase(DGTest):
 
     _default_options = None
     """The default set of compiler options to use when running tests."""
+
+    _use_scratch_directory = 1
+    """True if output files may be placed in a scratch directory.
+
+    Derived classes whose tests depend on files that the compiler
+    writes beside its output, rather than in the working directory,
+    should set this to false."""
+
+    __scan_engine = None
+    """The 'ScanEngine' for the current output files, or 'None'."""
+
+    __target_selectors = {}
+    """A map from '(target, selector)' pairs to selector codes.
+
+    Each entry gives the value returned by '_ParseTargetSelector' for
+    the 'selector' when testing 'target'.  The value depends only on
+    the target configuration, which does not change during a run, so
+    the table is shared by all tests."""
+
+    __target_patterns = {}
+    """A map from '(target, patterns)' pairs to booleans.
+
+    Each entry gives the value returned by '_MatchTarget' for the
+    tuple of 'patterns' when testing 'target'.  Like
+    '__target_selectors', this table is shared by all tests."""
+
+    __target_lock = threading.Lock()
+    """The lock protecting '__target_selectors' and '__target_patterns'."""
     
     def Run(self, context, result):
 
-        self._SetUp(context)
-        self._RunDGTest([], self._default_options, context, result)
+        if self._IsUnchanged(context, result):
+            return
+
+        try:
+            self._SetUp(context)
+            self._RunDGTest([], self._default_options, context, result)
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
                         
 
     def _ExecuteFinalCommand(self, command, args, context, result):
@@ -82,8 +120,8 @@ class GCCDGTestBase(DGTest):
             output_file = self._GetOutputFile(context,
                                               self.KIND_COMPILE,
                                               self.GetId())
-            output = open(output_file).read()
-            c = len(re.findall(pattern, output))
+            c = self.__GetScanEngine().Count(output_file,
+                                             self._CompilePattern(pattern))
 
             message = (self.GetId() + " scan-assembler-times %s %d"
                        % (pattern, count))
@@ -104,10 +142,14 @@ class GCCDGTestBase(DGTest):
                                                 self.GetId()),
                             args)
         elif command in ("scan-file", "scan-file-not"):
+            # The file, typically a dump, is written beside the output
+            # file.
+            output_file = self._GetOutputFile(context, self._kind,
+                                              self.GetId())
             self.__ScanFile(result,
                             context,
                             command,
-                            os.path.join(context.GetTemporaryDirectory(),
+                            os.path.join(os.path.dirname(output_file),
                                          args[0]),
                             args[1:])
         else:
@@ -145,6 +187,60 @@ class GCCDGTestBase(DGTest):
         self.__additional_source_files = args[0].split()
 
 
+    def _ParseTargetSelector(self, selector, context):
+
+        # Many directives in many tests use the same selectors, so the
+        # result for each selector is computed only once.
+        key = (self._GetTarget(context), selector)
+        self.__target_lock.acquire()
+        try:
+            code = self.__target_selectors.get(key)
+        finally:
+            self.__target_lock.release()
+        if code is None:
+            code = DGTest._ParseTargetSelector(self, selector, context)
+            self.__target_lock.acquire()
+            try:
+                self.__target_selectors[key] = code
+            finally:
+                self.__target_lock.release()
+        return code
+
+
+    def _MatchTarget(self, patterns, context):
+        """Return true if the target matches one of 'patterns'.
+
+        'patterns' -- A sequence of 'fnmatch' patterns, such as the
+        target list in a 'dg-xfail-if' directive.
+
+        'context' -- The 'Context' in which the test is running.
+
+        returns -- True iff the target triple matches at least one of
+        the 'patterns'.  The result is computed only once for each
+        sequence of 'patterns', and the patterns are compiled using
+        the shared pattern cache."""
+
+        target = self._GetTarget(context)
+        key = (target, tuple(patterns))
+        self.__target_lock.acquire()
+        try:
+            match = self.__target_patterns.get(key)
+        finally:
+            self.__target_lock.release()
+        if match is None:
+            match = 0
+            for p in patterns:
+                if self._CompilePattern(fnmatch.translate(p)).match(target):
+                    match = 1
+                    break
+            self.__target_lock.acquire()
+            try:
+                self.__target_patterns[key] = match
+            finally:
+                self.__target_lock.release()
+        return match
+
+
     def _PruneOutput(self, output):
 
         # This function emulates prune_gcc_output.
@@ -155,6 +251,8 @@ class GCCDGTestBase(DGTest):
 
         # This method emulates g++-dg-test.
 
+        # The output files are about to be rewritten.
+        self.__ResetScanEngine()
         source_files = [path]
         if self.__additional_source_files:
             dirname = os.path.dirname(path)
@@ -197,7 +295,15 @@ class GCCDGTestBase(DGTest):
             file = os.path.splitext(file)[0]
         file += ext
 
-        return os.path.join(context.GetTemporaryDirectory(), file)
+        # Executables are kept in the temporary directory, since the
+        # scratch directory may be on a file system that does not
+        # permit running programs.
+        if (self._use_scratch_directory
+            and kind not in (DGTest.KIND_LINK, DGTest.KIND_RUN)):
+            directory = self._GetScratchDirectory(context)
+        else:
+            directory = context.GetTemporaryDirectory()
+        return os.path.join(directory, file)
 
 
     def __ScanFile(self, result, context, command, output_file, args):
@@ -231,13 +337,12 @@ class GCCDGTestBase(DGTest):
 
         # See if the pattern appears in the output.
         pattern = args[0]
-        output = open(output_file).read()
         # Run the output through the demangler, if necessary.
-        if command in ("scan-assembler-dem", "scan-assembler-dem-not"):
-            executable = Filter(output)
-            executable.Run(["c++filt"])
-            output = executable.stdout
-        m = re.search(pattern, output)
+        demangle = command in ("scan-assembler-dem",
+                               "scan-assembler-dem-not")
+        m = self.__GetScanEngine().Search(output_file,
+                                          self._CompilePattern(pattern),
+                                          demangle)
 
         # Command names that end with "not" indicate negative tests.
         positive = not command.endswith("not")
@@ -260,4 +365,28 @@ class GCCDGTestBase(DGTest):
     def _SetUp(self, context):
 
         self.__additional_source_files = None
+        self.__scan_engine = None
         super(GCCDGTestBase, self)._SetUp(context)
+
+
+    def __GetScanEngine(self):
+        """Return the 'ScanEngine' for the current output files.
+
+        returns -- The 'ScanEngine' used to evaluate 'dg-final'
+        directives.  The engine is created when first needed, and
+        discarded by '__ResetScanEngine'."""
+
+        if self.__scan_engine is None:
+            self.__scan_engine = ScanEngine()
+        return self.__scan_engine
+
+
+    def __ResetScanEngine(self):
+        """Discard the 'ScanEngine', if any.
+
+        This method must be called before the output files are
+        rewritten."""
+
+        if self.__scan_engine is not None:
+            self.__scan_engine.Close()
+            self.__scan_engine = None
@@ -48,7 +48,7 @@ class GCCInit(Resource, GCCTestBase, DejaGNUBase):
 
         # Run small test programs to figure out what features are
         # supported.
-        for test, mode, options, property in \
+        programs = \
             (("void f() __attribute__((weak));\n",
               GCCTestBase.KIND_COMPILE,
               [],
@@ -64,14 +64,38 @@ class GCCInit(Resource, GCCTestBase, DejaGNUBase):
              ("void f() __attribute__((dllimport));\n",
               GCCTestBase.KIND_COMPILE,
               [],
-              self.SUPPORTS_DLL_CONTEXT_PROPERTY)):
+              self.SUPPORTS_DLL_CONTEXT_PROPERTY))
+        probes = []
+        for test, mode, options, property in programs:
+            probes.append(([test, mode] + options,
+                           self.__MakeProbe(test, mode, options)))
+        answers = self._RunProbes(context, result, probes)
+        for i in xrange(len(programs)):
+            context[programs[i][3]] = answers[i]
+
+
+    def __MakeProbe(self, test, mode, options):
+        """Return a function that compiles a test program.
+
+        'test' -- The source code for the test program.
+
+        'mode' -- The kind of compilation to perform.
+
+        'options' -- A list of additional options to use.
+
+        returns -- A function suitable for use with '_RunProbes'.  Its
+        answer is true iff the program compiled without diagnostics."""
+
+        def probe(resource, context, result):
             basename = os.path.join(context.GetTemporaryDirectory(),
-                                    self.GetId())
+                                    resource.GetId())
             source_file = basename + ".c"
             asm_file = basename + ".s"
             f = open(source_file, "w")
             f.write(test)
             f.close()
-            output = self._Compile(context, result, [source_file], asm_file,
-                                   mode, options)
-            context[property] = not output
+            output = resource._Compile(context, result, [source_file],
+                                       asm_file, mode, options)
+            return not output
+
+        return probe
@@ -15,11 +15,20 @@
 # Imports
 ########################################################################
 
+from   compile_batcher import get_batcher
+from   compile_server import get_server
 from   compiler import Compiler, GCC
 from   dejagnu_test import DejaGNUTest
 from   dg_test import DGTest
+from   fingerprint import FingerprintStore, hash_strings, \
+                          toolchain_identity
 import os
+from   parallel import CounterSet, run_variants
+from   pattern_cache import PatternCache
+from   qm.test.result import Result
 import re
+from   result_cache import CompileCache, ProbeCache
+from   scratch_space import get_scratch_space
 
 ########################################################################
 # Classes
@@ -84,6 +93,104 @@ class GCCTestBase:
         }
     """A map from DejaGNU compilation modes to 'Compiler' modes."""
 
+    __batch_suffix_map = {
+        Compiler.MODE_COMPILE : ".s",
+        Compiler.MODE_ASSEMBLE : ".o",
+        }
+    """A map from 'Compiler' modes to output file suffixes.
+
+    Compilations in these modes may be batched.  The suffix is the one
+    the compiler uses when no output file is specified."""
+
+    _pattern_cache = PatternCache()
+    """The cache of compiled regular expressions.
+
+    This cache is shared by all test classes.  It is used for patterns
+    that are not known until a test is run, such as those appearing in
+    'scan-assembler' directives."""
+
+    _compile_cache_context_property = "GCCTest.compile_cache_dir"
+    """The name of the context property giving the compile cache.
+
+    If the context contains a property with this name, its value is
+    the path to a directory in which the results of compilations are
+    cached.  Compilations whose results are already in the cache are
+    replayed instead of being run again."""
+
+    _compile_server_context_property = "GCCTest.compile_server_workers"
+    """The name of the context property giving the compile server size.
+
+    If the context contains a property with this name, and its value
+    is a positive integer, compilers are run by a 'CompileServer' with
+    that many worker processes, rather than directly by the QMTest
+    process."""
+
+    _compile_batch_context_property = "GCCTest.compile_batch_size"
+    """The name of the context property giving the compile batch size.
+
+    If the context contains a property with this name, and its value
+    is greater than one, compilations of a single source file that
+    are run at the same time with the same options are combined into
+    a single compiler command compiling up to that many files, using
+    a 'CompileBatcher'.  The outcome of each test is unchanged."""
+
+    _parallel_jobs_context_property = "GCCTest.parallel_jobs"
+    """The name of the context property giving the number of variants.
+
+    If the context contains a property with this name, its value is
+    the maximum number of variants of a single test (such as the
+    option sets of a torture test) that may be run at once."""
+
+    _result_methods = ("_RecordDejaGNUOutcome",
+                       "_RecordCommand",
+                       "_RecordCommandOutput")
+    """The methods that record information in the 'Result'.
+
+    When variants of a test are run concurrently, calls to these
+    methods are deferred until all of the variants have finished."""
+
+    _fingerprint_dir_context_property = "GCCTest.fingerprint_dir"
+    """The name of the context property giving the fingerprint store.
+
+    If the context contains a property with this name, its value is
+    the path to a directory in which the fingerprints of passing tests
+    are recorded.  A test whose fingerprint has not changed since it
+    last passed is not run again.  Such a test is reported as
+    'UNTESTED', with the annotation 'GCCTest.skipped_unchanged', so
+    that it is not mistaken for a test that passed.
+
+    This mode is off by default, and is not safe for qualifying a
+    compiler.  The fingerprint covers the test sources, the headers
+    that they include from their own directories, the toolchain, and
+    the options, but not, for example, headers found through '-I'
+    options in the test, or the target on which tests are run.  It is
+    intended for use while developing the compiler."""
+
+    _probe_cache_context_property = "GCCTest.probe_cache_dir"
+    """The name of the context property giving the probe cache.
+
+    If the context contains a property with this name, its value is
+    the path to a directory in which the answers to feature probes are
+    stored, keyed by the compiler and its options.  Probes whose
+    answers are already stored are not run again."""
+
+    _scratch_dir_context_property = "GCCTest.scratch_dir"
+    """The name of the context property giving the scratch directory.
+
+    If the context contains a property with this name, its value is
+    the path to a directory, typically on a RAM-backed file system
+    such as '/dev/shm', in which the intermediate files produced by
+    tests are placed instead of in the temporary directory."""
+
+    _scratch_budget_context_property = "GCCTest.scratch_budget"
+    """The name of the context property giving the scratch budget.
+
+    If the context contains a property with this name, its value is
+    the number of megabytes that the files in the scratch directory
+    may occupy.  Once the budget is exhausted, tests place their
+    intermediate files in their temporary directories instead.  If
+    the property is not present, the budget is 256 megabytes."""
+
     def _RecordPass(self, result, testcase, cflags):
         """Emulate '${tool}_pass'.
 
@@ -176,8 +283,41 @@ class GCCTestBase:
 
         # Run the compiler.
         index = self._RecordCommand(result, command)
-        status, output \
-           = compiler.ExecuteCommand(context.GetTemporaryDirectory(), command)
+        directory = context.GetTemporaryDirectory()
+        workers = 0
+        if context.has_key(self._compile_server_context_property):
+            workers = int(context[self._compile_server_context_property])
+        if workers > 0:
+            run = get_server(workers).Execute
+        else:
+            run = compiler.ExecuteCommand
+        execute = lambda: run(directory, command)
+        batch_size = 0
+        if context.has_key(self._compile_batch_context_property):
+            batch_size = int(context[self._compile_batch_context_property])
+        if (batch_size > 1 and len(source_files) == 1
+            and self.__batch_suffix_map.has_key(mode)):
+            batcher = get_batcher(batch_size)
+            suffix = self.__batch_suffix_map[mode]
+            execute = lambda: batcher.Execute(directory, command,
+                                              source_files[0], output_file,
+                                              suffix, run)
+        if context.has_key(self._compile_cache_context_property):
+            cache = CompileCache(
+                context[self._compile_cache_context_property])
+            scratch_directory = None
+            space = self.__GetScratchSpace(context)
+            if space is not None:
+                scratch_directory = space.Find(directory)
+            status, output, hit = cache.Run(command, directory,
+                                            source_files, output_file,
+                                            execute, scratch_directory)
+            if hit:
+                self._GetCounters().Increment("GCCTest.compile_cache_hits")
+            elif hit is not None:
+                self._GetCounters().Increment("GCCTest.compile_cache_misses")
+        else:
+            status, output = execute()
         self._RecordCommandOutput(result, index, status, output)
                     
         # If there was no output, DejaGNU uses the exit status.
@@ -228,3 +368,277 @@ class GCCTestBase:
 
         
     
+
+
+    def _IsUnchanged(self, context, result):
+        """Return true if this test need not be run.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        returns -- True iff the test passed the last time that it was
+        run with the same fingerprint.  The fingerprint covers the
+        source files for the test, the toolchain, as computed by
+        'toolchain_identity', and the options that affect the test.  If
+        true is returned, the 'result' has been updated to indicate
+        that the test was skipped: its outcome is 'UNTESTED', and the
+        annotation 'GCCTest.skipped_unchanged' is set.
+
+        Test classes should call this method at the beginning of 'Run'
+        and '_RecordFingerprint' at the end."""
+
+        self.__fingerprint = None
+        if not context.has_key(self._fingerprint_dir_context_property):
+            return 0
+        database = self.GetDatabase()
+        if not hasattr(database, "GetTestFingerprint"):
+            return 0
+        test_fingerprint = database.GetTestFingerprint(self.GetId())
+        if test_fingerprint is None:
+            return 0
+
+        compiler = context["CompilerTable.compilers"][self._language]
+        options = self._GetFingerprintOptions(context)
+        identity = toolchain_identity(compiler.GetPath(), options)
+        if identity is None:
+            return 0
+        self.__fingerprint = hash_strings([test_fingerprint, identity]
+                                          + options)
+        store = FingerprintStore(
+            context[self._fingerprint_dir_context_property])
+        if not store.IsUnchanged(self.GetId(), self.__fingerprint):
+            return 0
+        result.SetOutcome(Result.UNTESTED,
+                          "Test unchanged since it last passed.")
+        result["GCCTest.skipped_unchanged"] = "true"
+        return 1
+
+
+    def _RecordFingerprint(self, context, result):
+        """Record the fingerprint of this test, if it passed.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        If the test did not pass, any previously recorded fingerprint
+        is removed, so that the test will be run again next time."""
+
+        if self.__fingerprint is None:
+            return
+        store = FingerprintStore(
+            context[self._fingerprint_dir_context_property])
+        if result.GetOutcome() == Result.PASS:
+            store.Record(self.GetId(), self.__fingerprint)
+        else:
+            store.Forget(self.GetId())
+
+
+    def _GetFingerprintOptions(self, context):
+        """Return the settings that affect the outcome of this test.
+
+        'context' -- The 'Context' in which the test is running.
+
+        returns -- A list of strings to be included in the fingerprint
+        of the test.  The list contains the global compiler options,
+        the library directories, and the target triplet.  Derived
+        classes that use other options must extend this list."""
+
+        compiler = context["CompilerTable.compilers"][self._language]
+        if self._options_context_property is not None:
+            options = list(context[self._options_context_property])
+        else:
+            options = list(compiler.GetOptions())
+        if self._libdir_context_property is not None:
+            options += context[self._libdir_context_property]
+        if context.has_key("DejaGNUTest.target"):
+            options.append(context["DejaGNUTest.target"])
+        return options
+
+
+    def _CompilePattern(self, pattern, flags = 0):
+        """Return the compiled form of 'pattern'.
+
+        'pattern' -- A regular expression, as a string.
+
+        'flags' -- Flags to pass to 're.compile'.
+
+        returns -- The compiled regular expression, from the shared
+        '_pattern_cache'.  The number of cache hits and misses incurred
+        by this test are recorded by '_RecordStatistics'."""
+
+        regexp, hit = self._pattern_cache.Lookup(pattern, flags)
+        if hit:
+            self._GetCounters().Increment("GCCTest.pattern_cache_hits")
+        else:
+            self._GetCounters().Increment("GCCTest.pattern_cache_misses")
+        return regexp
+
+
+    def _GetCounters(self):
+        """Return the statistics gathered while running this test.
+
+        returns -- A 'CounterSet'.  The counters are shared with any
+        variants of the test run by '_RunVariants'."""
+
+        try:
+            return self.__counters
+        except AttributeError:
+            self.__counters = CounterSet()
+            return self.__counters
+
+
+    def _RecordStatistics(self, result):
+        """Annotate 'result' with the statistics for this test.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        The number of hits and misses in the pattern cache and the
+        compile cache are recorded in annotations such as
+        'GCCTest.pattern_cache_hits'."""
+
+        self._GetCounters().Annotate(result)
+
+
+    def _RunVariants(self, context, result, function, variants,
+                     isolate = 1):
+        """Run several independent variants of this test.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'result' -- The QMTest 'Result' for the test.
+
+        'function' -- A callable taking four arguments: a test, a
+        context, a result, and one of the 'variants'.  It runs the
+        variant, using the test, context, and result provided.
+
+        'variants' -- A sequence of values, one for each variant.
+
+        'isolate' -- If true, each variant is run in its own temporary
+        directory.  If false, the variants share the temporary
+        directory of the test, and must not use the same files.
+
+        If the context property named by
+        '_parallel_jobs_context_property' is greater than one, up to
+        that many variants are run at once, as described in
+        'run_variants'.  Otherwise, the variants are run one at a time.
+        Either way, the 'result' is the same as if the variants had
+        been run in order."""
+
+        workers = 1
+        if context.has_key(self._parallel_jobs_context_property):
+            workers = int(context[self._parallel_jobs_context_property])
+        # Make sure that the variants share the counters.
+        self._GetCounters()
+        run_variants(self, context, result, function, variants, workers,
+                     self._result_methods, isolate)
+
+
+    def _RunProbes(self, context, result, probes):
+        """Run feature probes, and return their answers.
+
+        'context' -- The 'Context' in which the probes are run.
+
+        'result' -- The QMTest 'Result' for the resource running the
+        probes.
+
+        'probes' -- A sequence of pairs '(description, function)'.  The
+        'description' is a sequence of strings that, together with the
+        compiler and its options, determines the answer to the probe,
+        such as the source code and options compiled.  The 'function'
+        takes three arguments: a test, a context, and a result.  It
+        runs the probe, using the objects provided, and returns the
+        answer, which must be picklable, and must not be 'None'.
+
+        returns -- A list of the answers, in the same order as the
+        'probes'.
+
+        The probes are run as variants, using '_RunVariants', so each
+        probe has its own temporary directory, and several probes may
+        be run at once.  If the context property named by
+        '_probe_cache_context_property' is present, answers are looked
+        up in, and stored in, a 'ProbeCache', keyed by the toolchain, as
+        computed by 'toolchain_identity', and the options.  If the
+        toolchain cannot be identified, the cache is not used."""
+
+        answers = [None] * len(probes)
+        keys = [None] * len(probes)
+        cache = None
+        identity = None
+        if context.has_key(self._probe_cache_context_property):
+            compiler = context["CompilerTable.compilers"][self._language]
+            options = self._GetFingerprintOptions(context)
+            identity = toolchain_identity(compiler.GetPath(), options)
+        if identity is not None:
+            cache = ProbeCache(context[self._probe_cache_context_property])
+            strings = [identity] + options
+            for i in xrange(len(probes)):
+                keys[i] = hash_strings(strings + list(probes[i][0]))
+                answers[i] = cache.Get(keys[i])
+
+        def run(test, context, result, i):
+            answers[i] = probes[i][1](test, context, result)
+
+        pending = [i for i in xrange(len(probes)) if answers[i] is None]
+        self._RunVariants(context, result, run, pending)
+        if cache is not None:
+            for i in pending:
+                cache.Set(keys[i], answers[i])
+        return answers
+
+
+    def _GetScratchDirectory(self, context):
+        """Return the directory in which to place intermediate files.
+
+        'context' -- The 'Context' in which the test is running.
+
+        returns -- The path to a directory in which the test may place
+        its intermediate files.  If the context property named by
+        '_scratch_dir_context_property' is present, and the scratch
+        budget is not exhausted, the directory is a scratch directory
+        belonging to the temporary directory of the test.  Otherwise,
+        it is the temporary directory itself.  The same directory is
+        returned until '_ReleaseScratchDirectory' is called."""
+
+        temporary_directory = context.GetTemporaryDirectory()
+        space = self.__GetScratchSpace(context)
+        if space is None:
+            return temporary_directory
+        directory = space.GetDirectory(temporary_directory)
+        if directory is None:
+            return temporary_directory
+        return directory
+
+
+    def _ReleaseScratchDirectory(self, context):
+        """Remove the scratch directories used by this test.
+
+        'context' -- The 'Context' in which the test is running.
+
+        Test classes that use '_GetScratchDirectory' should call this
+        method at the end of 'Run', once the intermediate files are no
+        longer needed.  The scratch directories used by variants of
+        the test are removed as well."""
+
+        space = self.__GetScratchSpace(context)
+        if space is not None:
+            space.Release(context.GetTemporaryDirectory())
+
+
+    def __GetScratchSpace(self, context):
+        """Return the 'ScratchSpace' to use for intermediate files.
+
+        'context' -- The 'Context' in which the test is running.
+
+        returns -- The 'ScratchSpace' given by the context, or 'None'
+        if intermediate files are to be placed in the temporary
+        directory."""
+
+        if not context.has_key(self._scratch_dir_context_property):
+            return None
+        budget = 256
+        if context.has_key(self._scratch_budget_context_property):
+            budget = int(context[self._scratch_budget_context_property])
+        return get_scratch_space(context[self._scratch_dir_context_property],
+                                 budget * 1024 * 1024)
@@ -25,6 +25,10 @@ from   gcov_test import GCOVTest
 class GPPGCOVTest(GPPDGTest, GCOVTest):
     """A 'GPPGCOVTest' is a G++ coverage test."""
 
+    _use_scratch_directory = 0
+    """The coverage data is written beside the executable, where
+    'gcov' must be able to find it."""
+
     def _ExecuteFinalCommand(self, command, args, context, result):
 
         if command == "run-gcov":
@@ -18,9 +18,11 @@
 from   compiler import CompilerExecutable
 from   compiler_table import CompilerTable
 from   dejagnu_base import DejaGNUBase
+from   gcc_test_base import GCCTestBase
 from   qm.executable import RedirectedExecutable
 from   qm.test.resource import Resource
 from   qm.test.result import Result
+from   result_cache import get_command_output
 import os
 import sys
 
@@ -52,11 +54,16 @@ class GPPInit(Resource, DejaGNUBase):
         # in use. The DejaGNU code that does this is get_multiblis in
         # libgloss.exp; this version uses a much simpler technique.
         options = compiler.GetOptions()
-        executable = CompilerExecutable()
-        executable.Run([compiler.GetPath()]
-                       + options
-                       + ['--print-multi-dir'])
-        directory = executable.stdout[:-1]
+        cache_directory = None
+        if context.has_key(GCCTestBase._probe_cache_context_property):
+            cache_directory \
+                = context[GCCTestBase._probe_cache_context_property]
+        output = get_command_output(CompilerExecutable(),
+                                    [compiler.GetPath()]
+                                    + options
+                                    + ['--print-multi-dir'],
+                                    cache_directory)
+        directory = output[:-1]
 
         # Assume that no additional library directories need to be
         # explicitly provided to the compiler. 
@@ -117,9 +124,12 @@ class GPPInit(Resource, DejaGNUBase):
         result["GPPInit.testsuite_flags_command"] \
             = result.Quote(" ".join(command))
         try:
-            executable = RedirectedExecutable()
-            executable.Run(command)
-            options = executable.stdout.split()
+            cache_directory = None
+            if context.has_key(GCCTestBase._probe_cache_context_property):
+                cache_directory \
+                    = context[GCCTestBase._probe_cache_context_property]
+            options = get_command_output(RedirectedExecutable(), command,
+                                         cache_directory).split()
         except:
             result.NoteException(cause="Could not run testsuite_flags",
                                  outcome=Result.FAIL)
@@ -0,0 +1,645 @@
+########################################################################
+#
+# File:   parallel.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   CounterSet
+#   DeferredResult
+#   VariantContext
+#   map_in_parallel
+#   run_variants
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import copy
+import os
+import shutil
+import sys
+import threading
+
+########################################################################
+# Classes
+########################################################################
+
+class CounterSet(object):
+    """A 'CounterSet' is a thread-safe set of named counters."""
+
+    def __init__(self):
+        """Construct a new 'CounterSet'.  All counters start at zero."""
+
+        self.__counts = {}
+        self.__lock = threading.Lock()
+
+
+    def Increment(self, name, amount = 1):
+        """Add 'amount' to the counter called 'name'.
+
+        'name' -- The name of the counter.
+
+        'amount' -- The amount to add."""
+
+        self.__lock.acquire()
+        try:
+            self.__counts[name] = self.__counts.get(name, 0) + amount
+        finally:
+            self.__lock.release()
+
+
+    def Annotate(self, result):
+        """Record the value of each counter in 'result'.
+
+        'result' -- A QMTest 'Result'.  Each counter is recorded as an
+        annotation whose name is the name of the counter."""
+
+        self.__lock.acquire()
+        try:
+            counts = self.__counts.items()
+        finally:
+            self.__lock.release()
+        for name, count in counts:
+            result[name] = str(count)
+
+
+
+class VariantContext(object):
+    """A 'VariantContext' gives one variant of a test its own directory.
+
+    A 'VariantContext' wraps a QMTest 'Context'.  Its
+    'GetTemporaryDirectory' method returns a directory private to the
+    variant, so that variants running concurrently do not overwrite
+    each other's files.  Properties set in a 'VariantContext' are not
+    visible in the underlying context; all other operations are
+    forwarded to it."""
+
+    def __init__(self, context, directory):
+        """Construct a new 'VariantContext'.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'directory' -- The temporary directory for the variant."""
+
+        self.__context = context
+        self.__directory = directory
+        self.__properties = {}
+
+
+    def GetTemporaryDirectory(self):
+
+        return self.__directory
+
+
+    def __getitem__(self, key):
+
+        try:
+            return self.__properties[key]
+        except KeyError:
+            return self.__context[key]
+
+
+    def __setitem__(self, key, value):
+
+        self.__properties[key] = value
+
+
+    def has_key(self, key):
+
+        return (self.__properties.has_key(key)
+                or self.__context.has_key(key))
+
+    __contains__ = has_key
+
+
+    def get(self, key, default = None):
+
+        if self.has_key(key):
+            return self[key]
+        return default
+
+
+    def __getattr__(self, name):
+
+        return getattr(self.__context, name)
+
+
+
+class DeferredResult(object):
+    """A 'DeferredResult' records changes to be made to a 'Result' later.
+
+    A variant of a test running concurrently with other variants must
+    not modify the test's 'Result' directly, since the order in which
+    the variants finish is unpredictable.  Instead, each variant is
+    given a 'DeferredResult'.  Changes to the 'DeferredResult' are
+    recorded, and later replayed onto the real 'Result' in a
+    deterministic order.  Reading a 'DeferredResult' reflects both the
+    real 'Result' and the changes recorded so far.
+
+    Only the methods defined here are recorded.  All other attributes,
+    such as 'Quote' and 'GetKind', are taken from the real 'Result',
+    so they must not modify it."""
+
+    def __init__(self, result, log):
+        """Construct a new 'DeferredResult'.
+
+        'result' -- The real 'Result'.  It is not modified.
+
+        'log' -- A list to which the recorded operations are appended.
+        Each operation is a tuple '(target, name, args, kwargs,
+        token)', as for '_VariantRecorder'."""
+
+        self.__result = result
+        self.__log = log
+        self.__annotations = {}
+        self.__outcome = None
+
+
+    def __setitem__(self, key, value):
+
+        self.__log.append(("result", "__setitem__", (key, value), {},
+                           None))
+        self.__annotations[key] = value
+
+
+    def __getitem__(self, key):
+
+        try:
+            return self.__annotations[key]
+        except KeyError:
+            return self.__result[key]
+
+
+    def has_key(self, key):
+
+        return (self.__annotations.has_key(key)
+                or self.__result.has_key(key))
+
+    __contains__ = has_key
+
+
+    def get(self, key, default = None):
+
+        if self.has_key(key):
+            return self[key]
+        return default
+
+
+    def keys(self):
+
+        keys = {}
+        for key in self.__result.keys() + self.__annotations.keys():
+            keys[key] = None
+        return keys.keys()
+
+
+    def Annotate(self, annotations):
+
+        self.__log.append(("result", "Annotate", (annotations,), {},
+                           None))
+        self.__annotations.update(annotations)
+
+
+    def SetOutcome(self, outcome, cause = None, annotations = {}):
+
+        self.__log.append(("result", "SetOutcome",
+                           (outcome, cause, annotations), {}, None))
+        self.__outcome = outcome
+        self.__annotations.update(annotations)
+
+
+    def Fail(self, cause = None, annotations = {}):
+
+        self.__log.append(("result", "Fail", (cause, annotations), {},
+                           None))
+        self.__outcome = self.__result.FAIL
+        self.__annotations.update(annotations)
+
+
+    def NoteException(self, exc_info = None, cause = None,
+                      outcome = None):
+
+        # The exception must be captured now; it will no longer be
+        # current when the call is replayed.
+        if exc_info is None:
+            exc_info = sys.exc_info()
+        if outcome is None:
+            outcome = self.__result.ERROR
+        self.__log.append(("result", "NoteException",
+                           (exc_info, cause, outcome), {}, None))
+        self.__outcome = outcome
+
+
+    def GetOutcome(self):
+
+        if self.__outcome is not None:
+            return self.__outcome
+        return self.__result.GetOutcome()
+
+
+    def __getattr__(self, name):
+
+        return getattr(self.__result, name)
+
+
+
+class _Token(object):
+    """A '_Token' stands for a value that is not yet known.
+
+    When a variant calls a method whose call is deferred, the variant
+    receives a '_Token' in place of the return value.  When the call is
+    replayed, the real return value is substituted for the '_Token'
+    wherever it was passed to a later deferred call."""
+
+    pass
+
+
+
+class _VariantRecorder(object):
+    """A '_VariantRecorder' records the effects of one variant of a test.
+
+    The recorder keeps a log of operations of the form '(target, name,
+    args, kwargs, token)'.  If 'target' is '"result"', the operation is
+    a call to the method 'name' of the 'Result'.  If 'target' is
+    '"test"', the operation is a call to the method 'name' of the test,
+    with the 'Result' as the first argument, and 'token' stands for the
+    value it returned."""
+
+    def __init__(self, result):
+        """Construct a new '_VariantRecorder'.
+
+        'result' -- The real 'Result'."""
+
+        self.__log = []
+        self.result = DeferredResult(result, self.__log)
+
+
+    def Intercept(self, test, methods):
+        """Arrange for calls to 'methods' of 'test' to be deferred.
+
+        'test' -- The test object, which must be a clone private to
+        this variant.
+
+        'methods' -- The names of the methods to intercept.  Each
+        method must take the 'Result' as its first argument."""
+
+        for name in methods:
+            setattr(test, name, self.__MakeRecorder(name))
+
+
+    def Replay(self, test, result):
+        """Perform the recorded operations.
+
+        'test' -- The original test object.
+
+        'result' -- The real 'Result'."""
+
+        values = {}
+        for target, name, args, kwargs, token in self.__log:
+            real_args = []
+            for a in args:
+                if isinstance(a, _Token):
+                    a = values[a]
+                real_args.append(a)
+            if target == "result":
+                getattr(result, name)(*real_args, **kwargs)
+            else:
+                values[token] = getattr(test, name)(result, *real_args,
+                                                    **kwargs)
+
+
+    def __MakeRecorder(self, name):
+        """Return a function that records calls to the method 'name'.
+
+        'name' -- The name of a method.
+
+        returns -- A function with the same signature as the method."""
+
+        def record(result, *args, **kwargs):
+            token = _Token()
+            self.__log.append(("test", name, args, kwargs, token))
+            return token
+        return record
+
+########################################################################
+# Functions
+########################################################################
+
+def map_in_parallel(function, items, workers):
+    """Apply 'function' to each of the 'items', using several threads.
+
+    'function' -- A callable taking a single argument.
+
+    'items' -- A sequence of arguments for 'function'.
+
+    'workers' -- The maximum number of threads to use.  If this value
+    is less than two, 'function' is applied to the 'items' serially,
+    in the calling thread.
+
+    returns -- A list of the values returned by 'function', in the
+    same order as the corresponding 'items'.  The order in which the
+    'items' are processed is unspecified.  If 'function' raises an
+    exception for any of the 'items', the exception for the first
+    such item is re-raised once all of the threads have finished."""
+
+    items = list(items)
+    if workers < 2 or len(items) < 2:
+        return map(function, items)
+
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    # The index of the next item to process.
+    next_item = [0]
+    lock = threading.Lock()
+
+    def work():
+        while 1:
+            lock.acquire()
+            try:
+                i = next_item[0]
+                next_item[0] = i + 1
+            finally:
+                lock.release()
+            if i >= len(items):
+                return
+            try:
+                results[i] = function(items[i])
+            except:
+                errors[i] = sys.exc_info()
+
+    threads = []
+    for i in xrange(min(workers, len(items))):
+        thread = threading.Thread(target = work)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error[0], error[1], error[2]
+    return results
+
+
+def run_variants(test, context, result, function, variants, workers,
+                 methods, isolate = 1):
+    """Run several independent variants of 'test' concurrently.
+
+    'test' -- The test being run.
+
+    'context' -- The 'Context' in which the test is running.
+
+    'result' -- The 'Result' for the test.
+
+    'function' -- A callable taking four arguments: a test, a context,
+    a result, and one of the 'variants'.  It runs the variant.
+
+    'variants' -- A sequence of values, one for each variant.
+
+    'workers' -- The maximum number of variants to run at once.  If
+    this value is less than two, 'function' is called with 'test',
+    'context', and 'result' for each variant in turn.
+
+    'methods' -- The names of the methods of 'test' that modify the
+    'result'.  Each method must take the 'result' as its first
+    argument.
+
+    'isolate' -- If true, each variant is given its own temporary
+    directory, which is removed once the variant has finished.  If
+    false, the variants share the temporary directory of the test,
+    and so must not use the same files; the files they create are
+    left for the caller.
+
+    When variants are run concurrently, each variant is run on a
+    shallow copy of 'test' whose list and dictionary attributes have
+    been copied too.  The variant is given a 'VariantContext', whose
+    temporary directory is as described above, and a
+    'DeferredResult'.  Calls to the
+    'methods' and changes to the result are recorded, and replayed
+    onto the real 'test' and 'result' once all of the variants have
+    finished, in the order of the 'variants'.  Thus, the 'result' is
+    the same as if the variants had been run one after another.
+
+    If a variant raises an exception, the effects of the preceding
+    variants are replayed, and then the exception is re-raised."""
+
+    variants = list(variants)
+    if workers < 2 or len(variants) < 2:
+        for v in variants:
+            function(test, context, result, v)
+        return
+
+    temporary_directory = context.GetTemporaryDirectory()
+
+    def run(index):
+        clone = copy.copy(test)
+        for name, value in clone.__dict__.items():
+            if isinstance(value, list):
+                clone.__dict__[name] = list(value)
+            elif isinstance(value, dict):
+                clone.__dict__[name] = value.copy()
+        recorder = _VariantRecorder(result)
+        recorder.Intercept(clone, methods)
+        if isolate:
+            directory = os.path.join(temporary_directory,
+                                     "variant%d" % index)
+        else:
+            directory = temporary_directory
+        try:
+            if isolate:
+                os.mkdir(directory)
+            function(clone, VariantContext(context, directory),
+                     recorder.result, variants[index])
+        except:
+            return recorder, directory, sys.exc_info()
+        return recorder, directory, None
+
+    outcomes = map_in_parallel(run, range(len(variants)), workers)
+    error = None
+    for recorder, directory, exc_info in outcomes:
+        if error is None:
+            recorder.Replay(test, result)
+            error = exc_info
+        if isolate:
+            shutil.rmtree(directory, 1)
+    if error is not None:
+        raise error[0], error[1], error[2]
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import tempfile
+import unittest
+
+class _Result(object):
+    """A '_Result' has the parts of a QMTest 'Result' used by tests."""
+
+    PASS = "PASS"
+    FAIL = "FAIL"
+    ERROR = "ERROR"
+
+    def __init__(self):
+        self.outcome = self.PASS
+        self.annotations = {}
+
+    def GetOutcome(self):
+        return self.outcome
+
+    def SetOutcome(self, outcome, cause = None, annotations = {}):
+        self.outcome = outcome
+        self.annotations.update(annotations)
+
+    def Fail(self, cause = None, annotations = {}):
+        self.SetOutcome(self.FAIL, cause, annotations)
+
+    def NoteException(self, exc_info = None, cause = None,
+                      outcome = ERROR):
+        self.SetOutcome(outcome, cause, {"exception": str(exc_info[1])})
+
+    def Quote(self, string):
+        return "<pre>%s</pre>" % string
+
+    def __setitem__(self, key, value):
+        self.annotations[key] = value
+
+    def __getitem__(self, key):
+        return self.annotations[key]
+
+    def has_key(self, key):
+        return self.annotations.has_key(key)
+
+    def keys(self):
+        return self.annotations.keys()
+
+
+
+class _Context(dict):
+    """A '_Context' has the parts of a QMTest 'Context' used by tests."""
+
+    def __init__(self, directory):
+        dict.__init__(self)
+        self.directory = directory
+
+    def GetTemporaryDirectory(self):
+        return self.directory
+
+
+
+class _Test(object):
+
+    def __init__(self):
+        self.log = []
+
+    def _Record(self, result, value):
+        self.log.append(value)
+        result[value] = "recorded"
+        return value
+
+
+
+class _ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.context = _Context(self.directory)
+        self.result = _Result()
+        self.result["existing"] = "yes"
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def runVariants(self, function, variants):
+        test = _Test()
+        run_variants(test, self.context, self.result, function, variants,
+                     4, ("_Record",))
+        return test
+
+    def testMapInParallel(self):
+        self.failUnlessEqual(map_in_parallel(lambda x: x * 2, range(10), 3),
+                             range(0, 20, 2))
+        def fail(x):
+            if x % 3 == 2:
+                raise ValueError, x
+            return x
+        try:
+            map_in_parallel(fail, range(10), 3)
+        except ValueError, e:
+            self.failUnlessEqual(e.args, (2,))
+        else:
+            self.fail("no exception raised")
+
+    def testReplayOrder(self):
+        def function(test, context, result, v):
+            test._Record(result, "record%d" % v)
+            result["v%d" % v] = str(v)
+            if v == 2:
+                result.Fail("variant 2")
+        test = self.runVariants(function, range(4))
+        self.failUnlessEqual(test.log, ["record0", "record1", "record2",
+                                        "record3"])
+        self.failUnlessEqual(self.result.GetOutcome(), _Result.FAIL)
+        self.failUnlessEqual(self.result["v3"], "3")
+        self.failUnlessEqual(self.result["record1"], "recorded")
+
+    def testReads(self):
+        reads = {}
+        def function(test, context, result, v):
+            result["mine%d" % v] = "1"
+            reads[v] = (result.GetOutcome(), result.Quote("x"),
+                        result.has_key("existing"), result["existing"],
+                        result.get("missing", "default"),
+                        result.has_key("mine%d" % v),
+                        result.has_key("mine%d" % (1 - v)))
+            keys = result.keys()
+            keys.sort()
+            reads[v] += (keys,)
+        self.runVariants(function, range(2))
+        for v in range(2):
+            self.failUnlessEqual(reads[v],
+                                 (_Result.PASS, "<pre>x</pre>", 1, "yes",
+                                  "default", 1, 0,
+                                  ["existing", "mine%d" % v]))
+
+    def testDeferredOutcome(self):
+        outcomes = {}
+        def function(test, context, result, v):
+            if v == 0:
+                try:
+                    raise ValueError, "oops"
+                except ValueError:
+                    result.NoteException(cause = "error")
+            outcomes[v] = result.GetOutcome()
+            # The real result is not changed until the variants finish.
+            outcomes[v, "real"] = self.result.GetOutcome()
+        self.runVariants(function, range(2))
+        self.failUnlessEqual(outcomes, {0: _Result.ERROR,
+                                        (0, "real"): _Result.PASS,
+                                        1: _Result.PASS,
+                                        (1, "real"): _Result.PASS})
+        self.failUnlessEqual(self.result.GetOutcome(), _Result.ERROR)
+        self.failUnlessEqual(self.result["exception"], "oops")
+
+    def testVariantContext(self):
+        directories = {}
+        def function(test, context, result, v):
+            context["property"] = v
+            directories[v] = context.GetTemporaryDirectory()
+            self.failUnless(os.path.isdir(directories[v]))
+        self.runVariants(function, range(3))
+        self.failIf(self.context.has_key("property"))
+        self.failUnlessEqual(len(dict([(d, 1) for d in
+                                       directories.values()])),
+                             3)
+        for d in directories.values():
+            self.failIf(os.path.exists(d))
+
+unittest.makeSuite(_ParallelTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+########################################################################
+#
+# File:   pattern_cache.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   PatternCache
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import re
+import threading
+
+########################################################################
+# Classes
+########################################################################
+
+class PatternCache(object):
+    """A 'PatternCache' is a bounded cache of compiled regular expressions.
+
+    The 're' module keeps its own cache of compiled patterns, but that
+    cache is small and is discarded in its entirety when it fills up.
+    A test run uses many thousands of distinct patterns (one or more
+    for each 'scan-assembler' directive), so the 're' cache is of
+    little help.  A 'PatternCache' instead discards the least recently
+    used patterns when it becomes full.  Patterns that are known in
+    advance should instead be compiled once, as class attributes.
+
+    A 'PatternCache' may be used from several threads at once."""
+
+    def __init__(self, size = 512):
+        """Construct a new 'PatternCache'.
+
+        'size' -- The maximum number of compiled patterns to keep."""
+
+        self.__size = size
+        # A map from '(pattern, flags)' pairs to lists of the form
+        # '[stamp, regexp]'.  The 'stamp' indicates when the pattern
+        # was last used.
+        self.__patterns = {}
+        self.__stamp = 0
+        self.__lock = threading.Lock()
+
+
+    def Lookup(self, pattern, flags = 0):
+        """Return the compiled form of 'pattern'.
+
+        'pattern' -- A regular expression, as a string.
+
+        'flags' -- Flags to pass to 're.compile'.
+
+        returns -- A pair '(regexp, hit)'.  The 'regexp' is the compiled
+        regular expression.  The 'hit' is true iff the 'regexp' was
+        already present in the cache.  Raises 're.error' if 'pattern'
+        is not a valid regular expression."""
+
+        key = (pattern, flags)
+        self.__lock.acquire()
+        try:
+            self.__stamp += 1
+            entry = self.__patterns.get(key)
+            if entry is not None:
+                entry[0] = self.__stamp
+                return entry[1], 1
+        finally:
+            self.__lock.release()
+
+        # Compile the pattern without holding the lock; if two threads
+        # compile the same pattern, both results are equivalent.
+        regexp = re.compile(pattern, flags)
+
+        self.__lock.acquire()
+        try:
+            if len(self.__patterns) >= self.__size:
+                self.__Evict()
+            self.__patterns[key] = [self.__stamp, regexp]
+        finally:
+            self.__lock.release()
+        return regexp, 0
+
+
+    def __Evict(self):
+        """Discard the least recently used patterns.
+
+        About a quarter of the cache is discarded at once, so that the
+        cost of finding the least recently used patterns is amortized
+        over many insertions.  The caller must hold the lock."""
+
+        entries = [(entry[0], key)
+                   for key, entry in self.__patterns.items()]
+        entries.sort()
+        for stamp, key in entries[:max(1, self.__size / 4)]:
+            del self.__patterns[key]
@@ -50,6 +50,9 @@ class ProfileTest(DejaGNUTest):
     
     def Run(self, context, result):
 
+        if self._IsUnchanged(context, result):
+            return
+
         # Initialize.
         self._SetUp(context)
 
@@ -133,6 +136,9 @@ class ProfileTest(DejaGNUTest):
 
             raise NotImplementedError
 
+        self._RecordStatistics(result)
+        self._RecordFingerprint(context, result)
+
 
     def _Compile(self, context, result, source_files, output_file,
                  mode, options):
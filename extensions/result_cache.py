@@ -0,0 +1,821 @@
+########################################################################
+#
+# File:   result_cache.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   CompileCache
+#   ProbeCache
+#   get_command_output
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import cPickle
+from   fingerprint import find_program, hash_contents, hash_file, \
+                          hash_strings, toolchain_identity
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+########################################################################
+# Variables
+########################################################################
+
+_command_outputs = {}
+"""A map from keys computed by 'get_command_output' to outputs."""
+
+_command_outputs_lock = threading.Lock()
+"""The lock protecting '_command_outputs'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class CompileCache(object):
+    """A 'CompileCache' stores the results of compiler invocations.
+
+    The cache is keyed by the toolchain, as computed by
+    'toolchain_identity', the command line, and the contents of the
+    input files.  For each key, the cache records the exit status of
+    the compiler, the output it produced, the output file, and any
+    other files that the compiler created in its working directory,
+    such as dump files.  When the same command is run again, these
+    results are replayed without running the compiler.
+
+    A test may place its intermediate files in a scratch directory
+    rather than in the working directory.  The scratch directory is
+    treated in the same way as the working directory: its name is
+    replaced by a placeholder in the key, and the files that the
+    compiler creates there are recorded.
+
+    The inputs considered are the files named on the command line,
+    the headers they include that are found in their own directories
+    or in directories named with '-I', '-iquote', '-isystem', or '-B',
+    the libraries in directories named with '-L', and any files in the
+    working directory whose names begin with the name of an input or
+    output file (such as profile data).  Other headers are assumed to
+    be system headers, which do not change while the toolchain is
+    unchanged.
+
+    Commands whose inputs cannot be determined are never cached,
+    since their results may depend on files that are not considered.
+    These include commands that refer to the working directory in any
+    other way, commands that use options naming other files, such as
+    '-specs', and commands whose sources use '#include' with a macro
+    rather than a file name.
+
+    Entries are written atomically, so several processes may share
+    the same cache."""
+
+    _version = 3
+    """The version of the cache format.
+
+    This number must be incremented whenever the format of the cache
+    entries, or the way in which keys are computed, changes."""
+
+    __include_regexp \
+        = re.compile(r'^[ \t]*#[ \t]*(?:include_next|include|import)'
+                     r'[ \t]*(?:"([^"]+)"|<([^>]+)>|(.*))', re.M)
+    """A regular expression matching an '#include' directive.
+
+    The first match group gives the name of a file included with
+    quotes; the second gives the name of a file included with angle
+    brackets.  Otherwise, the third gives the text of a computed
+    include."""
+
+    __directory_labels = ("<directory>", "<scratch>")
+    """The names used in keys for the working and scratch directories."""
+
+    __file_options = ("-specs", "-T", "-wrapper", "-fplugin",
+                      "-fprofile-use", "-fauto-profile", "-iprefix",
+                      "-iwithprefix", "-iwithprefixbefore", "-isysroot",
+                      "--sysroot", "-imultilib")
+    """The prefixes of options that may cause other files to be read.
+
+    Commands using these options are not cached, since the files they
+    name are not considered in the key."""
+
+    def __init__(self, directory):
+        """Construct a new 'CompileCache'.
+
+        'directory' -- The path to the directory containing the cache.
+        The directory is created if it does not already exist."""
+
+        self.__directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created the directory.
+                if not os.path.isdir(directory):
+                    raise
+
+
+    def Run(self, command, directory, input_files, output_file, execute,
+            scratch_directory = None):
+        """Run a compiler 'command', or replay its results.
+
+        'command' -- The command line, as a list of strings.  The first
+        element is the compiler.
+
+        'directory' -- The directory in which the command is run.
+
+        'input_files' -- The files given to the compiler as inputs.
+        Elements that are not the names of files, such as '-l' options,
+        are ignored.
+
+        'output_file' -- The file that the command creates.
+
+        'execute' -- A callable taking no arguments that runs the
+        command and returns a pair '(status, output)'.
+
+        'scratch_directory' -- If not 'None', the scratch directory in
+        which the test places its intermediate files.
+
+        returns -- A triple '(status, output, hit)'.  The 'status' and
+        'output' are as returned by 'execute'.  The 'hit' is true iff
+        the results were replayed from the cache, false if the
+        command was run and its results stored, and 'None' if the
+        command cannot be cached."""
+
+        directories = [directory]
+        if scratch_directory not in (None, directory):
+            directories.append(scratch_directory)
+        stems = [os.path.splitext(os.path.basename(f))[0]
+                 for f in list(input_files) + [output_file]]
+        before = self.__ListDirectories(directories, stems)
+        key = self.__GetKey(command, directories, input_files, output_file,
+                            before)
+        if key is None:
+            status, output = execute()
+            return status, output, None
+
+        path = self.__GetPath(key)
+        record = self.__Load(path)
+        if record is not None:
+            status, output, has_output, side_files = record
+            if self.__Replay(path, directories, output_file, has_output,
+                             side_files):
+                return status, output, 1
+
+        status, output = execute()
+        # Find the files that the command created or changed.
+        after = self.__ListDirectories(directories, stems)
+        side_files = []
+        for (i, name), stat in after.items():
+            if (before.get((i, name)) != stat
+                and os.path.join(directories[i], name) != output_file):
+                side_files.append((i, name))
+        self.__Store(path, directories, status, output, output_file,
+                     side_files)
+        return status, output, 0
+
+
+    def __GetKey(self, command, directories, input_files, output_file,
+                 files):
+        """Return the cache key for 'command'.
+
+        'command' -- The command line, as a list of strings.
+
+        'directories' -- A list containing the directory in which the
+        command is run, and the scratch directory, if any.
+
+        'input_files' -- The files given to the compiler as inputs.
+
+        'output_file' -- The file that the command creates.
+
+        'files' -- A map describing the files in the 'directories' that
+        may be used implicitly by the command, as returned by
+        '__ListDirectories'.
+
+        returns -- The key, as a string, or 'None' if 'command' cannot
+        be cached."""
+
+        identity = toolchain_identity(command[0], command[1:])
+        if identity is None:
+            return None
+        inputs = {}
+        for f in input_files:
+            inputs[f] = None
+
+        strings = [str(self._version), identity]
+        # The directories searched for headers included with quotes and
+        # with angle brackets, and the directories containing libraries.
+        quote_path = []
+        include_path = []
+        system_path = []
+        library_path = []
+        # The files named with '-include' and '-imacros'.
+        headers = []
+        i = 1
+        while i < len(command):
+            arg = command[i]
+            i += 1
+            if arg == output_file:
+                arg = "<output>"
+            elif inputs.has_key(arg):
+                # The working and scratch directories differ from run to
+                # run.
+                for d, label in zip(directories, self.__directory_labels):
+                    arg = arg.replace(d, label)
+            elif self.__Mentions(arg, directories):
+                # The command may depend on files in the directories
+                # that are not taken into account.
+                return None
+            elif arg.startswith("@"):
+                # The options in a response file are not known.
+                return None
+            else:
+                for o in self.__file_options:
+                    if arg.startswith(o):
+                        return None
+                for o, path in (("-iquote", quote_path),
+                                ("-I", include_path),
+                                ("-isystem", system_path),
+                                ("-idirafter", system_path),
+                                ("-B", system_path),
+                                ("-include", headers),
+                                ("-imacros", headers),
+                                ("-L", library_path)):
+                    if not arg.startswith(o):
+                        continue
+                    value = arg[len(o):]
+                    if not value and i < len(command):
+                        strings.append(arg)
+                        arg = value = command[i]
+                        i += 1
+                        if self.__Mentions(value, directories):
+                            return None
+                    if o == "-B":
+                        # The driver searches the 'include' directory
+                        # under each prefix for system headers.
+                        value = os.path.join(value, "include")
+                    path.append(value)
+                    break
+            strings.append(arg)
+
+        # Hash the inputs, and the headers that they include.
+        search_path = (quote_path, include_path + system_path)
+        seen = {}
+        for f in list(input_files) + headers:
+            if os.path.isfile(f):
+                if not self.__HashSource(f, directories, search_path,
+                                         strings, seen):
+                    return None
+        # Hash the libraries that might be linked with the inputs.
+        for d in library_path:
+            try:
+                names = os.listdir(d)
+            except OSError:
+                continue
+            names.sort()
+            for name in names:
+                library = os.path.join(d, name)
+                if name.startswith("lib") and os.path.isfile(library):
+                    strings += [library, hash_file(library)]
+        # Hash the files in the working and scratch directories that
+        # might be used.
+        names = files.keys()
+        names.sort()
+        for i, name in names:
+            path = os.path.join(directories[i], name)
+            if path != output_file and not seen.has_key(path):
+                strings += [os.path.join(self.__directory_labels[i], name),
+                            hash_contents(path)]
+
+        return hash_strings(strings)
+
+
+    def __HashSource(self, path, directories, search_path, strings, seen):
+        """Add the digest of 'path', and of the headers it includes.
+
+        'path' -- The path to a source file.
+
+        'directories' -- The working and scratch directories.  Files in
+        these directories are created by the tests themselves, and may
+        be rewritten more quickly than the file system records, so
+        their contents are always read.
+
+        'search_path' -- A pair '(quote_path, bracket_path)' giving the
+        directories searched for headers included with quotes, in
+        addition to the 'bracket_path', and the directories searched
+        for headers included with angle brackets.
+
+        'strings' -- The list of strings to which the digests are
+        appended.
+
+        'seen' -- A dictionary whose keys are the files that have
+        already been hashed.
+
+        returns -- True if the headers could be found, or are assumed
+        to be system headers; false if 'path' uses a computed
+        include."""
+
+        if seen.has_key(path):
+            return 1
+        seen[path] = None
+        for d, label in zip(directories, self.__directory_labels):
+            if path.startswith(d + os.sep):
+                strings += [label + path[len(d):], hash_contents(path)]
+                break
+        else:
+            strings += [path, hash_file(path)]
+        if os.path.splitext(path)[1] in (".o", ".a", ".so"):
+            return 1
+
+        f = open(path)
+        try:
+            text = f.read()
+        finally:
+            f.close()
+        quote_path, bracket_path = search_path
+        includes = self.__include_regexp.findall(text)
+        for quoted, bracketed, computed in includes:
+            if quoted:
+                header = quoted
+                candidates = ([os.path.dirname(path)] + quote_path
+                              + bracket_path)
+            elif bracketed:
+                header = bracketed
+                candidates = bracket_path
+            else:
+                return 0
+            for d in candidates:
+                candidate = os.path.join(d, header)
+                if os.path.isfile(candidate):
+                    if not self.__HashSource(candidate, directories,
+                                             search_path, strings, seen):
+                        return 0
+                    break
+            else:
+                # The header is a system header, or does not exist.
+                strings.append(header)
+        return 1
+
+
+    def __ListDirectories(self, directories, stems):
+        """Return the files in 'directories' related to the command.
+
+        'directories' -- The working and scratch directories.
+
+        'stems' -- The basenames, without extensions, of the input and
+        output files.
+
+        returns -- A map from pairs '(index, name)' to pairs '(mtime,
+        size)'.  The map contains an entry for each file whose 'name'
+        begins with one of the 'stems' in the directory with the
+        indicated 'index' in 'directories'."""
+
+        files = {}
+        for i in xrange(len(directories)):
+            for name in os.listdir(directories[i]):
+                for s in stems:
+                    if name.startswith(s):
+                        break
+                else:
+                    continue
+                try:
+                    st = os.stat(os.path.join(directories[i], name))
+                except OSError:
+                    continue
+                files[(i, name)] = (st.st_mtime, st.st_size)
+        return files
+
+
+    def __Mentions(self, arg, directories):
+        """Return true if 'arg' refers to one of the 'directories'.
+
+        'arg' -- A command-line argument.
+
+        'directories' -- The working and scratch directories.
+
+        returns -- True iff 'arg' contains the name of one of the
+        'directories'."""
+
+        for d in directories:
+            if arg.find(d) != -1:
+                return 1
+        return 0
+
+
+    def __GetPath(self, key):
+        """Return the directory for the entry with the indicated 'key'.
+
+        'key' -- A cache key.
+
+        returns -- The path to the directory containing the entry."""
+
+        return os.path.join(self.__directory, key[:2], key)
+
+
+    def __Load(self, path):
+        """Load the record for the entry in 'path'.
+
+        'path' -- The directory containing the entry.
+
+        returns -- A tuple '(status, output, has_output, side_files)',
+        or 'None' if there is no entry."""
+
+        try:
+            f = open(os.path.join(path, "record"), "rb")
+            try:
+                return cPickle.load(f)
+            finally:
+                f.close()
+        except:
+            return None
+
+
+    def __Replay(self, path, directories, output_file, has_output,
+                 side_files):
+        """Restore the files stored in an entry.
+
+        'path' -- The directory containing the entry.
+
+        'directories' -- The working and scratch directories.
+
+        'output_file' -- The file that the command creates.
+
+        'has_output' -- True if the command created 'output_file'.
+
+        'side_files' -- The other files that the command created, as
+        pairs '(index, name)' giving the index of the directory in
+        'directories' and the name of the file.
+
+        returns -- True iff the files were restored."""
+
+        try:
+            if has_output:
+                shutil.copy2(os.path.join(path, "output"), output_file)
+            elif os.path.exists(output_file):
+                os.remove(output_file)
+            for i, name in side_files:
+                shutil.copy2(os.path.join(path, "files", str(i), name),
+                             os.path.join(directories[i], name))
+        except (IOError, OSError):
+            return 0
+        return 1
+
+
+    def __Store(self, path, directories, status, output, output_file,
+                side_files):
+        """Store the results of a command in the cache.
+
+        'path' -- The directory for the new entry.
+
+        'directories' -- The working and scratch directories.
+
+        'status' -- The exit status of the command.
+
+        'output' -- The output produced by the command.
+
+        'output_file' -- The file that the command creates.
+
+        'side_files' -- The other files that the command created, as
+        for '__Replay'.
+
+        Errors writing the cache are silently ignored; the cache is only
+        an optimization."""
+
+        parent = os.path.dirname(path)
+        temporary = None
+        try:
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            # Build the entry in a temporary directory, and then rename
+            # it, so that other processes never see a partial entry.
+            temporary = tempfile.mkdtemp(dir = parent)
+            has_output = os.path.exists(output_file)
+            if has_output:
+                shutil.copy2(output_file, os.path.join(temporary, "output"))
+            for i in xrange(len(directories)):
+                os.makedirs(os.path.join(temporary, "files", str(i)))
+            for i, name in side_files:
+                shutil.copy2(os.path.join(directories[i], name),
+                             os.path.join(temporary, "files", str(i), name))
+            f = open(os.path.join(temporary, "record"), "wb")
+            try:
+                cPickle.dump((status, output, has_output, side_files), f, 2)
+            finally:
+                f.close()
+            os.rename(temporary, path)
+            temporary = None
+        except (IOError, OSError):
+            pass
+        if temporary is not None:
+            shutil.rmtree(temporary, 1)
+
+
+
+class ProbeCache(object):
+    """A 'ProbeCache' stores the answers to feature probes.
+
+    Before running tests, the resources run small programs through the
+    compiler to find out which features are supported.  The answers
+    depend only on the compiler and its options, so they can be
+    reused by later test runs.  Each answer is stored in its own file,
+    written atomically, so several processes may share the same
+    cache."""
+
+    def __init__(self, directory):
+        """Construct a new 'ProbeCache'.
+
+        'directory' -- The path to the directory containing the cache.
+        The directory is created if it does not already exist."""
+
+        self.__directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created the directory.
+                if not os.path.isdir(directory):
+                    raise
+
+
+    def Get(self, key):
+        """Return the answer stored for 'key'.
+
+        'key' -- A string identifying the probe.
+
+        returns -- The answer, or 'None' if no answer has been
+        stored."""
+
+        try:
+            f = open(os.path.join(self.__directory, key), "rb")
+            try:
+                return cPickle.load(f)
+            finally:
+                f.close()
+        except:
+            return None
+
+
+    def Set(self, key, answer):
+        """Store the 'answer' for 'key'.
+
+        'key' -- A string identifying the probe.
+
+        'answer' -- A picklable value other than 'None'.
+
+        Errors writing the cache are silently ignored; the cache is only
+        an optimization."""
+
+        path = os.path.join(self.__directory, key)
+        temporary = "%s.%d" % (path, os.getpid())
+        try:
+            f = open(temporary, "wb")
+            try:
+                cPickle.dump(answer, f, 2)
+            finally:
+                f.close()
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+########################################################################
+# Functions
+########################################################################
+
+def get_command_output(executable, command, cache_directory = None):
+    """Return the standard output of an introspection 'command'.
+
+    'executable' -- An 'Executable' with which to run the command.
+    After it has been run, its 'stdout' attribute must give the
+    standard output of the command.
+
+    'command' -- The command, as a list of strings.  The first element
+    is the program to run.  The command must not have side effects,
+    and its output must depend only on the program and the arguments,
+    as is the case for 'gcc --print-multi-dir' and 'testsuite_flags'.
+
+    'cache_directory' -- If not 'None', the path to the directory
+    containing a 'ProbeCache' in which the output is stored.
+
+    returns -- The standard output of the command.  The output is
+    memoized, both in this process and in the 'cache_directory', keyed
+    by the location, modification time, and size of the program and
+    by the arguments, so the command is run only once for each build
+    of the program.  If the command cannot be run, the exception
+    raised by 'executable' is propagated, and nothing is stored.  If
+    the command runs but does not exit successfully, its output is
+    returned, but not stored, so that the command is run again next
+    time."""
+
+    program = find_program(command[0])
+    if program is None:
+        # Let the executable report the problem.
+        executable.Run(command)
+        return executable.stdout
+    st = os.stat(program)
+    key = hash_strings([os.path.abspath(program),
+                        str(st.st_mtime), str(st.st_size)]
+                       + list(command[1:]))
+
+    _command_outputs_lock.acquire()
+    try:
+        output = _command_outputs.get(key)
+    finally:
+        _command_outputs_lock.release()
+    if output is not None:
+        return output
+
+    cache = None
+    if cache_directory is not None:
+        cache = ProbeCache(cache_directory)
+        output = cache.Get(key)
+    if output is None:
+        status = executable.Run(command)
+        output = executable.stdout
+        if status != 0:
+            # The failure may be transient, or may depend on something
+            # other than the program and its arguments.
+            return output
+        if cache is not None:
+            cache.Set(key, output)
+
+    _command_outputs_lock.acquire()
+    try:
+        _command_outputs[key] = output
+    finally:
+        _command_outputs_lock.release()
+    return output
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import unittest
+from   fingerprint import _make_driver, _write
+
+class _CompileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.driver = _make_driver(self.directory)
+        self.cache = CompileCache(self.path("cache"))
+        self.source = self.path("src/t.c")
+        os.mkdir(self.path("src"))
+        os.mkdir(self.path("system"))
+        _write(self.source, '#include "t.h"\n')
+        _write(self.path("src/t.h"), '#include <s.h>\n')
+        _write(self.path("system/s.h"), 'int s;\n')
+        self.runs = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def compile(self, name, options = [], scratch = None):
+        """Compile the source in the working directory 'name'.
+
+        returns -- The value returned by 'CompileCache.Run'."""
+
+        directory = self.path(name)
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        output_file = os.path.join(scratch or directory, "t.s")
+        command = ([self.driver, "-S", "-isystem", self.path("system")]
+                   + options + [self.source, "-o", output_file])
+        def execute():
+            self.runs += 1
+            _write(output_file, "assembly %d" % self.runs)
+            _write(os.path.join(scratch or directory, "t.c.dump"), "dump")
+            return 1, "warning"
+        return self.cache.Run(command, directory, [self.source],
+                              output_file, execute, scratch)
+
+    def testReplay(self):
+        self.failUnlessEqual(self.compile("a"), (1, "warning", 0))
+        self.failUnlessEqual(self.compile("b"), (1, "warning", 1))
+        self.failUnlessEqual(self.runs, 1)
+        # The output file and the dump file are restored.
+        for name in ("t.s", "t.c.dump"):
+            self.failUnlessEqual(open(self.path("b/" + name)).read(),
+                                 open(self.path("a/" + name)).read())
+
+    def testInvalidation(self):
+        self.compile("a")
+        # Each header that the source uses is part of the key.
+        for name in ("src/t.h", "system/s.h"):
+            f = open(self.path(name), "a")
+            f.write("int changed;\n")
+            f.close()
+            self.failUnlessEqual(self.compile("a")[2], 0)
+        self.failUnlessEqual(self.compile("a", ["-O2"])[2], 0)
+        self.failUnlessEqual(self.runs, 4)
+        # Files in the working directory that might be used by the
+        # compiler are part of the key.
+        _write(self.path("a/t.gcda"), "profile")
+        self.failUnlessEqual(self.compile("a")[2], 0)
+
+    def testScratch(self):
+        os.mkdir(self.path("scratch1"))
+        os.mkdir(self.path("scratch2"))
+        self.compile("a", scratch = self.path("scratch1"))
+        self.failUnlessEqual(self.compile("b", scratch =
+                                          self.path("scratch2"))[2],
+                             1)
+        self.failUnless(os.path.exists(self.path("scratch2/t.c.dump")))
+        self.failIf(os.path.exists(self.path("b/t.c.dump")))
+
+    def testUncacheable(self):
+        os.mkdir(self.path("a"))
+        for options in (["-specs=x"], ["@options"],
+                        ["-I" + self.path("a")]):
+            self.failUnless(self.compile("a", options)[2] is None)
+        _write(self.path("src/t.h"), "#include HEADER\n")
+        self.failUnless(self.compile("a")[2] is None)
+        self.failUnless(self.compile("a")[2] is None)
+        self.failUnlessEqual(self.runs, 5)
+
+    def testUnknownToolchain(self):
+        self.driver = self.path("missing")
+        self.failUnless(self.compile("a")[2] is None)
+
+
+
+class _ProbeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def testProbeCache(self):
+        cache = ProbeCache(os.path.join(self.directory, "probes"))
+        self.failUnless(cache.Get("key") is None)
+        cache.Set("key", (1, "a"))
+        self.failUnlessEqual(cache.Get("key"), (1, "a"))
+        # The answer is seen by other instances, and so by later
+        # processes.
+        cache = ProbeCache(os.path.join(self.directory, "probes"))
+        self.failUnlessEqual(cache.Get("key"), (1, "a"))
+        self.failUnless(cache.Get("other") is None)
+
+
+
+class _CommandOutputTest(unittest.TestCase):
+
+    class Executable(object):
+
+        def __init__(self, status):
+            self.status = status
+            self.runs = 0
+
+        def Run(self, command):
+            self.runs += 1
+            self.stdout = "output %d" % self.runs
+            return self.status
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.driver = _make_driver(self.directory)
+        self.cache_directory = os.path.join(self.directory, "probes")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def testCommandOutput(self):
+        executable = self.Executable(0)
+        command = [self.driver, "--success"]
+        for i in xrange(2):
+            self.failUnlessEqual(get_command_output(executable, command,
+                                                    self.cache_directory),
+                                 "output 1")
+        self.failUnlessEqual(executable.runs, 1)
+        # The output is stored in the cache for use by later processes.
+        _command_outputs.clear()
+        self.failUnlessEqual(get_command_output(executable, command,
+                                                self.cache_directory),
+                             "output 1")
+        self.failUnlessEqual(executable.runs, 1)
+
+    def testFailure(self):
+        executable = self.Executable(1)
+        command = [self.driver, "--failure"]
+        for i in xrange(2):
+            get_command_output(executable, command, self.cache_directory)
+        self.failUnlessEqual(executable.runs, 2)
+
+unittest.makeSuite(_CompileCacheTest, "test")
+unittest.makeSuite(_ProbeCacheTest, "test")
+unittest.makeSuite(_CommandOutputTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+########################################################################
+#
+# File:   scan_engine.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   ScanEngine
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+from   demangler import get_demangler
+import mmap
+import os
+
+########################################################################
+# Classes
+########################################################################
+
+class ScanEngine(object):
+    """A 'ScanEngine' searches the output files of a test.
+
+    The 'dg-final' directives 'scan-assembler', 'scan-file', and their
+    variants each search an output file for a pattern.  A test often
+    contains many such directives applying to the same file.  A
+    'ScanEngine' reads each file only once, mapping it into memory
+    where possible, and evaluates all of the directives against the
+    same contents.  The demangled form of a file, used by the '-dem'
+    variants, is likewise computed only once, using the shared
+    'Demangler'.
+
+    The contents of a file are assumed not to change while the
+    'ScanEngine' is in use.  Because a mapped file must not be
+    truncated, 'Close' must be called before any of the files are
+    rewritten."""
+
+    def __init__(self):
+        """Construct a new 'ScanEngine'."""
+
+        # A map from paths to the contents of the files, either as
+        # strings or as 'mmap' objects.
+        self.__contents = {}
+        # A map from paths to the demangled contents of the files.
+        self.__demangled = {}
+
+
+    def Search(self, path, regexp, demangle = 0):
+        """Return true if 'regexp' matches the file at 'path'.
+
+        'path' -- The path to the file to search.
+
+        'regexp' -- A compiled regular expression.
+
+        'demangle' -- If true, the file is run through the demangler
+        before it is searched.
+
+        returns -- True iff 'regexp' matches somewhere in the file.
+        Raises 'IOError' if the file cannot be read."""
+
+        return regexp.search(self.__GetContents(path, demangle)) is not None
+
+
+    def Count(self, path, regexp, demangle = 0):
+        """Return the number of times 'regexp' matches the file at 'path'.
+
+        'path' -- The path to the file to search.
+
+        'regexp' -- A compiled regular expression.
+
+        'demangle' -- If true, the file is run through the demangler
+        before it is searched.
+
+        returns -- The number of non-overlapping matches for 'regexp'
+        in the file.  Raises 'IOError' if the file cannot be read."""
+
+        return len(regexp.findall(self.__GetContents(path, demangle)))
+
+
+    def Close(self):
+        """Release the files held by this 'ScanEngine'."""
+
+        for contents in self.__contents.values():
+            if isinstance(contents, mmap.mmap):
+                contents.close()
+        self.__contents = {}
+        self.__demangled = {}
+
+
+    def __GetContents(self, path, demangle):
+        """Return the contents of the file at 'path'.
+
+        'path' -- The path to the file.
+
+        'demangle' -- If true, return the demangled contents.
+
+        returns -- A string, or a buffer supporting the same regular
+        expression operations, containing the contents of 'path'."""
+
+        contents = self.__contents.get(path)
+        if contents is None:
+            contents = self.__ReadFile(path)
+            self.__contents[path] = contents
+        if not demangle:
+            return contents
+
+        demangled = self.__demangled.get(path)
+        if demangled is None:
+            demangled = get_demangler().Demangle(contents[:])
+            self.__demangled[path] = demangled
+        return demangled
+
+
+    def __ReadFile(self, path):
+        """Read the file at 'path'.
+
+        'path' -- The path to the file.
+
+        returns -- An 'mmap' object mapping the file, or, if the file
+        cannot be mapped, a string containing its contents."""
+
+        f = open(path, "rb")
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                try:
+                    return mmap.mmap(f.fileno(), size,
+                                     access = mmap.ACCESS_READ)
+                except (EnvironmentError, ValueError):
+                    pass
+            return f.read()
+        finally:
+            f.close()
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import re
+import shutil
+import tempfile
+import unittest
+
+class _ScanEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = ScanEngine()
+
+    def tearDown(self):
+        self.engine.Close()
+        shutil.rmtree(self.directory, 1)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        f = open(path, "w")
+        f.write(contents)
+        f.close()
+        return path
+
+    def testSearch(self):
+        path = self.write("t.s", "\tcall _Z3foov\n\tcall _Z3foov\n")
+        self.failUnless(self.engine.Search(path, re.compile("call")))
+        self.failIf(self.engine.Search(path, re.compile("ret")))
+        self.failUnlessEqual(self.engine.Count(path, re.compile("call")), 2)
+
+    def testDemangle(self):
+        path = self.write("t.s", "\tcall _Z3foov\n")
+        self.failUnless(self.engine.Search(path, re.compile(r"foo\(\)"), 1))
+        self.failIf(self.engine.Search(path, re.compile(r"foo\(\)")))
+        self.failUnless(self.engine.Search(path, re.compile("_Z3foov")))
+
+    def testEmpty(self):
+        path = self.write("t.s", "")
+        self.failIf(self.engine.Search(path, re.compile("x")))
+        self.failUnless(self.engine.Search(path, re.compile("^$")))
+
+    def testMissing(self):
+        self.assertRaises(IOError, self.engine.Search,
+                          os.path.join(self.directory, "missing"),
+                          re.compile("x"))
+
+    def testClose(self):
+        path = self.write("t.s", "old")
+        self.failUnless(self.engine.Search(path, re.compile("old")))
+        # After 'Close', the file may be rewritten and is read again.
+        self.engine.Close()
+        self.write("t.s", "new")
+        self.failUnless(self.engine.Search(path, re.compile("new")))
+
+unittest.makeSuite(_ScanEngineTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,323 @@
+########################################################################
+#
+# File:   scratch_space.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   ScratchSpace
+#   get_scratch_space
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
+########################################################################
+# Variables
+########################################################################
+
+_spaces = {}
+"""A map from '(path, budget)' pairs to 'ScratchSpace' instances."""
+
+_spaces_lock = threading.Lock()
+"""The lock protecting '_spaces'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class ScratchSpace(object):
+    """A 'ScratchSpace' provides directories for intermediate files.
+
+    The assembly files, object files, executables, and precompiled
+    headers produced by a test are needed only while the test runs.
+    Writing them to a disk-backed temporary directory is wasteful when
+    that disk is slow to flush.  A 'ScratchSpace' instead places them
+    in a directory on a RAM-backed file system, such as '/dev/shm'.
+
+    Each temporary directory used by a test is given its own scratch
+    directory.  The total size of the files in the scratch
+    directories is limited by a budget; once the budget is exhausted,
+    no more scratch directories are created, and the tests use their
+    temporary directories instead until space is released.  Scratch
+    directories are removed as soon as the test using them has
+    finished.
+
+    Measuring every scratch directory whenever a new one is requested
+    would be slow, so the usage is tracked incrementally.  The size of
+    each scratch directory is recorded when it is measured, and each
+    request measures only the directory measured least recently.  The
+    usage is therefore an estimate, which lags behind the files that
+    tests are writing.
+
+    A 'ScratchSpace' may be used from several threads at once."""
+
+    def __init__(self, path, budget):
+        """Construct a new 'ScratchSpace'.
+
+        'path' -- The directory in which scratch directories are
+        created.
+
+        'budget' -- The maximum number of bytes that the files in the
+        scratch directories may occupy before tests must use their
+        temporary directories instead."""
+
+        self.__path = path
+        self.__budget = budget
+        # A map from temporary directories to the corresponding
+        # scratch directories, or to 'None' if the temporary directory
+        # is to be used itself.
+        self.__directories = {}
+        # A map from scratch directories to their sizes, as last
+        # measured, and the sum of those sizes.
+        self.__sizes = {}
+        self.__usage = 0
+        # The scratch directories, in the order in which they are to
+        # be measured.
+        self.__queue = []
+        self.__lock = threading.Lock()
+
+
+    def GetDirectory(self, temporary_directory):
+        """Return the scratch directory for 'temporary_directory'.
+
+        'temporary_directory' -- The temporary directory of a test.
+
+        returns -- The path to a scratch directory that may be used in
+        place of 'temporary_directory', or 'None' if the budget is
+        exhausted.  The same value is returned every time this method
+        is called with the same 'temporary_directory', until 'Release'
+        is called."""
+
+        self.__lock.acquire()
+        try:
+            try:
+                return self.__directories[temporary_directory]
+            except KeyError:
+                pass
+            # Choose the directory to measure.
+            measured = None
+            if self.__queue:
+                measured = self.__queue.pop(0)
+                self.__queue.append(measured)
+        finally:
+            self.__lock.release()
+
+        # Measure the directory without holding the lock, as other
+        # threads may be waiting for their own directories.
+        if measured is not None:
+            size = self.__Measure(measured)
+
+        self.__lock.acquire()
+        try:
+            if (measured is not None
+                and self.__sizes.has_key(measured)):
+                self.__usage += size - self.__sizes[measured]
+                self.__sizes[measured] = size
+            try:
+                return self.__directories[temporary_directory]
+            except KeyError:
+                pass
+            directory = None
+            if self.__usage < self.__budget:
+                try:
+                    directory = tempfile.mkdtemp(dir = self.__path)
+                except EnvironmentError:
+                    pass
+            self.__directories[temporary_directory] = directory
+            if directory is not None:
+                self.__sizes[directory] = 0
+                self.__queue.append(directory)
+            return directory
+        finally:
+            self.__lock.release()
+
+
+    def Find(self, temporary_directory):
+        """Return the scratch directory for 'temporary_directory'.
+
+        'temporary_directory' -- The temporary directory of a test.
+
+        returns -- The scratch directory that 'GetDirectory' returned
+        for 'temporary_directory', or 'None' if 'GetDirectory' has not
+        been called, or did not provide a scratch directory.  Unlike
+        'GetDirectory', this method never creates a directory."""
+
+        self.__lock.acquire()
+        try:
+            return self.__directories.get(temporary_directory)
+        finally:
+            self.__lock.release()
+
+
+    def Release(self, temporary_directory):
+        """Remove the scratch directories for 'temporary_directory'.
+
+        'temporary_directory' -- The temporary directory of a test.
+
+        The scratch directories for 'temporary_directory', and for any
+        directories it contains, such as those used by the variants of
+        the test, are removed."""
+
+        prefix = os.path.join(temporary_directory, "")
+        self.__lock.acquire()
+        try:
+            released = []
+            for key, directory in self.__directories.items():
+                if key == temporary_directory or key.startswith(prefix):
+                    del self.__directories[key]
+                    if directory is not None:
+                        self.__Forget(directory)
+                        released.append(directory)
+        finally:
+            self.__lock.release()
+        for directory in released:
+            shutil.rmtree(directory, 1)
+
+
+    def Close(self):
+        """Remove all of the scratch directories."""
+
+        self.__lock.acquire()
+        try:
+            directories = self.__directories.values()
+            self.__directories = {}
+            self.__sizes = {}
+            self.__usage = 0
+            self.__queue = []
+        finally:
+            self.__lock.release()
+        for directory in directories:
+            if directory is not None:
+                shutil.rmtree(directory, 1)
+
+
+    def __Forget(self, directory):
+        """Stop tracking the size of 'directory'.
+
+        'directory' -- A scratch directory that is being removed.  The
+        caller must hold the lock."""
+
+        self.__usage -= self.__sizes[directory]
+        del self.__sizes[directory]
+        self.__queue.remove(directory)
+
+
+    def __Measure(self, directory):
+        """Return the number of bytes used by 'directory'.
+
+        'directory' -- A scratch directory.
+
+        returns -- The total size of the files in 'directory'."""
+
+        usage = 0
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for f in filenames:
+                try:
+                    usage += os.lstat(os.path.join(dirpath, f)).st_size
+                except OSError:
+                    pass
+        return usage
+
+########################################################################
+# Functions
+########################################################################
+
+def get_scratch_space(path, budget):
+    """Return the 'ScratchSpace' for 'path'.
+
+    'path' -- The directory in which scratch directories are created.
+
+    'budget' -- The budget for the scratch directories, in bytes.
+
+    returns -- A 'ScratchSpace'.  The space is created the first time
+    this function is called with a particular 'path' and 'budget', and
+    shared by all later callers.  Any scratch directories that remain
+    are removed when the Python interpreter exits."""
+
+    _spaces_lock.acquire()
+    try:
+        space = _spaces.get((path, budget))
+        if space is None:
+            space = ScratchSpace(path, budget)
+            _spaces[(path, budget)] = space
+            atexit.register(space.Close)
+        return space
+    finally:
+        _spaces_lock.release()
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import unittest
+
+class _ScratchSpaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.space = ScratchSpace(self.directory, 100)
+
+    def tearDown(self):
+        self.space.Close()
+        shutil.rmtree(self.directory, 1)
+
+    def fill(self, directory, size):
+        f = open(os.path.join(directory, "file"), "w")
+        f.write("x" * size)
+        f.close()
+
+    def testGetDirectory(self):
+        a = self.space.GetDirectory("/tmp/a")
+        self.failUnless(os.path.isdir(a))
+        self.failUnlessEqual(self.space.GetDirectory("/tmp/a"), a)
+        self.failUnlessEqual(self.space.Find("/tmp/a"), a)
+        self.failIfEqual(self.space.GetDirectory("/tmp/b"), a)
+
+    def testFind(self):
+        self.failUnless(self.space.Find("/tmp/a") is None)
+        self.failUnlessEqual(os.listdir(self.directory), [])
+
+    def testBudget(self):
+        self.fill(self.space.GetDirectory("/tmp/a"), 60)
+        self.failIf(self.space.GetDirectory("/tmp/b") is None)
+        self.fill(self.space.Find("/tmp/b"), 60)
+        # Each request measures only one directory, so the usage of
+        # the second directory is noticed only by the second request.
+        self.failIf(self.space.GetDirectory("/tmp/c") is None)
+        self.failUnless(self.space.GetDirectory("/tmp/d") is None)
+        self.failUnless(self.space.GetDirectory("/tmp/d") is None)
+        # Releasing the directory makes space available again.
+        self.space.Release("/tmp/a")
+        self.failIf(self.space.GetDirectory("/tmp/e") is None)
+
+    def testRelease(self):
+        a = self.space.GetDirectory("/tmp/a")
+        variant = self.space.GetDirectory("/tmp/a/1")
+        other = self.space.GetDirectory("/tmp/ab")
+        self.space.Release("/tmp/a")
+        self.failIf(os.path.exists(a))
+        self.failIf(os.path.exists(variant))
+        self.failUnless(os.path.isdir(other))
+        self.failUnless(self.space.Find("/tmp/a/1") is None)
+        self.failUnlessEqual(self.space.Find("/tmp/ab"), other)
+
+    def testClose(self):
+        self.space.GetDirectory("/tmp/a")
+        self.space.Close()
+        self.failUnlessEqual(os.listdir(self.directory), [])
+
+unittest.makeSuite(_ScratchSpaceTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,524 @@
+########################################################################
+#
+# File:   source_analysis.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   SourceAnalysis
+#   SourceIndex
+#   analyze_source
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import cPickle
+import os
+from   parallel import map_in_parallel
+import re
+import threading
+try:
+    from hashlib import md5 as _md5
+except ImportError:
+    from md5 import new as _md5
+
+########################################################################
+# Variables
+########################################################################
+
+_analyses = {}
+"""A map from paths to 'SourceAnalysis' objects."""
+
+_analyses_lock = threading.Lock()
+"""The lock protecting '_analyses'."""
+
+########################################################################
+# Classes
+########################################################################
+
+class SourceAnalysis(object):
+    """A 'SourceAnalysis' records the facts about a test source file.
+
+    Several parts of a test need information from its source file:
+    the 'dg-' directives, whether the file contains loops (which
+    determines the options used by torture tests), and the files
+    named in 'dg-additional-sources' directives and the headers
+    included with '#include "..."' (which are part of the fingerprint
+    of the test).  A 'SourceAnalysis' gathers all of this information
+    while reading the file once."""
+
+    __directive_regexp \
+        = re.compile(r"{[ \t]*dg-([-a-z]+)[ \t]+(.*)[ \t]+}")
+    """A regular expression matching a 'dg-' directive.
+
+    The first match group gives the name of the directive, without the
+    'dg-' prefix; the second gives its arguments."""
+
+    __additional_sources_regexp \
+        = re.compile(r"{[ \t]*dg-additional-sources[ \t]+\"?([^\"}]*)\"?"
+                     r"[ \t]*}")
+    """A regular expression matching a 'dg-additional-sources' directive.
+
+    The first match group gives the names of the additional source
+    files, separated by whitespace.  This expression is more lenient
+    than '__directive_regexp', as the directive is often written
+    without a space before the closing brace."""
+
+    __include_regexp = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"([^"]+)"')
+    """A regular expression matching a quoted '#include' directive.
+
+    The first match group gives the name of the included file."""
+
+    __loop_regexp = re.compile(r"(for|while).*\(")
+    """A regular expression matching a line that may contain a loop.
+
+    This expression is equivalent to the 'fnmatch' patterns '*for*(*'
+    and '*while*(*' used by 'gcc-dg-runtest'."""
+
+    def __init__(self, path, record = None):
+        """Construct a new 'SourceAnalysis'.
+
+        'path' -- The path to the source file to analyze.  Raises
+        'IOError' if the file cannot be read.
+
+        'record' -- If not 'None', a value returned by 'GetRecord' for
+        an earlier analysis of the same file.  The analysis is taken
+        from 'record', and the file is not read."""
+
+        if record is not None:
+            (self.__directives, self.__has_loops,
+             self.__additional_sources, self.__includes,
+             self.__digest) = record
+            return
+
+        self.__directives = []
+        self.__has_loops = 0
+        self.__additional_sources = []
+        self.__includes = []
+        digest = _md5()
+        directory = os.path.dirname(path)
+        f = open(path, "rb")
+        try:
+            line_num = 0
+            for l in f.xreadlines():
+                line_num += 1
+                digest.update(l)
+                if not self.__has_loops and self.__loop_regexp.search(l):
+                    self.__has_loops = 1
+                if l.find("include") != -1:
+                    m = self.__include_regexp.match(l)
+                    if m:
+                        self.__includes.append(os.path.join(directory,
+                                                            m.group(1)))
+                if l.find("dg-") == -1:
+                    continue
+                m = self.__directive_regexp.search(l)
+                if m:
+                    self.__directives.append((line_num,
+                                              m.group(1), m.group(2)))
+                for names in self.__additional_sources_regexp.findall(l):
+                    self.__additional_sources \
+                        += [os.path.join(directory, n)
+                            for n in names.split()]
+        finally:
+            f.close()
+        self.__digest = digest.hexdigest()
+
+
+    def GetDirectives(self):
+        """Return the 'dg-' directives in the file.
+
+        returns -- A list of triples '(line_num, command, args)' in the
+        order in which they appear.  The 'command' is the name of the
+        directive without the 'dg-' prefix, and 'args' is the unparsed
+        text of its arguments."""
+
+        return self.__directives
+
+
+    def GetArguments(self, command):
+        """Return the arguments to the first 'command' directive.
+
+        'command' -- The name of a directive, without the 'dg-' prefix.
+
+        returns -- The unparsed text of the arguments to the first
+        directive named 'command', or 'None' if there is no such
+        directive."""
+
+        for line_num, c, args in self.__directives:
+            if c == command:
+                return args
+        return None
+
+
+    def HasDirective(self, command, argument = None):
+        """Return true if the file contains a 'command' directive.
+
+        'command' -- The name of a directive, without the 'dg-' prefix.
+
+        'argument' -- If not 'None', only directives whose first
+        argument is 'argument' are considered.  A brace before the
+        first argument is ignored, so that, for example, 'dg-final'
+        directives containing 'scan-assembler' are found with the
+        'argument' "scan-assembler".
+
+        returns -- True iff there is a matching directive."""
+
+        for line_num, c, args in self.__directives:
+            if c != command:
+                continue
+            if argument is None:
+                return 1
+            words = args.lstrip("{ \t").split()
+            if words and words[0] == argument:
+                return 1
+        return 0
+
+
+    def GetKind(self):
+        """Return the kind of test described by the file.
+
+        returns -- The first argument to the 'dg-do' directive, such as
+        "compile" or "run", or 'None' if there is no 'dg-do'
+        directive, in which case the test class determines the
+        kind."""
+
+        args = self.GetArguments("do")
+        if args is None:
+            return None
+        words = args.split()
+        if not words:
+            return None
+        return words[0]
+
+
+    def HasLoops(self):
+        """Return true if the file may contain loops.
+
+        returns -- True iff some line in the file contains 'for' or
+        'while' followed by an opening parenthesis."""
+
+        return self.__has_loops
+
+
+    def GetAdditionalSources(self):
+        """Return the files named in 'dg-additional-sources' directives.
+
+        returns -- A list of the paths to the files.  The names given
+        in the directives are relative to the directory containing the
+        file analyzed."""
+
+        return self.__additional_sources
+
+
+    def GetIncludes(self):
+        """Return the files included with '#include "..."'.
+
+        returns -- A list of the paths to the files.  The names given
+        in the directives are relative to the directory containing the
+        file analyzed.  The files need not exist, as the compiler may
+        find them elsewhere on the include path."""
+
+        return self.__includes
+
+
+    def GetDigest(self):
+        """Return a digest of the contents of the file.
+
+        returns -- A string giving a hexadecimal digest of the file, as
+        computed by 'fingerprint.hash_file'."""
+
+        return self.__digest
+
+
+    def GetRecord(self):
+        """Return a picklable record of this analysis.
+
+        returns -- A value that can be passed to the constructor to
+        recreate this analysis without reading the file.  The record
+        contains only built-in types, so that it can be stored by a
+        'SourceIndex'."""
+
+        return (self.__directives, self.__has_loops,
+                self.__additional_sources, self.__includes,
+                self.__digest)
+
+
+
+class SourceIndex(object):
+    """A 'SourceIndex' stores the analyses of many source files.
+
+    Analyzing a source file requires reading the whole file.  The GCC
+    testsuite contains tens of thousands of tests, so reading them all
+    to find, for example, the tests containing 'scan-assembler'
+    directives is slow.  A 'SourceIndex' stores the analysis of each
+    file on disk, together with the modification time and size of the
+    file, so that the file need be read again only when it changes.
+
+    A 'SourceIndex' may be used from several threads at once."""
+
+    _version = 2
+    """The version of the index file format.
+
+    This number must be incremented whenever the format of the index,
+    or the information recorded by a 'SourceAnalysis', changes."""
+
+    def __init__(self, path, tag = None):
+        """Construct a new 'SourceIndex'.
+
+        'path' -- The path to the index file.  If 'None', the index is
+        not stored persistently.
+
+        'tag' -- A string identifying the user of the index.  If the
+        tag stored in the index does not match 'tag', the entire index
+        is discarded."""
+
+        self.__path = path
+        self.__tag = (self._version, tag)
+        # A map from paths to records of the form '(stamp, record)'.
+        # The 'stamp' gives the modification time and size of the
+        # file; the 'record' is as returned by
+        # 'SourceAnalysis.GetRecord'.
+        self.__records = {}
+        # A map from paths to pairs '(stamp, analysis)' for the files
+        # whose analyses have been requested during this run.
+        self.__analyses = {}
+        # True if the index has changed since it was last written.
+        self.__dirty = 0
+        self.__lock = threading.Lock()
+
+        self.__Load()
+
+
+    def Get(self, path):
+        """Return the 'SourceAnalysis' for the file at 'path'.
+
+        'path' -- The path to a source file.
+
+        returns -- A 'SourceAnalysis'.  The file is read only if it has
+        changed since it was last indexed.  Raises 'OSError' or
+        'IOError' if the file cannot be read."""
+
+        st = os.stat(path)
+        stamp = (st.st_mtime, st.st_size)
+        self.__lock.acquire()
+        try:
+            entry = self.__analyses.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            entry = self.__records.get(path)
+        finally:
+            self.__lock.release()
+
+        if entry is not None and entry[0] == stamp:
+            analysis = SourceAnalysis(path, entry[1])
+        else:
+            analysis = SourceAnalysis(path)
+        self.__lock.acquire()
+        try:
+            self.__analyses[path] = (stamp, analysis)
+            if entry is None or entry[0] != stamp:
+                self.__records[path] = (stamp, analysis.GetRecord())
+                self.__dirty = 1
+        finally:
+            self.__lock.release()
+        return analysis
+
+
+    def Update(self, paths, workers = 1):
+        """Bring the analyses of 'paths' up to date.
+
+        'paths' -- A sequence of paths to source files.
+
+        'workers' -- The number of threads to use.
+
+        returns -- A list of the 'SourceAnalysis' objects for 'paths',
+        in the same order.  The index is written to disk afterwards."""
+
+        analyses = map_in_parallel(self.Get, paths, workers)
+        self.Save()
+        return analyses
+
+
+    def Save(self):
+        """Write the index to disk, if it has changed.
+
+        Errors writing the index are silently ignored; the index is
+        only an optimization."""
+
+        self.__lock.acquire()
+        try:
+            if not self.__dirty or self.__path is None:
+                return
+            # Write the index to a temporary file first, and then
+            # rename it, so that other processes never see a partial
+            # index.
+            temporary = "%s.%d" % (self.__path, os.getpid())
+            try:
+                f = open(temporary, "wb")
+                try:
+                    cPickle.dump((self.__tag, self.__records), f, 2)
+                finally:
+                    f.close()
+                os.rename(temporary, self.__path)
+                self.__dirty = 0
+            except (IOError, OSError):
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+        finally:
+            self.__lock.release()
+
+
+    def __Load(self):
+        """Read the index from disk."""
+
+        if self.__path is None:
+            return
+        try:
+            f = open(self.__path, "rb")
+            try:
+                tag, records = cPickle.load(f)
+            finally:
+                f.close()
+        except:
+            # If the index does not exist, or is corrupt, start over.
+            return
+        if tag == self.__tag:
+            self.__records = records
+
+########################################################################
+# Functions
+########################################################################
+
+def analyze_source(path):
+    """Return the 'SourceAnalysis' for the file at 'path'.
+
+    'path' -- The path to a source file.
+
+    returns -- A 'SourceAnalysis'.  The analysis is reused as long as
+    the modification time and size of the file do not change.  Raises
+    'OSError' or 'IOError' if the file cannot be read."""
+
+    st = os.stat(path)
+    stamp = (st.st_mtime, st.st_size)
+    _analyses_lock.acquire()
+    try:
+        record = _analyses.get(path)
+    finally:
+        _analyses_lock.release()
+    if record is not None and record[0] == stamp:
+        return record[1]
+
+    analysis = SourceAnalysis(path)
+    _analyses_lock.acquire()
+    try:
+        _analyses[path] = (stamp, analysis)
+    finally:
+        _analyses_lock.release()
+    return analysis
+
+########################################################################
+# PyUnit tests
+########################################################################
+
+import shutil
+import tempfile
+import unittest
+
+class _SourceAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, 1)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        f = open(path, "w")
+        f.write(contents)
+        f.close()
+        return path
+
+    def testAnalysis(self):
+        path = self.write("t.c",
+                          '/* { dg-do run { target *-*-* } } */\n'
+                          '/* { dg-options "-O2" } */\n'
+                          '/* {dg-additional-sources "a.c b.c"} */\n'
+                          '#include "t.h"\n'
+                          '#include <stdio.h>\n'
+                          '/* { dg-final { scan-assembler "foo" } } */\n')
+        analysis = SourceAnalysis(path)
+        self.failUnlessEqual([(l, c) for l, c, a
+                              in analysis.GetDirectives()],
+                             [(1, "do"), (2, "options"), (6, "final")])
+        self.failUnlessEqual(analysis.GetArguments("options"), '"-O2"')
+        self.failUnless(analysis.GetArguments("error") is None)
+        self.failIf(analysis.HasLoops())
+        self.failUnlessEqual(analysis.GetAdditionalSources(),
+                             [os.path.join(self.directory, "a.c"),
+                              os.path.join(self.directory, "b.c")])
+        self.failUnlessEqual(analysis.GetIncludes(),
+                             [os.path.join(self.directory, "t.h")])
+
+    def testLoops(self):
+        path = self.write("t.c", "int main () { while (1); }\n")
+        self.failUnless(SourceAnalysis(path).HasLoops())
+
+    def testAnalyzeSource(self):
+        path = self.write("t.c", "/* { dg-do compile } */\n")
+        analysis = analyze_source(path)
+        self.failUnless(analyze_source(path) is analysis)
+        self.write("t.c", "/* { dg-do assemble } */\n")
+        self.failUnlessEqual(analyze_source(path).GetArguments("do"),
+                             "assemble")
+
+    def testDirectives(self):
+        path = self.write("t.c",
+                          '/* { dg-do run { target *-*-* } } */\n'
+                          '/* { dg-final { scan-assembler "foo" } } */\n')
+        analysis = SourceAnalysis(path)
+        self.failUnlessEqual(analysis.GetKind(), "run")
+        self.failUnless(analysis.HasDirective("do"))
+        self.failUnless(analysis.HasDirective("final", "scan-assembler"))
+        self.failIf(analysis.HasDirective("final", "scan-file"))
+        self.failIf(analysis.HasDirective("options"))
+        copy = SourceAnalysis(path, analysis.GetRecord())
+        self.failUnlessEqual(copy.GetRecord(), analysis.GetRecord())
+        self.failUnless(SourceAnalysis(self.write("u.c", "int x;\n"))
+                        .GetKind() is None)
+
+    def testIndex(self):
+        index_file = os.path.join(self.directory, "index")
+        path = self.write("t.c", "/* { dg-do compile } */\n")
+        os.utime(path, (1000000000, 1000000000))
+        index = SourceIndex(index_file, "tag")
+        self.failUnlessEqual(index.Update([path])[0].GetKind(), "compile")
+        # Change the file without changing its modification time or
+        # size; a new index uses the stored analysis.
+        self.write("t.c", "/* { dg-do link } */   \n")
+        os.utime(path, (1000000000, 1000000000))
+        self.failUnlessEqual(SourceIndex(index_file, "tag").Get(path)
+                             .GetKind(),
+                             "compile")
+        # An index with a different tag is discarded.
+        self.failUnlessEqual(SourceIndex(index_file, "other").Get(path)
+                             .GetKind(),
+                             "link")
+        # A changed file is read again.
+        self.write("t.c", "/* { dg-do run } */\n")
+        self.failUnlessEqual(SourceIndex(index_file, "tag").Get(path)
+                             .GetKind(),
+                             "run")
+
+unittest.makeSuite(_SourceAnalysisTest, "test")
+
+if __name__ == "__main__":
+    unittest.main()
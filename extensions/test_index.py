@@ -0,0 +1,461 @@
+########################################################################
+#
+# File:   test_index.py
+# Author: CodeSourcery
+# Date:   2026-10-17
+#
+# Contents:
+#   TestIndex
+#
+# Copyright (c) 2026 by CodeSourcery, LLC.  All rights reserved.
+#
+########################################################################
+
+########################################################################
+# Imports
+########################################################################
+
+import cPickle
+import os
+from   parallel import map_in_parallel
+import time
+
+########################################################################
+# Classes
+########################################################################
+
+class TestIndex(object):
+    """A 'TestIndex' is a persistent index of the tests in a source tree.
+
+    Enumerating the tests in a large tree requires listing every
+    directory and examining every file in it.  A 'TestIndex' records
+    the results of that work in a file so that it need not be repeated
+    on the next run.
+
+    The index is organized by directory.  For each directory, the index
+    records the modification time of the directory, the tests it
+    contains, and its subdirectories.  Creating, removing, or renaming
+    a file changes the modification time of the containing directory,
+    so a directory whose modification time has not changed need not be
+    listed again.  Therefore, when the index is up to date, enumerating
+    the tests requires only one 'stat' per directory.
+
+    Some file systems record modification times only to the nearest
+    second or two, so a file created just after a directory was listed
+    may leave its modification time unchanged.  A directory modified
+    that recently when it is listed is therefore listed again on the
+    next run, as are its contents.
+
+    Each test in the index is associated with a description provided
+    by the database; typically the description gives the test class
+    and resources.  The description is stored in the index so that
+    descriptors can be created without recomputing it."""
+
+    _version = 1
+    """The version of the index file format.
+
+    This number must be incremented whenever the format of the index
+    changes."""
+
+    _mtime_granularity = 2
+    """The coarsest granularity, in seconds, of modification times.
+
+    A directory whose modification time is less than this many
+    seconds before the time at which it is listed may change again
+    without its modification time changing."""
+
+    def __init__(self, root, path, is_test, describe, tag = None,
+                 workers = 1):
+        """Construct a new 'TestIndex'.
+
+        'root' -- The path to the root of the source tree.
+
+        'path' -- The path to the index file.  If 'None', the index is
+        not stored persistently.
+
+        'is_test' -- A callable that takes the path to a file and
+        returns true iff the file is a test.
+
+        'describe' -- A callable that takes a test identifier and the
+        path to the test and returns the description to store for the
+        test.  The description must be picklable.
+
+        'tag' -- A string identifying the configuration of the
+        database.  If the tag stored in the index does not match
+        'tag', the entire index is discarded.  Databases should ensure
+        that the tag changes whenever 'is_test' or 'describe' would
+        give different answers.
+
+        'workers' -- The number of threads to use when scanning
+        several subdirectories.  On a networked file system, where
+        each directory listing requires a round trip to the server,
+        scanning the subdirectories concurrently hides much of the
+        latency.  The 'is_test' and 'describe' callables must be
+        thread-safe if 'workers' is greater than one."""
+
+        self.__root = root
+        self.__path = path
+        self.__is_test = is_test
+        self.__describe = describe
+        self.__workers = workers
+        self.__tag = (self._version, root, tag)
+        # A map from relative directory names to records of the form
+        # '(mtime, entries)'.  Each of the 'entries' is a tuple of the
+        # form '(name, is_directory, description)'.  The 'description'
+        # is 'None' if the entry is not a test.  The 'mtime' is 'None'
+        # if the directory was listed too soon after it was modified
+        # for the record to be trusted.
+        self.__directories = {}
+        # The directories whose records have been checked against the
+        # file system during this run.
+        self.__validated = {}
+        # Maps from relative directory names to dictionaries mapping
+        # entry names to entries.
+        self.__entry_maps = {}
+        # True if the index has changed since it was last written.
+        self.__dirty = 0
+
+        self.__Load()
+
+
+    def GetTestIds(self, directory = "", scan_subdirs = 1):
+        """Return the tests in 'directory'.
+
+        'directory' -- The path to a directory, relative to the root of
+        the tree.
+
+        'scan_subdirs' -- If true, tests in subdirectories are
+        included.
+
+        returns -- A list of test identifiers, in the same order that
+        'FileDatabase' would return them."""
+
+        return self.__GetLabels(directory, scan_subdirs, 0,
+                                self.__workers)
+
+
+    def GetSuiteIds(self, directory = "", scan_subdirs = 1):
+        """Return the subdirectories of 'directory'.
+
+        'directory' -- The path to a directory, relative to the root of
+        the tree.
+
+        'scan_subdirs' -- If true, subdirectories of subdirectories are
+        included.
+
+        returns -- A list of suite identifiers, in the same order that
+        'FileDatabase' would return them."""
+
+        return self.__GetLabels(directory, scan_subdirs, 1,
+                                self.__workers)
+
+
+    def Prefetch(self, directories):
+        """Bring the index up to date for the given 'directories'.
+
+        'directories' -- A sequence of paths to directories, relative
+        to the root of the tree.  These directories, and all of their
+        subdirectories, are brought up to date.  The subdirectories
+        are scanned concurrently."""
+
+        self.__Update(directories, self.__workers)
+
+
+    def GetTest(self, test_id):
+        """Return the description of 'test_id'.
+
+        'test_id' -- The test identifier, which is also the path to the
+        test, relative to the root of the tree.
+
+        returns -- The description provided by the database when the
+        test was indexed, or 'None' if there is no such test."""
+
+        entry = self.__GetEntry(test_id)
+        if entry is None:
+            return None
+        return entry[2]
+
+
+    def IsDirectory(self, path):
+        """Return true if 'path' is a directory.
+
+        'path' -- A path, relative to the root of the tree.
+
+        returns -- True iff 'path' is a directory.  Rather than
+        examining 'path' itself, this method consults the index entry
+        for the parent directory of 'path'."""
+
+        if not path:
+            return 1
+        entry = self.__GetEntry(path)
+        if entry is None:
+            return 0
+        return entry[1]
+
+
+    def Save(self):
+        """Write the index to disk, if it has changed.
+
+        Errors writing the index are silently ignored; the index is
+        only an optimization."""
+
+        if not self.__dirty or self.__path is None:
+            return
+
+        # Write the index to a temporary file first, and then rename
+        # it, so that other processes never see a partial index.
+        temporary = "%s.%d" % (self.__path, os.getpid())
+        try:
+            f = open(temporary, "wb")
+            try:
+                cPickle.dump((self.__tag, self.__directories), f, 2)
+            finally:
+                f.close()
+            os.rename(temporary, self.__path)
+            self.__dirty = 0
+        except (IOError, OSError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+
+    def __Load(self):
+        """Read the index from disk."""
+
+        if self.__path is None:
+            return
+        try:
+            f = open(self.__path, "rb")
+            try:
+                tag, directories = cPickle.load(f)
+            finally:
+                f.close()
+        except:
+            # If the index does not exist, or is corrupt, start over.
+            return
+        if tag == self.__tag:
+            self.__directories = directories
+
+
+    def __GetLabels(self, directory, scan_subdirs, suites, workers):
+        """Return the tests or suites in 'directory'.
+
+        'directory' -- The path to a directory, relative to the root of
+        the tree.
+
+        'scan_subdirs' -- If true, subdirectories are searched
+        recursively.
+
+        'suites' -- If true, return suites; otherwise return tests.
+
+        'workers' -- The number of threads to use to search the
+        subdirectories of 'directory'.
+
+        returns -- A list of labels."""
+
+        if scan_subdirs:
+            self.__Update([directory], workers)
+        record = self.__GetDirectory(directory)
+        if record is None:
+            return []
+        return self.__CollectLabels(directory, record, scan_subdirs, suites)
+
+
+    def __CollectLabels(self, directory, record, scan_subdirs, suites):
+        """Return the tests or suites in 'directory'.
+
+        'directory' -- The path to a directory, relative to the root of
+        the tree.
+
+        'record' -- The record for 'directory'.
+
+        'scan_subdirs' -- If true, subdirectories are searched
+        recursively.
+
+        'suites' -- If true, return suites; otherwise return tests.
+
+        returns -- A list of labels, in the same order that
+        'FileDatabase' would return them."""
+
+        labels = []
+        for name, is_directory, description in record[1]:
+            label = self.__Join(directory, name)
+            if suites:
+                if is_directory:
+                    labels.append(label)
+            elif description is not None:
+                labels.append(label)
+            if scan_subdirs and is_directory:
+                subrecord = self.__GetDirectory(label)
+                if subrecord is not None:
+                    labels.extend(self.__CollectLabels(label, subrecord,
+                                                       scan_subdirs,
+                                                       suites))
+        return labels
+
+
+    def __Update(self, directories, workers):
+        """Bring 'directories' and their subdirectories up to date.
+
+        'directories' -- A sequence of paths to directories, relative to
+        the root of the tree.
+
+        'workers' -- The number of threads to use.
+
+        The tree is searched one level at a time.  The directories at
+        each level are examined concurrently by '__Examine', which does
+        not modify the index; the results are then merged into the
+        index by the calling thread."""
+
+        level = [d for d in directories
+                 if not self.__validated.has_key(d)]
+        while level:
+            records = map_in_parallel(self.__Examine, level, workers)
+            next_level = []
+            for directory, record in zip(level, records):
+                record = self.__Apply(directory, record)
+                if record is None:
+                    continue
+                for name, is_directory, description in record[1]:
+                    subdirectory = self.__Join(directory, name)
+                    if (is_directory
+                        and not self.__validated.has_key(subdirectory)):
+                        next_level.append(subdirectory)
+            level = next_level
+
+
+    def __GetEntry(self, path):
+        """Return the entry for 'path'.
+
+        'path' -- A path relative to the root of the tree.
+
+        returns -- The entry for 'path' in its parent directory, or
+        'None' if there is no such entry."""
+
+        directory, name = os.path.split(path)
+        if self.__GetDirectory(directory) is None:
+            return None
+        entry_map = self.__entry_maps.get(directory)
+        if entry_map is None:
+            entry_map = {}
+            for entry in self.__directories[directory][1]:
+                entry_map[entry[0]] = entry
+            self.__entry_maps[directory] = entry_map
+        return entry_map.get(name)
+
+
+    def __GetDirectory(self, directory):
+        """Return the record for 'directory', updating it if necessary.
+
+        'directory' -- A path relative to the root of the tree.
+
+        returns -- The record for 'directory', or 'None' if 'directory'
+        does not exist."""
+
+        if self.__validated.has_key(directory):
+            return self.__directories.get(directory)
+        return self.__Apply(directory, self.__Examine(directory))
+
+
+    def __Examine(self, directory):
+        """Return the current record for 'directory'.
+
+        'directory' -- A path relative to the root of the tree.
+
+        returns -- The record for 'directory', listing the directory
+        again if its modification time has changed, or 'None' if
+        'directory' does not exist.  This method does not modify the
+        index, so it may be called from several threads at once."""
+
+        path = os.path.join(self.__root, directory)
+        now = time.time()
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        if not os.path.isdir(path):
+            return None
+        record = self.__directories.get(directory)
+        if record is not None and record[0] == mtime:
+            return record
+
+        entries = []
+        names = os.listdir(path)
+        names.sort()
+        for name in names:
+            entry_path = os.path.join(path, name)
+            is_directory = os.path.isdir(entry_path)
+            if self.__is_test(entry_path):
+                description = self.__describe(self.__Join(directory, name),
+                                              entry_path)
+            else:
+                description = None
+            if is_directory or description is not None:
+                entries.append((name, is_directory, description))
+        if now - mtime < self._mtime_granularity:
+            # A file created after the directory was listed might not
+            # change its modification time, so the record must be
+            # checked again next time.
+            mtime = None
+        return (mtime, entries)
+
+
+    def __Apply(self, directory, record):
+        """Store the 'record' for 'directory' in the index.
+
+        'directory' -- A path relative to the root of the tree.
+
+        'record' -- The record returned by '__Examine' for 'directory'.
+
+        returns -- The 'record'."""
+
+        old_record = self.__directories.get(directory)
+        if record is None:
+            if old_record is not None:
+                self.__Forget(directory)
+        elif record is not old_record:
+            # Discard records for subdirectories that no longer exist.
+            if old_record is not None:
+                subdirectories = {}
+                for name, is_directory, description in record[1]:
+                    if is_directory:
+                        subdirectories[name] = 1
+                for name, is_directory, description in old_record[1]:
+                    if is_directory and not subdirectories.has_key(name):
+                        self.__Forget(self.__Join(directory, name))
+            self.__directories[directory] = record
+            if self.__entry_maps.has_key(directory):
+                del self.__entry_maps[directory]
+            self.__dirty = 1
+        self.__validated[directory] = 1
+        return record
+
+
+    def __Forget(self, directory):
+        """Remove 'directory' and its subdirectories from the index.
+
+        'directory' -- A path relative to the root of the tree."""
+
+        prefix = directory + os.sep
+        for d in self.__directories.keys():
+            if d == directory or d.startswith(prefix):
+                del self.__directories[d]
+                if self.__entry_maps.has_key(d):
+                    del self.__entry_maps[d]
+        self.__dirty = 1
+
+
+    def __Join(self, directory, name):
+        """Return the path to 'name' in 'directory'.
+
+        'directory' -- A path relative to the root of the tree, or the
+        empty string to indicate the root itself.
+
+        'name' -- The name of an entry in 'directory'.
+
+        returns -- The path to 'name', relative to the root."""
+
+        if directory:
+            return os.path.join(directory, name)
+        return name
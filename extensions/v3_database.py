@@ -23,6 +23,8 @@ from   qm.attachment import Attachment, FileAttachmentStore
 from   qm.test.database import ResourceDescriptor, TestDescriptor
 from   qm.test.file_database import FileDatabase
 from   qm.test.runnable import Runnable
+from   fingerprint import hash_strings, source_fingerprint
+from   parallel import map_in_parallel
 
 ########################################################################
 # Classes
@@ -38,6 +40,41 @@ class V3Database(FileDatabase):
             description ="""The root of the libstdc++-v3 test source directory.
 
             This directory is the one named 'testsuite'."""),
+        qm.fields.TextField(
+            name = "outdir",
+            title = "Build Directory",
+            description ="""The libstdc++-v3 testsuite build directory.
+
+            If this directory contains a 'testsuite_files' manifest,
+            as created by 'scripts/create_testsuite_files', that
+            manifest is used to determine which tests are present.
+            Otherwise, tests whose names contain 'wchar_t' are omitted
+            unless the file 'testsuite_wchar_t' is present in this
+            directory.  If this field is empty, all of the tests are
+            included."""),
+        qm.fields.TextField(
+            name = "manifest_file",
+            title = "Manifest File",
+            description ="""The file in which the list of tests is stored.
+
+            The first time the database is used, the source directory
+            is searched for tests, and the results are stored in this
+            file, together with the modification times of the
+            directories searched.  Later runs read the list of tests
+            from this file, unless one of those directories has
+            changed, in which case the source directory is searched
+            again.  If this field is empty, the manifest is stored in
+            the 'QMTest' subdirectory of the database."""),
+        qm.fields.IntegerField(
+            name = "scan_threads",
+            title = "Scan Threads",
+            description ="""The number of threads used to scan directories.
+
+            When the manifest is created, the subdirectories of the
+            source directory are scanned concurrently using up to this
+            many threads.  Using several threads is most helpful when
+            the source directory is on a networked file system.""",
+            default_value = 1),
         # The libstdc++ database uses filenames as labels.
         qm.fields.TextField(
             name = "label_class",
@@ -58,6 +95,15 @@ class V3Database(FileDatabase):
         super(V3Database, self).__init__(path, arguments)
         # Create an attachment store.
         self.__store = FileAttachmentStore()
+        self.__manifest_file = self.manifest_file
+        if not self.__manifest_file:
+            self.__manifest_file = os.path.join(path, "QMTest",
+                                                "testsuite_files")
+        # The manifest is not read until it is needed.
+        self.__test_ids = None
+        self.__test_map = None
+        self.__suite_ids = None
+        self.__suite_map = None
 
         
     def GetResource(self, resource_id):
@@ -87,12 +133,35 @@ class V3Database(FileDatabase):
 
     def GetTestIds(self, directory="", scan_subdirs=1):
 
-        result = super(V3Database, self).GetTestIds(directory,
-                                                    scan_subdirs)
+        test_ids = self.__GetManifest()[0]
+        if directory:
+            prefix = directory + os.sep
+            test_ids = [t for t in test_ids if t.startswith(prefix)]
+        else:
+            prefix = ""
+        if not scan_subdirs:
+            test_ids = [t for t in test_ids
+                        if t.find(os.sep, len(prefix)) == -1]
         if directory == "":
-            return result + ["v3_abi_test"]
+            return test_ids + ["v3_abi_test"]
+        else:
+            return test_ids
+
+
+    def GetSuiteIds(self, directory="", scan_subdirs=1):
+
+        # The suites are the directories containing the tests in the
+        # manifest, so that the suites and tests are always consistent.
+        suite_ids = self.__GetSuiteIds()
+        if directory:
+            prefix = directory + os.sep
+            suite_ids = [s for s in suite_ids if s.startswith(prefix)]
         else:
-            return result
+            prefix = ""
+        if not scan_subdirs:
+            suite_ids = [s for s in suite_ids
+                         if s.find(os.sep, len(prefix)) == -1]
+        return suite_ids
 
 
     def GetTest(self, test_id):
@@ -106,6 +175,275 @@ class V3Database(FileDatabase):
             return super(V3Database, self).GetTest(test_id)
         
 
+    def GetTestFingerprint(self, test_id):
+        """Return a fingerprint of the files used by 'test_id'.
+
+        'test_id' -- The name of a test.
+
+        returns -- A string that changes whenever the source for the
+        test, any file named in one of its 'dg-additional-sources'
+        directives, or any header that it includes from its own
+        directory, changes.  The library under test is covered by
+        'V3DGTest', not by this fingerprint.  Returns 'None' for
+        'v3_abi_test', which depends on the library under test rather
+        than on any source file."""
+
+        if test_id == "v3_abi_test":
+            return None
+        path = os.path.join(self.GetRoot(), test_id)
+        return hash_strings(["v3_test.V3DGTest", source_fingerprint(path)])
+
+
+    def __GetManifest(self):
+        """Return the tests listed in the manifest.
+
+        returns -- A pair '(test_ids, test_map)'.  The 'test_ids' are
+        the test names, in the order in which a search of the source
+        directory would find them.  The 'test_map' is a dictionary
+        whose keys are the 'test_ids'.
+
+        If the 'outdir' contains a 'testsuite_files' manifest, the tests
+        are read from that file.  Otherwise, the manifest stored with
+        the database is used, after creating it if necessary.  The
+        stored manifest is created again if any of the directories
+        searched to create it has changed since."""
+
+        if self.__test_ids is not None:
+            return self.__test_ids, self.__test_map
+
+        test_ids = None
+        if self.outdir:
+            test_ids = self.__ReadManifest(os.path.join(self.outdir,
+                                                        "testsuite_files"),
+                                           None)
+        if test_ids is None:
+            header = self.__GetManifestHeader()
+            test_ids = self.__ReadManifest(self.__manifest_file, header)
+            if test_ids is None:
+                test_ids, stamps = self.__ScanTests()
+                self.__WriteManifest(self.__manifest_file, header, stamps,
+                                     test_ids)
+
+        # The manifest written by 'create_testsuite_files' is in the
+        # order produced by 'find', which is unspecified.  Put the tests
+        # in the same order that 'FileDatabase' would.
+        decorated = [(t.split(os.sep), t) for t in test_ids]
+        decorated.sort()
+        self.__test_ids = [t for components, t in decorated]
+        self.__test_map = {}
+        for t in self.__test_ids:
+            self.__test_map[t] = None
+        return self.__test_ids, self.__test_map
+
+
+    def __GetSuiteIds(self):
+        """Return the suites containing the tests in the manifest.
+
+        returns -- A list of the directories, relative to the source
+        directory, that contain tests listed in the manifest, either
+        directly or in subdirectories, in the order in which a search
+        of the source directory would find them."""
+
+        if self.__suite_ids is not None:
+            return self.__suite_ids
+
+        suites = {}
+        for test_id in self.__GetManifest()[0]:
+            directory = os.path.dirname(test_id)
+            while directory and not suites.has_key(directory):
+                suites[directory] = None
+                directory = os.path.dirname(directory)
+        decorated = [(s.split(os.sep), s) for s in suites.keys()]
+        decorated.sort()
+        self.__suite_ids = [s for components, s in decorated]
+        self.__suite_map = suites
+        return self.__suite_ids
+
+
+    def __GetManifestHeader(self):
+        """Return the header for the manifest stored with the database.
+
+        returns -- A list of strings.  If the header stored in the
+        manifest does not match, the manifest is out of date."""
+
+        return ["# format: 2",
+                "# srcdir: " + self.GetRoot(),
+                "# wchar_t: %d" % self.__HaveWcharT()]
+
+
+    def __HaveWcharT(self):
+        """Return true if tests requiring 'wchar_t' should be run.
+
+        returns -- True unless the 'outdir' is known and does not
+        contain the 'testsuite_wchar_t' marker file."""
+
+        if not self.outdir:
+            return 1
+        return os.path.exists(os.path.join(self.outdir,
+                                           "testsuite_wchar_t"))
+
+
+    def __ReadManifest(self, path, header):
+        """Read the manifest in 'path'.
+
+        'path' -- The path to a manifest file.  The manifest contains
+        one test per line, given as a path relative to the source
+        directory.  Lines beginning with '#@' give the modification
+        time of a directory that was searched to create the manifest,
+        followed by the path to the directory.  Other lines beginning
+        with '#' form the header.
+
+        'header' -- The header that the manifest must have, or 'None'
+        if the header is not checked.
+
+        returns -- A list of test names, or 'None' if the manifest does
+        not exist, does not have the expected 'header', or if any of
+        the directories it records has changed."""
+
+        try:
+            f = open(path)
+            try:
+                lines = f.readlines()
+            finally:
+                f.close()
+        except IOError:
+            return None
+
+        test_ids = []
+        manifest_header = []
+        stamps = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith("#@"):
+                stamps.append(line[2:].strip().split(" ", 1))
+            elif line.startswith("#"):
+                manifest_header.append(line)
+            elif line:
+                if line.startswith("./"):
+                    line = line[2:]
+                test_ids.append(line.replace("/", os.sep))
+        if header is not None and manifest_header != header:
+            return None
+        # Adding or removing a file changes the modification time of
+        # the directory containing it.
+        root = self.GetRoot()
+        for stamp in stamps:
+            if len(stamp) == 1:
+                stamp.append("")
+            mtime, directory = stamp
+            try:
+                current = os.stat(os.path.join(root,
+                                               directory.replace("/",
+                                                                 os.sep)))
+            except OSError:
+                return None
+            if repr(current.st_mtime) != mtime:
+                return None
+        return test_ids
+
+
+    def __WriteManifest(self, path, header, stamps, test_ids):
+        """Write the manifest in 'path'.
+
+        'path' -- The path to the manifest file.
+
+        'header' -- A list of header lines.
+
+        'stamps' -- A list of pairs '(directory, mtime)' giving the
+        directories searched and their modification times.
+
+        'test_ids' -- The test names to record.
+
+        Errors writing the manifest are silently ignored; the manifest
+        is only an optimization."""
+
+        # Write the manifest to a temporary file first, and then rename
+        # it, so that other processes never see a partial manifest.
+        temporary = "%s.%d" % (path, os.getpid())
+        try:
+            f = open(temporary, "w")
+            try:
+                for line in header:
+                    f.write(line + "\n")
+                for directory, mtime in stamps:
+                    f.write("#@ %r %s\n"
+                            % (mtime, directory.replace(os.sep, "/")))
+                for t in test_ids:
+                    f.write(t.replace(os.sep, "/") + "\n")
+            finally:
+                f.close()
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+
+    def __ScanTests(self):
+        """Search the source directory for tests.
+
+        returns -- A pair '(test_ids, stamps)'.  The 'test_ids' are the
+        names of the tests.  The 'stamps' are pairs '(directory,
+        mtime)' giving each directory searched and its modification
+        time.  The subdirectories of the source directory are scanned
+        concurrently, using up to 'scan_threads' threads."""
+
+        root = self.GetRoot()
+        # The modification time is determined before the directory is
+        # listed, so that a change made while the directory is being
+        # listed is detected by the next run.
+        stamps = [("", os.stat(root).st_mtime)]
+        names = os.listdir(root)
+        names.sort()
+        directories = [n for n in names
+                       if os.path.isdir(os.path.join(root, n))]
+        results = map_in_parallel(self.__ScanDirectory, directories,
+                                  self.scan_threads)
+        test_ids = []
+        for directory_test_ids, directory_stamps in results:
+            test_ids += directory_test_ids
+            stamps += directory_stamps
+        return test_ids, stamps
+
+
+    def __ScanDirectory(self, directory):
+        """Search 'directory' for tests.
+
+        'directory' -- A subdirectory of the source directory.
+
+        returns -- A pair '(test_ids, stamps)', as for '__ScanTests',
+        for 'directory' and its subdirectories.
+
+        This function emulates scripts/create_testsuite_files."""
+
+        forbidden_substrings = ["_xin", "performance"]
+        if not self.__HaveWcharT():
+            forbidden_substrings.append("wchar_t")
+
+        root = self.GetRoot()
+        test_ids = []
+        stamps = []
+        pending = [directory]
+        while pending:
+            rel_dir = pending.pop()
+            path = os.path.join(root, rel_dir)
+            stamps.append((rel_dir, os.stat(path).st_mtime))
+            for name in os.listdir(path):
+                rel_path = os.path.join(rel_dir, name)
+                if os.path.isdir(os.path.join(path, name)):
+                    pending.append(rel_path)
+                    continue
+                if not name.endswith(".cc"):
+                    continue
+                for f in forbidden_substrings:
+                    if rel_path.find(f) != -1:
+                        break
+                else:
+                    test_ids.append(rel_path)
+        return test_ids, stamps
+
+
     def _GetTestFromPath(self, test_id, path):
 
         # Construct the attachment representing the primary source
@@ -135,30 +473,18 @@ class V3Database(FileDatabase):
         
     def _IsSuiteFile(self, path):
 
-        # All directories are suites.
-        return os.path.isdir(path)
+        # The suites are the root directory and the directories
+        # containing tests.
+        rel_path = path[len(self.GetRoot()) + 1:]
+        if not rel_path:
+            return os.path.isdir(path)
+        self.__GetSuiteIds()
+        return self.__suite_map.has_key(rel_path)
 
         
     def _IsTestFile(self, path):
-        """This function emulates scripts/create_testsuite_files."""
 
         assert path.startswith(self.GetRoot() + os.sep)
 
         rel_path = path[len(self.GetRoot()) + 1:]
-        if os.sep not in rel_path:
-            return False
-
-        if not rel_path.endswith(".cc"):
-            return False
-
-        forbidden_substrings = ["_xin", "performance"]
-        # FIXME: create_testsuite_files checks to see if wchar_t support
-        # is enabled (by checking for the existence of
-        # $outdir/testsuite_wchar_t), and if it isn't, then "wchar_t" is
-        # added to the forbidden list.  The right way to handle this in
-        # QMTest is not obvious, so for now we ignore this.
-        for f in forbidden_substrings:
-            if rel_path.find(f) != -1:
-                return False
-
-        return True
+        return self.__GetManifest()[1].has_key(rel_path)
@@ -30,6 +30,8 @@ from dejagnu_base import DejaGNUBase
 from qm.test.result import Result
 from gcc_test_base import GCCTestBase
 from compiler import CompilerExecutable
+from result_cache import get_command_output
+from fingerprint import tree_fingerprint
 
 ########################################################################
 # Classes
@@ -55,6 +57,19 @@ class V3Base(object):
         return qm.parse_boolean(context["V3Test.have_compiler"])
 
 
+    def _GetProbeCacheDirectory(self, context):
+        """Returns the directory in which compiler answers are cached.
+
+        'context' -- The 'Context' in which the test is running.
+
+        returns -- The path to the directory, or 'None' if answers are
+        not cached."""
+
+        if context.has_key(GCCTestBase._probe_cache_context_property):
+            return context[GCCTestBase._probe_cache_context_property]
+        return None
+
+
 
 class V3Init(Resource, V3Base):
     """All V3 tests depend on one of these for setup."""
@@ -105,11 +120,12 @@ class V3Init(Resource, V3Base):
             # Find blddir and outdir, and make outdir available to later
             # tests.
             options = compiler.GetOptions()
-            compiler_executable = CompilerExecutable()
-            compiler_executable.Run([compiler.GetPath()]
-                                    + options
-                                    + ['--print-multi-dir'])
-            directory = compiler_executable.stdout[:-1]
+            output = get_command_output(CompilerExecutable(),
+                                        [compiler.GetPath()]
+                                        + options
+                                        + ['--print-multi-dir'],
+                                        self._GetProbeCacheDirectory(context))
+            directory = output[:-1]
             
             for o in options:
                 if o.startswith("-B"):
@@ -229,10 +245,12 @@ class V3Init(Resource, V3Base):
             gccdir = os.path.join(objdir, "gcc")
             libpaths.append(gccdir)
             command = compiler.GetPath()
-            compiler_executable.Run([compiler.GetPath()]
-                                    + options
-                                    + ["--print-multi-lib"])
-            for line in compiler_executable.stdout.split():
+            output = get_command_output(CompilerExecutable(),
+                                        [compiler.GetPath()]
+                                        + options
+                                        + ["--print-multi-lib"],
+                                        self._GetProbeCacheDirectory(context))
+            for line in output.split():
                 dir, args = line.split(";", 1)
                 if dir == ".":
                     continue
@@ -353,21 +371,27 @@ class V3Init(Resource, V3Base):
 
         result["V3Test.testsuite_flags_command"] = result.Quote(command)
 
-        executable = RedirectedExecutable()
-        executable.Run([command, "--cxxflags"])
-        basic_flags += executable.stdout.split()
-        executable.Run([command, "--build-includes"])
-        basic_flags += executable.stdout.split()
+        cache_directory = self._GetProbeCacheDirectory(context)
+        output = get_command_output(RedirectedExecutable(),
+                                    [command, "--cxxflags"],
+                                    cache_directory)
+        basic_flags += output.split()
+        output = get_command_output(RedirectedExecutable(),
+                                    [command, "--build-includes"],
+                                    cache_directory)
+        basic_flags += output.split()
 
         # 'normal.exp' checks for the existence of 'testsuite_flags' and
         # pretends the output is "" if it doesn't exist; we simply
         # assume it always exists.
-        executable.Run([command, "--cxxpchflags"])
-        if executable.stdout.find("sage:") != -1:
+        output = get_command_output(RedirectedExecutable(),
+                                    [command, "--cxxpchflags"],
+                                    cache_directory)
+        if output.find("sage:") != -1:
             # This 'testsuite_flags' does not support --cxxpchflags.
             pass
         else:
-            default_flags += executable.stdout.split()
+            default_flags += output.split()
 
         return (basic_flags, default_flags)
 
@@ -395,21 +419,81 @@ class V3DGTest(DGTest, GCCTestBase, V3Base):
 
     _libdir_context_property = "V3Test.libpaths"
 
+    __function_sections_regexp \
+        = re.compile(r"(^|\n)[^\n]*: -ffunction-sections may affect "
+                     r"debugging on some targets[^\n]")
+    """A regular expression matching a Cygwin warning about
+    '-ffunction-sections'."""
+
+    __in_function_regexp = re.compile(r"(^|\n)[^\n]*: In function [^\n]*")
+    """A regular expression matching the part of a warning that names
+    the function containing the problem."""
+
     def Run(self, context, result):
 
-        self._SetUp(context)
+        if self._IsUnchanged(context, result):
+            return
 
-        if context.has_key("V3Test.compiler_output_dir"):
-            # When using a special output directory, we always save the
-            # executables.
-            keep_output = 1
-        else:
-            keep_output = 0
-        self._RunDGTest(context["V3Test.basic_cxx_flags"],
-                        context["V3Test.default_cxx_flags"],
-                        context,
-                        result,
-                        keep_output=keep_output)
+        try:
+            self._SetUp(context)
+
+            if context.has_key("V3Test.compiler_output_dir"):
+                # When using a special output directory, we always save
+                # the executables.
+                keep_output = 1
+            else:
+                keep_output = 0
+            self._RunDGTest(context["V3Test.basic_cxx_flags"],
+                            context["V3Test.default_cxx_flags"],
+                            context,
+                            result,
+                            keep_output=keep_output)
+            self._RecordStatistics(result)
+            self._RecordFingerprint(context, result)
+        finally:
+            self._ReleaseScratchDirectory(context)
+
+
+    def _GetFingerprintOptions(self, context):
+
+        flags = (context["V3Test.basic_cxx_flags"]
+                 + context["V3Test.default_cxx_flags"])
+        return (GCCTestBase._GetFingerprintOptions(self, context)
+                + flags
+                + [self.__GetLibraryFingerprint(context, flags)])
+
+
+    def __GetLibraryFingerprint(self, context, flags):
+        """Return a fingerprint of the library under test.
+
+        'context' -- The 'Context' in which the test is running.
+
+        'flags' -- The options used to compile the tests.
+
+        returns -- A digest of the libraries in the 'V3Test.libpaths'
+        directories, of the headers in the directories named with '-I'
+        or '-isystem' in 'flags', and of the testsuite support files in
+        'testsuite/util'.  The tests in the testsuite directory itself
+        are not included; each test covers its own source files."""
+
+        srcdir = os.path.normpath(self.GetDatabase().GetRoot())
+        paths = []
+        for d in context["V3Test.libpaths"]:
+            libraries = (glob.glob(os.path.join(d, "lib*.so*"))
+                         + glob.glob(os.path.join(d, "lib*.a")))
+            libraries.sort()
+            paths += libraries
+        for i in xrange(len(flags)):
+            if flags[i] == "-isystem" and i + 1 < len(flags):
+                d = flags[i + 1]
+            elif flags[i].startswith("-I") and len(flags[i]) > 2:
+                d = flags[i][2:]
+            else:
+                continue
+            if os.path.normpath(d) != srcdir:
+                paths.append(d)
+        paths.append(os.path.join(srcdir, "util"))
+        return tree_fingerprint(paths)
         
 
     def _PruneOutput(self, output):
@@ -417,10 +501,8 @@ class V3DGTest(DGTest, GCCTestBase, V3Base):
 
         # Prune out Cygwin warnings and parts of warnings that refer to
         # location of previous definitions etc.
-        output = re.sub(r"(^|\n)[^\n]*: -ffunction-sections may affect "
-                        r"debugging on some targets[^\n]",
-                        "", output)
-        output = re.sub(r"(^|\n)[^\n]*: In function [^\n]*", "", output)
+        output = self.__function_sections_regexp.sub("", output)
+        output = self.__in_function_regexp.sub("", output)
         return output
 
 
@@ -502,7 +584,13 @@ class V3DGTest(DGTest, GCCTestBase, V3Base):
             base = path[len(srcdir):]
             base = base.replace("/", "_")
         else:
-            dir = context.GetTemporaryDirectory()
+            # Executables are kept in the temporary directory, since
+            # the scratch directory may be on a file system that does
+            # not permit running programs.
+            if kind in (DGTest.KIND_LINK, DGTest.KIND_RUN):
+                dir = context.GetTemporaryDirectory()
+            else:
+                dir = self._GetScratchDirectory(context)
             base = os.path.basename(path)
 
         if kind != self.KIND_PRECOMPILE: